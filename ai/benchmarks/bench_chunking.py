@@ -0,0 +1,88 @@
+"""
+Benchmark for the chunking strategies.
+
+For a prose policy document and a CSV expense export, reports chunking
+throughput, chunks per document, chunk sizes in characters and model tokens,
+and the share of chunks longer than the embedding model's token limit (which
+the model silently truncates).
+
+Usage:
+    python benchmarks/bench_chunking.py --paragraphs 2000 --rows 20000
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import vector_db
+from chunking import load_tokenizer
+
+
+def make_policy(paragraphs: int) -> bytes:
+    """Builds a travel-policy-like text document with paragraphs of varying length."""
+    sentences = [
+        "Hotel stays are reimbursed up to 5000 INR per night in metro cities.",
+        "Meals are capped at 800 INR per day unless a client is present.",
+        "Invoices must include the GSTIN of the vendor and the invoice number, e.g. INV-2024-00042.",
+        "Taxi fares above 1,200.50 INR need a receipt and the trip ID.",
+        "Claims older than 30 days are escalated to the finance team for review.",
+    ]
+    text = []
+    for i in range(paragraphs):
+        text.append(" ".join(sentences[(i + j) % len(sentences)] for j in range(1 + i % 7)))
+    return "\n\n".join(text).encode("utf-8")
+
+
+def make_csv(rows: int) -> bytes:
+    """Builds an expense-export-like CSV."""
+    df = pd.DataFrame({
+        "date": [f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}" for i in range(rows)],
+        "vendor": [f"Vendor {i % 97}" for i in range(rows)],
+        "category": [("hotel", "meals", "taxi", "flight")[i % 4] for i in range(rows)],
+        "amount_inr": [round(100 + (i * 37) % 9000 + 0.5, 2) for i in range(rows)],
+        "invoice": [f"INV-{i:06d}" for i in range(rows)],
+    })
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False)
+    return buffer.getvalue().encode("utf-8")
+
+
+def run(label: str, content: bytes, extension: str, strategy: str, tokenizer):
+    segments = list(vector_db.iter_document_text(content, extension))
+    size = sum(len(segment) for segment in segments)
+    chunker = vector_db.get_document_chunker(extension, strategy)
+    start = time.perf_counter()
+    chunks = list(chunker.chunk(segments))
+    elapsed = time.perf_counter() - start
+
+    # +2 for the [CLS] and [SEP] tokens the model adds
+    tokens = [len(encoding.ids) + 2 for encoding in tokenizer.encode_batch(chunks, add_special_tokens=False)]
+    over_limit = sum(1 for count in tokens if count > vector_db.EMBEDDING_MAX_TOKENS)
+    print(f"{label:<8} {strategy:<9} {size / elapsed / 1e6:8.1f} MB/s {len(chunks):8d} "
+          f"{size / len(chunks):9.0f} {min(tokens):6d} {sum(tokens) / len(tokens):6.0f} {max(tokens):6d} "
+          f"{100 * over_limit / len(chunks):7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunking strategy benchmark")
+    parser.add_argument("--paragraphs", type=int, default=2000)
+    parser.add_argument("--rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    tokenizer = load_tokenizer(vector_db.EMBEDDING_MODEL_NAME)
+    documents = [("policy", make_policy(args.paragraphs), ".txt"), ("csv", make_csv(args.rows), ".csv")]
+
+    print(f"{'document':<8} {'strategy':<9} {'throughput':>13} {'chunks':>8} {'chars/chk':>9} "
+          f"{'min tk':>6} {'avg tk':>6} {'max tk':>6} {'>limit':>8}")
+    for label, content, extension in documents:
+        for strategy in ("fixed", "sentence", "token", "table", "auto"):
+            run(label, content, extension, strategy, tokenizer)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark for worker cold-start time and memory per role.
+
+Each role is measured in a fresh interpreter: the time to import the modules
+the role needs, and the peak RSS afterwards. The "embedding" role also loads
+and warms up the embedding model.
+
+Usage:
+    python benchmarks/bench_cold_start.py
+    python benchmarks/bench_cold_start.py --roles server embedding
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+AI_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+ROLES = {
+    "ocr": "import ocr_expense_parser",
+    "analytics": "import trip_analytics",
+    "vector_db": "import vector_db",
+    "server": "import waitress_server",
+    "embedding": "import vector_db; vector_db.warm_up_embedding_model()",
+}
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+try:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+except ImportError:
+    rss_mb = None
+print("RESULT " + json.dumps({{"seconds": elapsed, "peak_rss_mb": rss_mb,
+                              "torch_loaded": "torch" in sys.modules}}))
+"""
+
+
+def measure(role: str) -> dict:
+    completed = subprocess.run(
+        [sys.executable, "-c", PROBE.format(statement=ROLES[role])],
+        cwd=AI_DIRECTORY, capture_output=True, text=True,
+        env={**os.environ, "EMBEDDING_WARMUP": "off"},
+    )
+    for line in completed.stdout.splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    raise RuntimeError(f"Role {role} failed:\n{completed.stderr[-2000:]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start time and RSS per worker role")
+    parser.add_argument("--roles", nargs="+", choices=sorted(ROLES), default=list(ROLES))
+    args = parser.parse_args()
+
+    print(f"{'role':<12} {'cold start':>12} {'peak RSS':>12} {'torch loaded':>14}")
+    for role in args.roles:
+        result = measure(role)
+        rss = f"{result['peak_rss_mb']:.0f} MB" if result['peak_rss_mb'] is not None else "n/a"
+        print(f"{role:<12} {result['seconds']:>11.2f}s {rss:>12} {str(result['torch_loaded']):>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark and parity check for the embedding backends.
+
+Each backend runs in a fresh interpreter so its load time and peak RSS are
+measured in isolation. Its embeddings of a shared sample are then compared
+against the torch SentenceTransformer output by cosine similarity.
+
+Usage:
+    python benchmarks/bench_embedding_backends.py --chunks 1000
+    python benchmarks/bench_embedding_backends.py --backends torch onnx-int8
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+AI_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, AI_DIRECTORY)
+
+from bench_embeddings import make_chunks
+
+BACKENDS = ["torch", "onnx", "onnx-int8"]
+
+PROBE = """
+import json, sys, time
+import numpy as np
+sys.path.insert(0, {benchmarks!r})
+import vector_db
+from bench_embeddings import make_chunks
+
+vector_db.EMBEDDING_CACHE_ENABLED = False
+start = time.perf_counter()
+model = vector_db.get_embedding_model()
+load_seconds = time.perf_counter() - start
+
+chunks = make_chunks({chunks})
+model.encode(chunks[:8], batch_size={batch_size})  # Warm-up outside the timed region
+start = time.perf_counter()
+embeddings = model.encode(chunks, batch_size={batch_size})
+encode_seconds = time.perf_counter() - start
+np.save({output!r}, np.asarray(embeddings, dtype=np.float32))
+
+import resource
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print("RESULT " + json.dumps({{
+    "load_seconds": load_seconds,
+    "chunks_per_second": len(chunks) / encode_seconds,
+    "peak_rss_mb": rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024,
+}}))
+"""
+
+
+def run_backend(backend: str, chunks: int, batch_size: int, output: str) -> dict:
+    code = PROBE.format(benchmarks=os.path.dirname(os.path.abspath(__file__)),
+                        chunks=chunks, batch_size=batch_size, output=output)
+    completed = subprocess.run([sys.executable, "-c", code], cwd=AI_DIRECTORY, capture_output=True, text=True,
+                               env={**os.environ, "EMBEDDING_BACKEND": backend})
+    for line in completed.stdout.splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    raise RuntimeError(f"Backend {backend} failed:\n{completed.stderr[-2000:]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding backend throughput, memory and parity")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=BACKENDS)
+    parser.add_argument("--chunks", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    backends = ["torch"] + [backend for backend in args.backends if backend != "torch"]
+    print(f"Embedding {len(make_chunks(args.chunks))} chunks per backend")
+    print(f"{'backend':<10} {'load':>8} {'chunks/sec':>11} {'peak RSS':>10} {'min cos':>9} {'mean cos':>9}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        reference = None
+        for backend in backends:
+            output = os.path.join(directory, f"{backend}.npy")
+            result = run_backend(backend, args.chunks, args.batch_size, output)
+            embeddings = np.load(output)
+            embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+            if reference is None:
+                reference = embeddings
+            cosines = (reference * embeddings).sum(axis=1)
+            print(f"{backend:<10} {result['load_seconds']:>7.2f}s {result['chunks_per_second']:>11.1f} "
+                  f"{result['peak_rss_mb']:>7.0f} MB {cosines.min():>9.4f} {cosines.mean():>9.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Benchmark for compressed flat index storage (float16 and int8 with per-vector scales).
+
+For each storage precision, reports the bytes stored (and scanned by each query)
+per vector, the bytes per chunk of the whole flat index directory and of the whole
+DB directory (the ChromaDB collection the index is exported from plus the flat
+index), with the saving against float32, the recall@k of its top results against
+exact float32 search, with and without rescoring the top candidates, and the warm
+per-query latency of both. Rescoring fetches the candidates' exact embeddings from
+the ChromaDB collection, as searches do. Vectors are synthetic: normalized points
+scattered around a set of cluster centres, which keeps near neighbours closer
+together than uniformly random vectors do, as real chunk embeddings are. No
+embedding model is loaded.
+
+Usage:
+    python benchmarks/bench_embedding_storage.py --size 5000 --queries 200 --n-results 5
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import chromadb
+
+from flat_index import FLAT_INDEX_DTYPES, FlatIndex
+from vector_db import COLLECTION_NAME
+
+# Most embeddings ChromaDB accepts in one add call
+ADD_BATCH_SIZE = 1000
+
+
+def clustered_vectors(rng, count: int, dimension: int, clusters: int, spread: float) -> np.ndarray:
+    centres = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    vectors = centres[rng.integers(0, clusters, count)] + spread * rng.standard_normal((count, dimension))
+    vectors = vectors.astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def directory_size(directory: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(directory) for name in files)
+
+
+def build_collection(directory: str, ids, vectors: np.ndarray, metadatas):
+    """Stores the vectors in a ChromaDB collection, as a per-document DB holds its chunks."""
+    client = chromadb.PersistentClient(path=directory)
+    collection = client.get_or_create_collection(name=COLLECTION_NAME)
+    for offset in range(0, len(ids), ADD_BATCH_SIZE):
+        collection.add(ids=ids[offset:offset + ADD_BATCH_SIZE],
+                       embeddings=vectors[offset:offset + ADD_BATCH_SIZE].tolist(),
+                       metadatas=metadatas[offset:offset + ADD_BATCH_SIZE])
+    return client, collection
+
+
+def stored_embeddings(collection, ids):
+    """Exact embeddings of chunks read from the collection, as vector_db rescores with."""
+    page = collection.get(ids=ids, include=["embeddings"])
+    by_id = dict(zip(page["ids"], page["embeddings"]))
+    return [by_id[chunk_id] for chunk_id in ids]
+
+
+def recall(results, truth) -> float:
+    found = sum(len({hit[0] for hit in hits} & set(expected)) for hits, expected in zip(results, truth))
+    return found / sum(len(expected) for expected in truth)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compressed flat index storage benchmark")
+    parser.add_argument("--size", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--n-results", type=int, default=5)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=50)
+    parser.add_argument("--spread", type=float, default=0.6)
+    parser.add_argument("--rescore-multiplier", type=int, default=4)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = clustered_vectors(rng, args.size, args.dimension, args.clusters, args.spread)
+    queries = clustered_vectors(rng, args.queries, args.dimension, args.clusters, args.spread)
+    ids = [f"doc_{i}" for i in range(args.size)]
+    documents = [""] * args.size
+    metadatas = [{"chunk_index": i} for i in range(args.size)]
+
+    exact = queries @ vectors.T
+    truth = [[ids[i] for i in np.argsort(-row, kind="stable")[:args.n_results]] for row in exact]
+
+    directory = tempfile.mkdtemp(prefix="bench_embedding_storage_")
+    try:
+        client, collection = build_collection(directory, ids, vectors, metadatas)
+        rescore = lambda chunk_ids: stored_embeddings(collection, chunk_ids)
+        collection_bytes = directory_size(directory) / args.size
+        print(f"{args.size} vectors x {args.dimension} dims, recall@{args.n_results} over {args.queries} queries, "
+              f"rescoring top {args.n_results * args.rescore_multiplier}; "
+              f"ChromaDB collection {collection_bytes:.1f} bytes/chunk")
+        print(f"{'dtype':>8} | {'B/vec':>6} | {'flat B/chunk':>12} {'saved':>6} | {'DB B/chunk':>10} {'saved':>6} | "
+              f"{'recall':>7} {'q ms':>7} | {'rescored':>8} {'q ms':>7}")
+        float32_bytes = None
+        for dtype in FLAT_INDEX_DTYPES:
+            FlatIndex.build(directory, ids, vectors, documents, metadatas, dtype=dtype)
+            index = FlatIndex.load(directory)
+            flat_bytes = directory_size(FlatIndex.path(directory)) / args.size
+            if float32_bytes is None:
+                float32_bytes = flat_bytes
+            saved = float32_bytes - flat_bytes
+
+            start = time.perf_counter()
+            plain = [index.search_many(query[None, :], args.n_results, rescore_multiplier=0)[0]
+                     for query in queries]
+            plain_ms = (time.perf_counter() - start) * 1000 / args.queries
+
+            start = time.perf_counter()
+            rescored = [index.search_many(query[None, :], args.n_results, rescore=rescore,
+                                          rescore_multiplier=args.rescore_multiplier)[0] for query in queries]
+            rescored_ms = (time.perf_counter() - start) * 1000 / args.queries
+
+            rescored_column = f"{recall(rescored, truth):>8.4f} {rescored_ms:>7.3f}" if index.compressed else \
+                f"{'-':>8} {'-':>7}"
+            print(f"{dtype:>8} | {index.bytes_per_vector():>6} | {flat_bytes:>12.1f} "
+                  f"{saved / float32_bytes:>6.1%} | {collection_bytes + flat_bytes:>10.1f} "
+                  f"{saved / (collection_bytes + float32_bytes):>6.1%} | "
+                  f"{recall(plain, truth):>7.4f} {plain_ms:>7.3f} | {rescored_column}")
+        client.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark for chunk embedding throughput.
+
+Compares the per-chunk encode loop against the batched get_embeddings path,
+and the streaming ingest path (groups of vector_db._ingest_batch_size() chunks,
+as add_document_to_db and upsert_document embed them) with and without the
+multi-process pool, all with the configured EMBEDDING_POOL_MIN_TEXTS.
+
+Usage:
+    python benchmarks/bench_embeddings.py --chunks 2000 --batch-size 64 --processes 4
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import vector_db
+
+
+def make_chunks(count: int, chunk_size: int = 500):
+    """Builds synthetic expense-like text chunks of roughly chunk_size characters."""
+    base = ("Hotel invoice INV-{i:05d} from vendor Acme Travel, amount 1{i:03d}.50 INR, "
+            "tax 18%, trip to Bangalore for the quarterly budget review. ")
+    chunks = []
+    for i in range(count):
+        text = base.format(i=i)
+        chunks.append((text * (chunk_size // len(text) + 1))[:chunk_size])
+    return chunks
+
+
+def run(label: str, fn, chunks):
+    start = time.perf_counter()
+    fn(chunks)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {len(chunks) / elapsed:10.1f} chunks/sec  ({elapsed:.2f}s)")
+
+
+def ingest(chunks):
+    """Embeds chunks in the groups the streaming ingest path hands to get_embeddings."""
+    for group in vector_db._batched(chunks, vector_db._ingest_batch_size()):
+        vector_db.get_embeddings(group)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding throughput benchmark")
+    parser.add_argument("--chunks", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=vector_db.EMBEDDING_BATCH_SIZE)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1,
+                        help="Processes for the multi-process run (0 skips it)")
+    args = parser.parse_args()
+
+    # Measure the model itself, not the persistent embedding cache
+    vector_db.EMBEDDING_CACHE_ENABLED = False
+    chunks = make_chunks(args.chunks)
+    print(f"Embedding {len(chunks)} chunks on {os.cpu_count()} CPUs")
+
+    run("per-chunk get_embedding", lambda c: [vector_db.get_embedding(t) for t in c], chunks)
+    run(f"batched (batch={args.batch_size})",
+        lambda c: vector_db.get_embeddings(c, batch_size=args.batch_size), chunks)
+
+    run(f"ingest (groups of {vector_db._ingest_batch_size()})", ingest, chunks)
+
+    if args.processes > 0:
+        vector_db.EMBEDDING_POOL_PROCESSES = args.processes
+        vector_db._get_embedding_pool()  # Start the pool outside the timed region
+        run(f"pool ({args.processes} processes)",
+            lambda c: vector_db.get_embeddings(c, batch_size=args.batch_size), chunks)
+        run(f"ingest, pool (groups of {vector_db._ingest_batch_size()})", ingest, chunks)
+        vector_db.stop_embedding_pool()
+
+
+if __name__ == "__main__":
+    main()
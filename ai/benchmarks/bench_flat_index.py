@@ -0,0 +1,110 @@
+"""
+Benchmark for the flat exact-search index against ChromaDB's HNSW collection.
+
+For each collection size, measures the cost of opening the index and answering
+the first query (what a per-document DB pays when it is not already open), the
+warm per-query latency, and the on-disk size. Random normalized vectors are used,
+so no embedding model is loaded.
+
+Usage:
+    python benchmarks/bench_flat_index.py --sizes 100 500 1000 2000 5000 10000 --queries 50
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import chromadb
+
+from flat_index import FLAT_INDEX_DTYPES, FlatIndex
+from vector_db import COLLECTION_NAME
+
+
+def directory_size(directory: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(directory) for name in files)
+
+
+def build(directory: str, vectors: np.ndarray, dtype: str):
+    ids = [f"doc_{i}" for i in range(len(vectors))]
+    documents = [f"Chunk {i} of a synthetic expense report. " * 10 for i in range(len(vectors))]
+    metadatas = [{"chunk_index": i} for i in range(len(vectors))]
+
+    chroma_directory = os.path.join(directory, "chroma")
+    client = chromadb.PersistentClient(path=chroma_directory)
+    collection = client.get_or_create_collection(name=COLLECTION_NAME)
+    for start in range(0, len(ids), 1000):
+        collection.add(ids=ids[start:start + 1000], embeddings=vectors[start:start + 1000].tolist(),
+                       documents=documents[start:start + 1000], metadatas=metadatas[start:start + 1000])
+    client.close()
+
+    flat_directory = os.path.join(directory, "flat")
+    FlatIndex.build(flat_directory, ids, vectors, documents, metadatas, dtype=dtype)
+    return chroma_directory, flat_directory
+
+
+def time_chroma(directory: str, queries: np.ndarray, n_results: int):
+    start = time.perf_counter()
+    client = chromadb.PersistentClient(path=directory)
+    collection = client.get_or_create_collection(name=COLLECTION_NAME)
+    collection.query(query_embeddings=queries[:1].tolist(), n_results=n_results)
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for query in queries:
+        collection.query(query_embeddings=[query.tolist()], n_results=n_results)
+    warm = (time.perf_counter() - start) / len(queries)
+    client.close()
+    return cold, warm
+
+
+def time_flat(directory: str, queries: np.ndarray, n_results: int):
+    start = time.perf_counter()
+    index = FlatIndex.load(directory)
+    index.search_many(queries[:1], n_results)
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for query in queries:
+        index.search_many(query[None, :], n_results)
+    warm = (time.perf_counter() - start) / len(queries)
+    return cold, warm
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flat index vs ChromaDB benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 500, 1000, 2000, 5000, 10000])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--n-results", type=int, default=5)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--dtype", default="float32", choices=FLAT_INDEX_DTYPES)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    queries = rng.standard_normal((args.queries, args.dimension)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    print(f"{'chunks':>7} | {'chroma open+q ms':>16} {'warm q ms':>9} {'disk KB':>9} | "
+          f"{'flat open+q ms':>14} {'warm q ms':>9} {'disk KB':>9}")
+    for size in args.sizes:
+        vectors = rng.standard_normal((size, args.dimension)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        directory = tempfile.mkdtemp(prefix="bench_flat_index_")
+        try:
+            chroma_directory, flat_directory = build(directory, vectors, args.dtype)
+            chroma_cold, chroma_warm = time_chroma(chroma_directory, queries, args.n_results)
+            flat_cold, flat_warm = time_flat(flat_directory, queries, args.n_results)
+            print(f"{size:>7} | {chroma_cold * 1000:>16.1f} {chroma_warm * 1000:>9.2f} "
+                  f"{directory_size(chroma_directory) / 1024:>9.0f} | {flat_cold * 1000:>14.1f} "
+                  f"{flat_warm * 1000:>9.2f} {directory_size(flat_directory) / 1024:>9.0f}")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Benchmark for ChromaDB's HNSW index parameters (see vector_db.hnsw_metadata).
+
+For every combination of distance space, M, construction_ef and search_ef,
+builds a persistent collection and reports the build time, recall@k against
+exact search and the p50/p99 latency of single-query searches. Chunk sets are
+synthetic clustered vectors (no embedding model is loaded), the chunks of real
+documents (--documents, embedded with the configured model) or the stored
+embeddings of an existing vector DB (--db). For real chunk sets a random sample
+of chunks is held out of the index and used as the queries.
+
+Usage:
+    python benchmarks/bench_hnsw.py --size 20000 --m 8 16 32 --search-ef 10 50 100
+    python benchmarks/bench_hnsw.py --documents policy.pdf expenses.xlsx --construction-ef 100 200
+    python benchmarks/bench_hnsw.py --db ./chroma_db_shared --spaces l2 cosine
+"""
+import argparse
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import chromadb
+
+import vector_db
+from bench_embedding_storage import clustered_vectors
+from vector_db import COLLECTION_NAME, hnsw_metadata
+
+# Most embeddings ChromaDB accepts in one add call
+ADD_BATCH_SIZE = 1000
+# ChromaDB's defaults, benchmarked when the matching HNSW_* setting is unset
+CHROMA_DEFAULT_SPACE = "l2"
+CHROMA_DEFAULT_M = 16
+CHROMA_DEFAULT_CONSTRUCTION_EF = 100
+
+
+def document_chunks(paths):
+    """Chunks and embeds documents the way add_document_to_db does."""
+    texts = []
+    for path in paths:
+        extension = os.path.splitext(path)[1].lower()
+        with open(path, "rb") as f:
+            segments = vector_db.iter_document_text(f.read(), extension)
+        texts.extend(vector_db.get_document_chunker(extension).chunk(segments))
+    return np.asarray(vector_db.get_embeddings(texts), dtype=np.float32)
+
+
+def stored_chunks(db_directory: str):
+    """Reads the embeddings of an existing vector DB."""
+    client = chromadb.PersistentClient(path=db_directory)
+    try:
+        collection = client.get_collection(name=COLLECTION_NAME)
+        embeddings = collection.get(include=["embeddings"])["embeddings"]
+    finally:
+        client.close()
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def hold_out(rng, vectors: np.ndarray, count: int):
+    """Splits real chunk embeddings into indexed vectors and held-out queries."""
+    order = rng.permutation(len(vectors))
+    count = min(count, len(vectors) // 10 or 1)
+    return vectors[order[count:]], vectors[order[:count]]
+
+
+def build(directory: str, vectors: np.ndarray, metadata: dict) -> float:
+    ids = [f"chunk_{i}" for i in range(len(vectors))]
+    start = time.perf_counter()
+    client = chromadb.PersistentClient(path=directory)
+    collection = client.get_or_create_collection(name=COLLECTION_NAME, metadata=metadata)
+    for offset in range(0, len(ids), ADD_BATCH_SIZE):
+        collection.add(ids=ids[offset:offset + ADD_BATCH_SIZE],
+                       embeddings=vectors[offset:offset + ADD_BATCH_SIZE].tolist())
+    elapsed = time.perf_counter() - start
+    client.close()
+    return elapsed
+
+
+def query(directory: str, queries: np.ndarray, n_results: int):
+    """Returns the result ids and per-query latencies in ms of a freshly opened collection."""
+    client = chromadb.PersistentClient(path=directory)
+    collection = client.get_collection(name=COLLECTION_NAME)
+    # The first query loads the index from disk; keep it out of the latencies
+    collection.query(query_embeddings=queries[:1].tolist(), n_results=n_results, include=[])
+    results, latencies = [], []
+    for row in queries:
+        start = time.perf_counter()
+        ids = collection.query(query_embeddings=[row.tolist()], n_results=n_results, include=[])["ids"][0]
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(ids)
+    client.close()
+    return results, np.asarray(latencies)
+
+
+def recall(results, truth) -> float:
+    found = sum(len(set(ids) & set(expected)) for ids, expected in zip(results, truth))
+    return found / sum(len(expected) for expected in truth)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HNSW parameter recall/latency benchmark")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--documents", nargs="+", help="Documents to chunk and embed as the chunk set")
+    source.add_argument("--db", help="Existing vector DB directory whose embeddings are the chunk set")
+    parser.add_argument("--size", type=int, default=20000, help="Synthetic chunk count")
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--spread", type=float, default=0.6)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--n-results", type=int, default=10)
+    parser.add_argument("--spaces", nargs="+", default=[vector_db.HNSW_SPACE or CHROMA_DEFAULT_SPACE])
+    parser.add_argument("--m", type=int, nargs="+", default=[vector_db.HNSW_M or CHROMA_DEFAULT_M])
+    parser.add_argument("--construction-ef", type=int, nargs="+",
+                        default=[vector_db.HNSW_CONSTRUCTION_EF or CHROMA_DEFAULT_CONSTRUCTION_EF])
+    parser.add_argument("--search-ef", type=int, nargs="+", default=[10, 50, 100])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.documents or args.db:
+        chunks = document_chunks(args.documents) if args.documents else stored_chunks(args.db)
+        vectors, queries = hold_out(rng, chunks, args.queries)
+        label = "documents" if args.documents else args.db
+    else:
+        vectors = clustered_vectors(rng, args.size, args.dimension, args.clusters, args.spread)
+        queries = clustered_vectors(rng, args.queries, args.dimension, args.clusters, args.spread)
+        label = "synthetic"
+
+    # Every space ranks normalized vectors the same way, so one exact ranking serves them all
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    exact = (queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ normalized.T
+    truth = [[f"chunk_{i}" for i in np.argsort(-row, kind="stable")[:args.n_results]] for row in exact]
+
+    print(f"{label}: {len(vectors)} chunks x {vectors.shape[1]} dims, recall@{args.n_results} "
+          f"over {len(queries)} queries")
+    print(f"{'space':>6} {'M':>4} {'c_ef':>5} {'s_ef':>5} | {'build s':>8} | {'recall':>7} "
+          f"{'p50 ms':>7} {'p99 ms':>7}")
+    for space, m, construction_ef, search_ef in itertools.product(args.spaces, args.m, args.construction_ef,
+                                                                 args.search_ef):
+        directory = tempfile.mkdtemp(prefix="bench_hnsw_")
+        try:
+            build_seconds = build(directory, vectors, hnsw_metadata(space, m, construction_ef, search_ef))
+            results, latencies = query(directory, queries, args.n_results)
+            print(f"{space:>6} {m:>4} {construction_ef:>5} {search_ef:>5} | {build_seconds:>8.2f} | "
+                  f"{recall(results, truth):>7.4f} {np.percentile(latencies, 50):>7.3f} "
+                  f"{np.percentile(latencies, 99):>7.3f}")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+# File name of the keyword index stored next to a ChromaDB collection
+KEYWORD_INDEX_FILENAME = "bm25_index.sqlite3"
+
+# BM25 term-frequency saturation and length normalisation
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Keeps invoice numbers, amounts and dates such as INV-00042, 1,200.50 or 2024-03-20 as one token
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.,/\-][a-z0-9]+)*")
+# Chunk ids bound per "IN (...)" query, below SQLite's default variable limit
+_SQL_BATCH_SIZE = 500
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercases text and splits it into keyword tokens.
+    """
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Persistent inverted index with BM25 scoring, stored in SQLite next to a collection.
+
+    Chunks are added and removed incrementally; corpus statistics (chunk count and
+    total length) live in a one-row table that add and delete update in the same
+    transaction, so neither scoring nor a rebuild needs to scan every chunk.
+    """
+
+    def __init__(self, db_directory: str):
+        self.path = os.path.join(db_directory, KEYWORD_INDEX_FILENAME)
+        os.makedirs(db_directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY,
+                doc_key TEXT,
+                length INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, chunk_id)
+            );
+            CREATE TABLE IF NOT EXISTS stats (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                chunk_count INTEGER NOT NULL,
+                total_length INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings(chunk_id);
+            CREATE INDEX IF NOT EXISTS idx_chunks_doc_key ON chunks(doc_key);
+            """
+        )
+        if self._conn.execute("SELECT 1 FROM stats").fetchone() is None:
+            # New index, or one written before the stats table existed: count once
+            self._conn.execute(
+                "INSERT INTO stats (id, chunk_count, total_length) "
+                "SELECT 0, COUNT(*), COALESCE(SUM(length), 0) FROM chunks")
+        self._conn.commit()
+
+    def add(self, chunk_ids: List[str], documents: List[str], doc_key: Optional[str] = None):
+        """
+        Indexes chunks, replacing any existing entries with the same ids.
+        """
+        with self._lock:
+            self._delete_ids(chunk_ids)
+            chunk_rows = []
+            posting_rows = []
+            for chunk_id, document in zip(chunk_ids, documents):
+                counts = Counter(tokenize(document))
+                chunk_rows.append((chunk_id, doc_key, sum(counts.values())))
+                posting_rows.extend((term, chunk_id, tf) for term, tf in counts.items())
+            self._conn.executemany("INSERT INTO chunks (chunk_id, doc_key, length) VALUES (?, ?, ?)", chunk_rows)
+            self._conn.executemany("INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)", posting_rows)
+            self._update_stats(len(chunk_rows), sum(row[2] for row in chunk_rows))
+            self._conn.commit()
+
+    def delete(self, chunk_ids: List[str] = None, doc_key: str = None):
+        """
+        Removes chunks by id, or every chunk of a shared-collection document.
+        """
+        with self._lock:
+            if doc_key is not None:
+                chunk_ids = [row[0] for row in self._conn.execute(
+                    "SELECT chunk_id FROM chunks WHERE doc_key = ?", (doc_key,))]
+            self._delete_ids(chunk_ids or [])
+            self._conn.commit()
+
+    def _delete_ids(self, chunk_ids: List[str]):
+        """Deletes chunks and their postings. Caller holds the lock."""
+        removed, removed_length = 0, 0
+        for start in range(0, len(chunk_ids), _SQL_BATCH_SIZE):
+            batch = chunk_ids[start:start + _SQL_BATCH_SIZE]
+            count, length = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks "
+                f"WHERE chunk_id IN ({', '.join('?' * len(batch))})", batch).fetchone()
+            removed += count
+            removed_length += length
+        rows = [(chunk_id,) for chunk_id in chunk_ids]
+        self._conn.executemany("DELETE FROM postings WHERE chunk_id = ?", rows)
+        self._conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", rows)
+        self._update_stats(-removed, -removed_length)
+
+    def _update_stats(self, chunk_delta: int, length_delta: int):
+        """Adjusts the corpus statistics. Caller holds the lock and commits."""
+        if chunk_delta or length_delta:
+            self._conn.execute("UPDATE stats SET chunk_count = chunk_count + ?, total_length = total_length + ?",
+                               (chunk_delta, length_delta))
+
+    def search(self, query: str, n_results: int = 5, doc_key: str = None) -> List[Tuple[str, float]]:
+        """
+        Scores chunks against the query with BM25.
+
+        Args:
+            query: The search query.
+            n_results: The number of results to return.
+            doc_key: Restrict results to one shared-collection document.
+
+        Returns:
+            (chunk_id, score) pairs, best first.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            chunk_count, total_length = self._conn.execute(
+                "SELECT chunk_count, total_length FROM stats").fetchone()
+            if chunk_count == 0:
+                return []
+            average_length = total_length / chunk_count
+
+            scores: Dict[str, float] = {}
+            for term in terms:
+                if doc_key is None:
+                    postings = self._conn.execute(
+                        "SELECT p.chunk_id, p.tf, c.length FROM postings p JOIN chunks c ON c.chunk_id = p.chunk_id "
+                        "WHERE p.term = ?", (term,)).fetchall()
+                else:
+                    postings = self._conn.execute(
+                        "SELECT p.chunk_id, p.tf, c.length FROM postings p JOIN chunks c ON c.chunk_id = p.chunk_id "
+                        "WHERE p.term = ? AND c.doc_key = ?", (term, doc_key)).fetchall()
+                    if not postings:
+                        continue
+                document_frequency = self._conn.execute(
+                    "SELECT COUNT(*) FROM postings WHERE term = ?", (term,)).fetchone()[0]
+                if document_frequency == 0:
+                    continue
+                idf = math.log(1 + (chunk_count - document_frequency + 0.5) / (document_frequency + 0.5))
+                for chunk_id, tf, length in postings:
+                    norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:n_results]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT chunk_count FROM stats").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuses several ranked id lists into one ranking with reciprocal rank fusion.
+
+    Returns:
+        (id, fused score) pairs, best first.
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
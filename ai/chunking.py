@@ -0,0 +1,358 @@
+import hashlib
+import re
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional
+
+# Chunking strategies accepted by make_chunker
+CHUNKING_STRATEGIES = ("fixed", "sentence", "token", "table", "content", "auto")
+# File types whose extracted text is one table row per line
+TABLE_EXTENSIONS = (".csv", ".xls", ".xlsx")
+
+# Longest run of text without whitespace held back so a word is not split between segments
+_MAX_WORD_LENGTH = 1000
+
+# Characters per piece when tokenizing a segment in parallel
+_TOKENIZE_PIECE_SIZE = 2048
+
+# Ends of sentences and paragraphs: terminal punctuation followed by whitespace, or a newline
+_SENTENCE_END = re.compile(r'[.!?]["\')\]]*\s+|\n\s*')
+
+# Content-defined chunking ends a chunk after about one in this many sentences or rows,
+# chosen by a hash of their text (see is_content_boundary)
+_CONTENT_BOUNDARY_DIVISOR = 4
+
+
+class FixedCharChunker:
+    """
+    Splits text into overlapping fixed-size character windows.
+
+    Produces the same chunks as sliding a window over the concatenated text,
+    while only buffering the unconsumed tail of the stream.
+    """
+
+    def __init__(self, chunk_size: int = 500, overlap: int = 100):
+        if not 0 <= overlap < chunk_size:
+            raise ValueError("overlap must be smaller than chunk_size")
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+
+    def chunk(self, segments: Iterable[str]) -> Iterator[str]:
+        step = self.chunk_size - self.overlap
+        buffer = ""
+        for segment in segments:
+            buffer += segment
+            position = 0
+            while len(buffer) - position >= self.chunk_size:
+                yield buffer[position:position + self.chunk_size]
+                position += step
+            buffer = buffer[position:]
+
+        position = 0
+        while position < len(buffer):
+            yield buffer[position:position + self.chunk_size]
+            position += step
+
+
+def iter_sentences(segments: Iterable[str], max_length: int) -> Iterator[str]:
+    """
+    Splits a stream of text into sentences and paragraph lines, keeping their
+    trailing whitespace. Text without a boundary is cut every max_length characters.
+    """
+    pending = ""
+    for segment in segments:
+        text = pending + segment
+        start = 0
+        for match in _SENTENCE_END.finditer(text):
+            if match.end() == len(text):
+                # The trailing whitespace may continue in the next segment
+                break
+            while match.end() - start > max_length:
+                yield text[start:start + max_length]
+                start += max_length
+            yield text[start:match.end()]
+            start = match.end()
+        while len(text) - start > max_length:
+            yield text[start:start + max_length]
+            start += max_length
+        pending = text[start:]
+    if pending:
+        yield pending
+
+
+class SentenceChunker:
+    """
+    Packs whole sentences and paragraph lines into chunks of up to chunk_size
+    characters. Trailing sentences of a chunk that fit within `overlap`
+    characters are repeated at the start of the next one.
+    """
+
+    def __init__(self, chunk_size: int = 500, overlap: int = 100):
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+
+    def chunk(self, segments: Iterable[str]) -> Iterator[str]:
+        current: List[str] = []
+        length = 0
+        for sentence in iter_sentences(segments, self.chunk_size):
+            if current and length + len(sentence) > self.chunk_size:
+                yield "".join(current)
+                # Carry the tail sentences that fit in the overlap
+                carried: List[str] = []
+                carried_length = 0
+                for previous in reversed(current):
+                    if carried_length + len(previous) > self.overlap or \
+                            carried_length + len(previous) + len(sentence) > self.chunk_size:
+                        break
+                    carried.insert(0, previous)
+                    carried_length += len(previous)
+                current, length = carried, carried_length
+            current.append(sentence)
+            length += len(sentence)
+        if current and "".join(current).strip():
+            yield "".join(current)
+
+
+def is_content_boundary(unit: str) -> bool:
+    """
+    Returns True if a sentence or row may end a content-defined chunk. The choice
+    depends only on the unit's own text, so chunk boundaries move with the content
+    instead of with character offsets.
+    """
+    digest = hashlib.blake2b(unit.strip().encode("utf-8"), digest_size=4).digest()
+    return int.from_bytes(digest, "big") % _CONTENT_BOUNDARY_DIVISOR == 0
+
+
+class ContentDefinedChunker:
+    """
+    Packs whole sentences and paragraph lines into chunks whose boundaries are
+    chosen by the content itself: a chunk ends after a boundary sentence (see
+    is_content_boundary) once it holds at least half its size, or when the next
+    sentence would not fit. An edit therefore only changes the chunks around it;
+    chunks after it are cut at the same sentences as before. This is what lets
+    upsert_document re-embed about one chunk for a one-line edit, where fixed
+    windows shift every later chunk.
+
+    The last sentence of a chunk is repeated at the start of the next one if it
+    fits within `overlap` characters.
+    """
+
+    def __init__(self, chunk_size: int = 500, overlap: int = 100):
+        if not 0 <= overlap < chunk_size:
+            raise ValueError("overlap must be smaller than chunk_size")
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+
+    def chunk(self, segments: Iterable[str]) -> Iterator[str]:
+        # Sentences of the chunk itself are capped at chunk_size - overlap, leaving room for the carried one
+        limit = self.chunk_size - self.overlap
+        carried = ""
+        current: List[str] = []
+        length = 0
+        # Characters since the last content-defined cut. Cuts forced by the size limit do not
+        # reset it, so where the next boundary falls never depends on where a forced cut fell
+        since_boundary = 0
+        for sentence in iter_sentences(segments, limit):
+            if current and length + len(sentence) > limit:
+                yield carried + "".join(current)
+                carried = current[-1] if len(current[-1]) <= self.overlap else ""
+                current, length = [], 0
+            current.append(sentence)
+            length += len(sentence)
+            since_boundary += len(sentence)
+            if since_boundary >= limit // 2 and is_content_boundary(sentence):
+                yield carried + "".join(current)
+                carried = sentence if len(sentence) <= self.overlap else ""
+                current, length, since_boundary = [], 0, 0
+        if current and "".join(current).strip():
+            yield carried + "".join(current)
+
+
+class TokenChunker:
+    """
+    Splits text into windows of at most max_tokens tokens of the embedding
+    model's tokenizer, so no chunk is truncated by the model and none is
+    needlessly small. Consecutive windows share overlap_tokens tokens.
+
+    Chunk boundaries fall on token boundaries and the text is tokenized once,
+    in a single pass over the stream.
+    """
+
+    def __init__(self, tokenizer, max_tokens: int = 254, overlap_tokens: int = 50):
+        if not 0 <= overlap_tokens < max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+
+    def _offsets(self, text: str) -> List[tuple]:
+        """Token (start, end) character offsets in text."""
+        # Tokenize whitespace-delimited pieces as a batch, which the tokenizer runs in parallel
+        pieces = []
+        start = 0
+        while start < len(text):
+            end = text.find(" ", start + _TOKENIZE_PIECE_SIZE)
+            end = len(text) if end == -1 else end + 1
+            pieces.append((start, text[start:end]))
+            start = end
+        offsets = []
+        encodings = self.tokenizer.encode_batch([piece for _, piece in pieces], add_special_tokens=False)
+        for (piece_start, _), encoding in zip(pieces, encodings):
+            offsets.extend((piece_start + start, piece_start + end) for start, end in encoding.offsets if end > start)
+        return offsets
+
+    def chunk(self, segments: Iterable[str]) -> Iterator[str]:
+        step = self.max_tokens - self.overlap_tokens
+        buffer = ""
+        offsets = []
+        carry = ""
+        emitted = False
+        segments = iter(segments)
+        while True:
+            segment = next(segments, None)
+            if segment is None:
+                text, carry = carry, ""
+            else:
+                # Hold back the trailing partial word so it is tokenized whole
+                text = carry + segment
+                cut = max(text.rfind(" "), text.rfind("\n")) + 1
+                if cut == 0 and len(text) > _MAX_WORD_LENGTH:
+                    cut = len(text)
+                text, carry = text[:cut], text[cut:]
+
+            base = len(buffer)
+            buffer += text
+            offsets.extend((base + start, base + end) for start, end in self._offsets(text))
+
+            first = 0
+            while len(offsets) - first >= self.max_tokens:
+                yield buffer[offsets[first][0]:offsets[first + self.max_tokens - 1][1]]
+                emitted = True
+                first += step
+            if first:
+                shift = offsets[first][0] if first < len(offsets) else len(buffer)
+                buffer = buffer[shift:]
+                offsets = [(start - shift, end - shift) for start, end in offsets[first:]]
+
+            if segment is None:
+                break
+
+        # The tail starts with tokens already emitted as overlap; emit it only if it has new ones
+        if len(offsets) > (self.overlap_tokens if emitted else 0):
+            yield buffer[offsets[0][0]:offsets[-1][1]]
+
+
+class TableRowChunker:
+    """
+    Packs whole table rows (one per line) into chunks of up to chunk_size
+    characters and repeats the header line at the top of every chunk, so
+    each chunk can be read on its own. Rows are never split unless a single
+    row exceeds the chunk size.
+
+    With content_defined, a chunk also ends after a boundary row (see
+    is_content_boundary) once it holds at least half its size, so inserting or
+    editing a row only changes the chunks around it.
+    """
+
+    def __init__(self, chunk_size: int = 500, content_defined: bool = False):
+        self.chunk_size = chunk_size
+        self.content_defined = content_defined
+
+    def chunk(self, segments: Iterable[str]) -> Iterator[str]:
+        header = None
+        rows: List[str] = []
+        length = 0
+        # Row characters since the last content-defined cut (see ContentDefinedChunker)
+        since_boundary = 0
+        emitted = False
+        for row in iter_lines(segments):
+            if header is None:
+                header = row
+                continue
+            if not row.strip():
+                continue
+            if rows and len(header) + length + len(row) > self.chunk_size:
+                yield header + "".join(rows)
+                rows, length, emitted = [], 0, True
+            if len(header) + len(row) > self.chunk_size:
+                # A single oversized row is split on its own
+                yield from FixedCharChunker(self.chunk_size, 0).chunk([header + row])
+                emitted = True
+                continue
+            rows.append(row)
+            length += len(row)
+            since_boundary += len(row)
+            if self.content_defined and 2 * (len(header) + since_boundary) >= self.chunk_size \
+                    and is_content_boundary(row):
+                yield header + "".join(rows)
+                rows, length, since_boundary, emitted = [], 0, 0, True
+        if rows:
+            yield header + "".join(rows)
+        elif not emitted and header is not None and header.strip():
+            yield header
+
+
+def iter_lines(segments: Iterable[str]) -> Iterator[str]:
+    """Splits a stream of text into lines, keeping their newline."""
+    pending = ""
+    for segment in segments:
+        lines = (pending + segment).split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    if pending:
+        yield pending
+
+
+@lru_cache(maxsize=4)
+def load_tokenizer(model_name: str):
+    """
+    Loads the fast tokenizer of a sentence-transformers model (tokenizer.json only, no torch).
+    """
+    from huggingface_hub import hf_hub_download
+    from tokenizers import Tokenizer
+
+    repo_id = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+    return Tokenizer.from_file(hf_hub_download(repo_id, "tokenizer.json"))
+
+
+def make_chunker(strategy: str, file_extension: str = "", chunk_size: int = 500, overlap: int = 100,
+                 model_name: Optional[str] = None, max_tokens: int = 256):
+    """
+    Creates a chunker for a strategy.
+
+    Args:
+        strategy: "fixed" (character windows), "sentence" (sentence/paragraph
+            packing), "token" (embedding-model token windows), "table" (whole
+            rows with the header repeated), "content" (content-defined sentence
+            chunks, or content-defined row chunks for spreadsheets, whose
+            boundaries survive edits) or "auto" (table for spreadsheets,
+            sentence otherwise).
+        file_extension: The document's extension, used by "auto".
+        chunk_size: Maximum characters per chunk for the character-based strategies.
+        overlap: Characters shared by consecutive chunks for the character-based strategies.
+        model_name: Embedding model whose tokenizer the "token" strategy uses.
+        max_tokens: The embedding model's sequence limit, including special tokens.
+
+    Returns:
+        An object with a chunk(segments) method yielding chunks.
+    """
+    strategy = strategy.lower()
+    if strategy == "auto":
+        strategy = "table" if file_extension.lower() in TABLE_EXTENSIONS else "sentence"
+    if strategy == "fixed":
+        return FixedCharChunker(chunk_size, overlap)
+    if strategy == "sentence":
+        return SentenceChunker(chunk_size, overlap)
+    if strategy == "table":
+        return TableRowChunker(chunk_size)
+    if strategy == "content":
+        if file_extension.lower() in TABLE_EXTENSIONS:
+            return TableRowChunker(chunk_size, content_defined=True)
+        return ContentDefinedChunker(chunk_size, overlap)
+    if strategy == "token":
+        if model_name is None:
+            raise ValueError("The token chunking strategy needs a model_name")
+        # Leave room for the [CLS] and [SEP] tokens the model adds
+        window = max_tokens - 2
+        return TokenChunker(load_tokenizer(model_name), window, max(0, min(window - 1, window // 5)))
+    raise ValueError(f"Unknown chunking strategy '{strategy}', expected one of {CHUNKING_STRATEGIES}")
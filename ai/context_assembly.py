@@ -0,0 +1,194 @@
+import os
+import re
+from typing import List, Optional
+
+import numpy as np
+
+import vector_db
+from chunking import TABLE_EXTENSIONS
+
+# Maximum prompt tokens spent on retrieved context
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "1500"))
+# Relevance/diversity trade-off for MMR selection (1.0 = relevance only)
+CONTEXT_MMR_LAMBDA = float(os.environ.get("CONTEXT_MMR_LAMBDA", "0.7"))
+# Retrieved chunks considered per question before MMR selection
+CONTEXT_CANDIDATES = int(os.environ.get("CONTEXT_CANDIDATES", "10"))
+# Characters per token used to estimate prompt size
+_CHARS_PER_TOKEN = 4
+# Shortest repeated text taken for the overlap of chunks whose overlap is not known exactly
+# (token windows, and chunks stored without their chunking strategy)
+_MIN_OVERLAP_CHARS = 20
+# Text ending at the end of a sentence or paragraph, as the sentence chunkers carry it over
+_ENDS_SENTENCE = re.compile(r'(?:[.!?]["\')\]]*\s+|\n\s*)$')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Roughly estimates the number of LLM tokens in text.
+    """
+    return (len(text) + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN
+
+
+def _chunk_layout(hit: dict) -> Optional[str]:
+    """
+    How the chunker repeated text between a hit and the chunk before it, from the
+    chunking strategy stored with the chunk: "fixed" (CHUNK_OVERLAP characters),
+    "sentence" (whole sentences), "table" (the header row) or None (unknown).
+    """
+    metadata = hit.get("metadata") or {}
+    chunking = metadata.get("chunking")
+    table = f".{metadata.get('file_type', '')}".lower() in TABLE_EXTENSIONS
+    if table and chunking in (None, "table", "auto", "content"):
+        return "table"
+    if chunking in ("sentence", "auto", "content"):
+        return "sentence"
+    if chunking == "fixed":
+        return "fixed"
+    return None
+
+
+def _overlap_length(previous: str, following: str, layout: Optional[str] = None) -> int:
+    """
+    Length of the text at the start of following that repeats what its chunker
+    already put in previous, the passage it is appended to (see _chunk_layout).
+    Where the overlap is not known exactly, a suffix of previous only counts as
+    repeated if it ends a sentence, or is at least _MIN_OVERLAP_CHARS long, so a
+    coincidental match such as "as" in "Total was" + "as approved" is kept.
+    """
+    if layout == "table":
+        header = previous[:previous.find("\n") + 1]
+        return len(header) if header and following.startswith(header) else 0
+    if layout == "fixed":
+        length = min(vector_db.CHUNK_OVERLAP, len(following))
+        return length if previous.endswith(following[:length]) else 0
+    for length in range(min(len(previous), len(following)), 0, -1):
+        overlap = following[:length]
+        if previous.endswith(overlap):
+            if _ENDS_SENTENCE.search(overlap) if layout == "sentence" else length >= _MIN_OVERLAP_CHARS:
+                return length
+    return 0
+
+
+def _chunk_position(hit: dict):
+    """Returns (document prefix, chunk index) for a hit, from its metadata and "<prefix>_<index>" id."""
+    prefix, _, suffix = hit["id"].rpartition("_")
+    chunk_index = (hit.get("metadata") or {}).get("chunk_index")
+    if chunk_index is None and suffix.isdigit():
+        chunk_index = int(suffix)
+    return prefix, chunk_index
+
+
+def mmr_select(query_embedding, embeddings, k: int, mmr_lambda: float = CONTEXT_MMR_LAMBDA) -> List[int]:
+    """
+    Picks k items by maximal marginal relevance: relevant to the query, but not
+    redundant with the items already picked.
+
+    Returns:
+        Indexes into embeddings, in selection order.
+    """
+    if len(embeddings) == 0 or k <= 0:
+        return []
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query /= max(float(np.linalg.norm(query)), 1e-12)
+
+    relevance = vectors @ query
+    selected = [int(np.argmax(relevance))]
+    redundancy = vectors @ vectors[selected[0]]
+    while len(selected) < min(k, len(vectors)):
+        scores = mmr_lambda * relevance - (1 - mmr_lambda) * redundancy
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        redundancy = np.maximum(redundancy, vectors @ vectors[best])
+    return selected
+
+
+def merge_adjacent(hits: List[dict]) -> List[str]:
+    """
+    Merges hits that are consecutive chunks of the same document into one passage,
+    dropping the text the chunker repeated between them (the overlap, or the header
+    row of table chunks).
+
+    Returns:
+        Passages ordered by their best-ranked chunk.
+    """
+    groups = {}
+    for rank, hit in enumerate(hits):
+        prefix, chunk_index = _chunk_position(hit)
+        # Hits of a fan-out search over several DBs only merge with hits from the same DB
+        groups.setdefault((hit.get("vector_db_name"), prefix), []).append(
+            (chunk_index if chunk_index is not None else -1, rank, hit["document"], _chunk_layout(hit)))
+
+    passages = []
+    for chunks in groups.values():
+        chunks.sort()
+        current_text, current_rank, last_index = None, None, None
+        for chunk_index, rank, text, layout in chunks:
+            if current_text is not None and chunk_index >= 0 and chunk_index == last_index + 1:
+                current_text += text[_overlap_length(current_text, text, layout):]
+                current_rank = min(current_rank, rank)
+            elif current_text is not None and chunk_index >= 0 and chunk_index == last_index:
+                continue
+            else:
+                if current_text is not None:
+                    passages.append((current_rank, current_text))
+                current_text, current_rank = text, rank
+            last_index = chunk_index
+        passages.append((current_rank, current_text))
+    return [text for _, text in sorted(passages, key=lambda passage: passage[0])]
+
+
+def assemble_context(question: str, hits: List[dict], max_chunks: int = 5,
+                     token_budget: int = CONTEXT_TOKEN_BUDGET, mmr_lambda: float = CONTEXT_MMR_LAMBDA,
+                     stats: Optional[dict] = None) -> str:
+    """
+    Builds the LLM context for a question from search hits.
+
+    Picks up to max_chunks diverse hits with MMR, merges adjacent chunks of the
+    same document (removing their overlap), and keeps whole passages in
+    relevance order until the token budget is spent.
+
+    Args:
+        question: The user's question.
+        hits: Search hits as returned by vector_db.search_db_hits_many, best first.
+            Hits searched with include_embeddings=True are ranked by their stored
+            embeddings; only hits without one are embedded here.
+        max_chunks: Maximum number of chunks to select.
+        token_budget: Maximum estimated tokens of context.
+        mmr_lambda: Relevance/diversity trade-off (1.0 = relevance only).
+        stats: Optional dictionary filled with token counts before and after assembly.
+
+    Returns:
+        The context text (empty if there are no hits).
+    """
+    if not hits:
+        return ""
+    texts = [hit["document"] for hit in hits]
+    query_embedding = vector_db.get_query_embeddings([question])[0]
+    embeddings = [hit.get("embedding") for hit in hits]
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        for i, embedding in zip(missing, vector_db.get_embeddings([texts[i] for i in missing])):
+            embeddings[i] = embedding
+    selected = mmr_select(query_embedding, embeddings, max_chunks, mmr_lambda)
+    passages = merge_adjacent([hits[i] for i in selected])
+
+    context_parts = []
+    remaining = token_budget
+    for passage in passages:
+        tokens = estimate_tokens(passage)
+        if tokens <= remaining:
+            context_parts.append(passage)
+            remaining -= tokens
+        elif not context_parts:
+            # Always keep the most relevant passage, truncated to the budget
+            context_parts.append(passage[:token_budget * _CHARS_PER_TOKEN])
+            remaining = 0
+    context = "\n".join(context_parts)
+
+    if stats is not None:
+        stats["candidate_tokens"] = sum(estimate_tokens(text) for text in texts[:max_chunks])
+        stats["context_tokens"] = estimate_tokens(context)
+    return context
@@ -0,0 +1,496 @@
+import asyncio
+import atexit
+import csv
+import io
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import docx
+import openpyxl
+import pandas as pd
+from PyPDF2 import PdfReader
+
+from text_cache import TextCache, content_hash
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; memory limits are not enforced there
+    resource = None
+
+try:
+    import magic
+except ImportError:  # python-magic or libmagic is missing; formats are chosen by extension
+    magic = None
+
+# Worker processes that parse documents (0 parses in-process, on the calling thread)
+EXTRACTION_PROCESSES = int(os.environ.get("EXTRACTION_PROCESSES", str(min(4, os.cpu_count() or 1))))
+# Seconds a single document may take to extract before its workers are killed
+EXTRACTION_TIMEOUT = float(os.environ.get("EXTRACTION_TIMEOUT", "120"))
+# Address-space limit of each extraction worker in MB (0 = unlimited)
+EXTRACTION_MEMORY_LIMIT_MB = int(os.environ.get("EXTRACTION_MEMORY_LIMIT_MB", "2048"))
+# PDFs are split into tasks of this many pages, extracted in parallel across the workers
+EXTRACTION_PDF_PAGES_PER_TASK = int(os.environ.get("EXTRACTION_PDF_PAGES_PER_TASK", "16"))
+
+# Persistent cache of extracted text keyed by document content hash
+TEXT_CACHE_ENABLED = os.environ.get("TEXT_CACHE_ENABLED", "true").lower() == "true"
+# Part of every text cache key; bump it when an extractor's output changes
+EXTRACTION_VERSION = 3
+
+# Streaming extractors by document format: function(content) -> Iterator[str]
+EXTRACTORS: Dict[str, Callable[[bytes], Iterator[str]]] = {}
+# Document formats by file extension and by MIME type as reported by libmagic
+EXTENSION_FORMATS: Dict[str, str] = {}
+MIME_FORMATS: Dict[str, str] = {}
+# Formats whose content libmagic can only identify as text
+TEXT_FORMATS = ("text", "csv", "json")
+# Formats whose text may come from OCR (see ocr_extraction)
+OCR_FORMATS = ("pdf", "image")
+
+# Characters read at a time when streaming plain text
+_TEXT_READ_SIZE = 64 * 1024
+# Rows read and rendered per segment for spreadsheets
+_TABLE_ROWS_PER_SEGMENT = 200
+# .xlsx files are ZIP archives; legacy .xls files are not
+_ZIP_SIGNATURE = b"PK\x03\x04"
+# Leading bytes inspected by libmagic
+_SNIFF_BYTES = 8192
+
+_extraction_pool = None
+_extraction_pool_lock = threading.Lock()
+_text_cache = None
+_text_cache_lock = threading.Lock()
+
+
+def register_extractor(format_name: str, extensions: Iterable[str] = (), mime_types: Iterable[str] = ()):
+    """
+    Decorator that registers a streaming text extractor for a document format.
+
+    Args:
+        format_name: The format's name (e.g. "pdf").
+        extensions: File extensions of the format (e.g. ".pdf").
+        mime_types: MIME types libmagic reports for the format's content.
+    """
+    def decorator(function: Callable[[bytes], Iterator[str]]):
+        EXTRACTORS[format_name] = function
+        for extension in extensions:
+            EXTENSION_FORMATS[extension] = format_name
+        for mime_type in mime_types:
+            MIME_FORMATS[mime_type] = format_name
+        return function
+    return decorator
+
+
+@register_extractor("text", extensions=[".txt", ".md"], mime_types=["text/plain"])
+def _iter_text(content: bytes) -> Iterator[str]:
+    reader = io.TextIOWrapper(io.BytesIO(content), encoding='utf-8')
+    while True:
+        segment = reader.read(_TEXT_READ_SIZE)
+        if not segment:
+            break
+        yield segment
+
+
+@register_extractor("pdf", extensions=[".pdf"], mime_types=["application/pdf"])
+def _iter_pdf_pages(content: bytes, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+    """Streams the text of each page; pages without a text layer (scans) are OCRed."""
+    for page_scan in _iter_pdf_page_scans(content, start, stop):
+        yield _ocr_scanned_pages([page_scan], _ocr_in_process)[0] + "\n"
+
+
+def _iter_pdf_page_scans(content: bytes, start: int = 0, stop: Optional[int] = None
+                         ) -> Iterator[Tuple[str, Optional[bytes]]]:
+    """Yields (text, scan) per page, where scan is the page's image when it has no text layer."""
+    reader = PdfReader(io.BytesIO(content))
+    for page in reader.pages[start:stop]:
+        text = page.extract_text() or ""
+        yield text, _ocr_extraction().scanned_page_image(page) if not text.strip() else None
+
+
+@register_extractor("image", extensions=[".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tif", ".tiff"], mime_types=[
+    "image/jpeg", "image/png", "image/gif", "image/bmp", "image/x-ms-bmp", "image/tiff"])
+def _iter_image_text(content: bytes) -> Iterator[str]:
+    """Streams the OCR text of an image (nothing when OCR_ENABLED is false)."""
+    if _ocr_extraction().OCR_ENABLED:
+        yield _ocr_images([content], _ocr_in_process)[0] + "\n"
+
+
+@register_extractor("excel", extensions=[".xls", ".xlsx"], mime_types=[
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "application/vnd.ms-excel"])
+def _iter_excel_rows(content: bytes) -> Iterator[str]:
+    """
+    Streams the first sheet as compact CSV lines in batches of rows. .xlsx files are
+    read row by row with openpyxl in read-only mode, so memory stays flat; legacy
+    .xls files, which openpyxl cannot read, are loaded with pandas.
+    """
+    if not content.startswith(_ZIP_SIGNATURE):
+        df = pd.read_excel(io.BytesIO(content), dtype=str, keep_default_na=False)
+        for start in range(0, len(df), _TABLE_ROWS_PER_SEGMENT):
+            yield df.iloc[start:start + _TABLE_ROWS_PER_SEGMENT].to_csv(index=False, header=start == 0)
+        return
+
+    workbook = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+    try:
+        rows = (_compact_row(row) for row in workbook.worksheets[0].iter_rows(values_only=True))
+        for batch in _batched((row for row in rows if row), _TABLE_ROWS_PER_SEGMENT):
+            buffer = io.StringIO()
+            csv.writer(buffer, lineterminator="\n").writerows(batch)
+            yield buffer.getvalue()
+    finally:
+        workbook.close()
+
+
+@register_extractor("csv", extensions=[".csv"], mime_types=["text/csv"])
+def _iter_csv_rows(content: bytes) -> Iterator[str]:
+    """Streams a CSV as compact CSV lines, parsed in batches of rows."""
+    first = True
+    for rows in pd.read_csv(io.BytesIO(content), chunksize=_TABLE_ROWS_PER_SEGMENT, dtype=str, keep_default_na=False):
+        yield rows.to_csv(index=False, header=first)
+        first = False
+
+
+def _compact_row(values: tuple) -> list:
+    """A spreadsheet row as strings, without the trailing empty cells read-only sheets pad rows with."""
+    row = ["" if value is None else str(value) for value in values]
+    while row and not row[-1].strip():
+        row.pop()
+    return row
+
+
+def _batched(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+@register_extractor("docx", extensions=[".doc", ".docx"], mime_types=[
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document"])
+def _iter_docx_paragraphs(content: bytes) -> Iterator[str]:
+    doc = docx.Document(io.BytesIO(content))
+    for paragraph in doc.paragraphs:
+        yield paragraph.text + "\n"
+
+
+@register_extractor("json", extensions=[".json"], mime_types=["application/json"])
+def _iter_json(content: bytes) -> Iterator[str]:
+    yield json.dumps(json.loads(content), indent=2)
+
+
+def _sniff_mime_type(content: bytes) -> Optional[str]:
+    """MIME type of the content according to libmagic, or None if it is unavailable."""
+    if magic is None:
+        return None
+    try:
+        return magic.from_buffer(content[:_SNIFF_BYTES], mime=True)
+    except Exception as e:
+        print(f"Could not detect document type: {e}")
+        return None
+
+
+def detect_format(content: bytes, file_extension: str = "") -> str:
+    """
+    Picks the extractor format for a document from its magic bytes, using the
+    file extension only where the content alone is ambiguous.
+
+    Binary formats (PDF, Excel, DOCX) are recognised by their signature whatever
+    the extension says. Text content keeps the text format its extension names
+    (CSV and JSON are often sniffed as plain text). Content libmagic cannot
+    identify (or generic ZIP/OLE containers) falls back to the extension.
+
+    Raises:
+        ValueError: If neither the content nor the extension maps to an extractor.
+    """
+    by_extension = EXTENSION_FORMATS.get(file_extension.lower())
+    mime_type = _sniff_mime_type(content)
+    by_content = MIME_FORMATS.get(mime_type)
+
+    if by_content is not None and by_content not in TEXT_FORMATS:
+        return by_content
+    if mime_type is not None and (mime_type.startswith("text/") or by_content is not None):
+        return by_extension if by_extension in TEXT_FORMATS else by_content or "text"
+    if by_extension is not None:
+        return by_extension
+    raise ValueError(f"Unsupported file type: {file_extension or mime_type}")
+
+
+def _cached_text(content: bytes, format_name: str) -> Tuple[Optional[TextCache], Optional[str], Optional[str]]:
+    """Returns (cache, document hash, cached text) for a document; the text is None on a miss."""
+    cache = get_text_cache()
+    if cache is None:
+        return None, None, None
+    document_hash = content_hash(content)
+    return cache, document_hash, cache.get(document_hash, _cache_key(format_name))
+
+
+def _cache_key(format_name: str) -> str:
+    if format_name in OCR_FORMATS and _ocr_extraction().OCR_ENABLED:
+        format_name += "+ocr"
+    return f"{format_name}:v{EXTRACTION_VERSION}"
+
+
+def _ocr_cache_key() -> str:
+    """Text cache key of a page's OCR text; the settings that change the text are part of it."""
+    ocr_extraction = _ocr_extraction()
+    return f"ocr:{ocr_extraction.OCR_LANGUAGES}:{ocr_extraction.OCR_MAX_DIMENSION}:v{EXTRACTION_VERSION}"
+
+
+def _ocr_extraction():
+    """
+    Imports ocr_extraction on first use. It loads OpenCV and pytesseract, so only
+    processes that handle images or PDFs pay for them, not every role that
+    imports this module.
+    """
+    import ocr_extraction
+    return ocr_extraction
+
+
+def _ocr_in_process(images: Sequence[bytes]) -> List[Optional[str]]:
+    ocr_page = _ocr_extraction().ocr_page
+    return [ocr_page(image) for image in images]
+
+
+def _ocr_images(images: Sequence[bytes], run_ocr: Callable[[Sequence[bytes]], List[Optional[str]]]) -> List[str]:
+    """
+    OCR text of each page image. Pages are looked up in the text cache by the
+    hash of their image, so a scan seen before (the same receipt in another
+    upload) is not OCRed again; run_ocr recognises the rest, in one batch.
+    Pages OCR fails on come back empty and are not cached.
+    """
+    if not images:
+        return []
+    cache = get_text_cache()
+    if cache is None:
+        return [text or "" for text in run_ocr(images)]
+    key = _ocr_cache_key()
+    hashes = [content_hash(image) for image in images]
+    texts = [cache.get(image_hash, key) for image_hash in hashes]
+    missing = [i for i, text in enumerate(texts) if text is None]
+    if missing:
+        for i, text in zip(missing, run_ocr([images[i] for i in missing])):
+            if text is not None:
+                cache.put(hashes[i], key, text)
+            texts[i] = text or ""
+    return texts
+
+
+def _ocr_scanned_pages(page_scans: Sequence[Tuple[str, Optional[bytes]]],
+                       run_ocr: Callable[[Sequence[bytes]], List[Optional[str]]]) -> List[str]:
+    """Text of each page, OCRed from its scan for pages without a text layer."""
+    texts = [text for text, _ in page_scans]
+    scanned = [i for i, (_, scan) in enumerate(page_scans) if scan is not None]
+    if scanned and _ocr_extraction().OCR_ENABLED:
+        for i, text in zip(scanned, _ocr_images([page_scans[i][1] for i in scanned], run_ocr)):
+            texts[i] = text
+    return texts
+
+
+def iter_document_text(content: bytes, file_extension: str) -> Iterator[str]:
+    """
+    Extracts text from a document incrementally, one page, paragraph or block of
+    rows at a time, so the full text never has to be held in memory. Text already
+    in the extracted text cache is streamed from there without parsing.
+
+    Args:
+        content: The raw document content in bytes
+        file_extension: The file extension (e.g., '.pdf', '.xlsx', etc.), used
+            when the content's format is ambiguous
+
+    Yields:
+        Consecutive text segments of the document
+    """
+    format_name = detect_format(content, file_extension)
+    _, _, text = _cached_text(content, format_name)
+    if text is not None:
+        return (text[i:i + _TEXT_READ_SIZE] for i in range(0, len(text), _TEXT_READ_SIZE))
+    return EXTRACTORS[format_name](content)
+
+
+def get_text_cache() -> Optional[TextCache]:
+    """
+    Returns the extracted text cache, opening it on first use so extraction
+    workers never open it. Returns None when TEXT_CACHE_ENABLED is false.
+    """
+    global _text_cache
+    if not TEXT_CACHE_ENABLED:
+        return None
+    with _text_cache_lock:
+        if _text_cache is None:
+            _text_cache = TextCache()
+        return _text_cache
+
+
+# --- Worker-side functions (run in the extraction processes) ---
+
+def _limit_worker_memory(memory_limit_mb: int):
+    """Pool initializer: caps the worker's address space so a hostile document raises MemoryError."""
+    if resource is not None and memory_limit_mb > 0:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _extract_segments(content: bytes, format_name: str) -> List[str]:
+    return list(EXTRACTORS[format_name](content))
+
+
+def _pdf_page_count(content: bytes) -> int:
+    return len(PdfReader(io.BytesIO(content)).pages)
+
+
+def _extract_pdf_pages(content: bytes, start: int, stop: Optional[int]) -> List[Tuple[str, Optional[bytes]]]:
+    """(text, scan) of each page in a range; scans are OCRed in separate tasks."""
+    return list(_iter_pdf_page_scans(content, start, stop))
+
+
+# --- Pool management ---
+
+def _get_extraction_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Returns the extraction process pool, starting it on first use.
+    Returns None when EXTRACTION_PROCESSES is 0.
+    """
+    global _extraction_pool
+    if EXTRACTION_PROCESSES <= 0:
+        return None
+    with _extraction_pool_lock:
+        if _extraction_pool is None:
+            print(f"Starting document extraction pool with {EXTRACTION_PROCESSES} processes.")
+            # forkserver workers do not inherit the server's threads (model, DB clients, locks)
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else None)
+            _extraction_pool = ProcessPoolExecutor(
+                max_workers=EXTRACTION_PROCESSES,
+                mp_context=context,
+                initializer=_limit_worker_memory,
+                initargs=(EXTRACTION_MEMORY_LIMIT_MB,),
+            )
+            atexit.register(stop_extraction_pool)
+        return _extraction_pool
+
+
+def _kill_extraction_pool(pool: ProcessPoolExecutor):
+    """
+    Kills the workers of a pool that is stuck on a document and discards it; the next
+    extraction starts a fresh pool. Documents in flight in the same pool are retried.
+    """
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is pool:
+            _extraction_pool = None
+    # ProcessPoolExecutor cannot cancel a running task, so terminate its processes
+    for process in list((getattr(pool, "_processes", None) or {}).values()):
+        process.kill()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def stop_extraction_pool():
+    """
+    Stops the extraction process pool if it was started.
+    """
+    global _extraction_pool
+    with _extraction_pool_lock:
+        pool, _extraction_pool = _extraction_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+        print("Document extraction pool stopped.")
+
+
+def _run_tasks(pool: ProcessPoolExecutor, function, tasks: List[tuple], deadline: float) -> list:
+    """Runs function over argument tuples in the pool and returns the results in order."""
+    futures = [pool.submit(function, *args) for args in tasks]
+    try:
+        return [future.result(timeout=max(0.0, deadline - time.monotonic())) for future in futures]
+    except FutureTimeoutError:
+        _kill_extraction_pool(pool)
+        raise TimeoutError("Document extraction timed out")
+
+
+def _extract_in_pool(pool: ProcessPoolExecutor, content: bytes, format_name: str, deadline: float) -> List[str]:
+    def run_ocr(images: Sequence[bytes]) -> List[Optional[str]]:
+        # One task per page, so the pages of a scanned document are OCRed in parallel
+        return _run_tasks(pool, _ocr_extraction().ocr_page, [(image,) for image in images], deadline)
+
+    if format_name == "image":
+        return [_ocr_images([content], run_ocr)[0] + "\n"] if _ocr_extraction().OCR_ENABLED else []
+    if format_name == "pdf":
+        ranges = [(content, 0, None)]
+        if EXTRACTION_PDF_PAGES_PER_TASK > 0:
+            pages = _run_tasks(pool, _pdf_page_count, [(content,)], deadline)[0]
+            step = EXTRACTION_PDF_PAGES_PER_TASK
+            ranges = [(content, start, min(start + step, pages)) for start in range(0, pages, step)]
+        page_scans = [page for page_range in _run_tasks(pool, _extract_pdf_pages, ranges, deadline)
+                      for page in page_range]
+        return [text + "\n" for text in _ocr_scanned_pages(page_scans, run_ocr)]
+    return _run_tasks(pool, _extract_segments, [(content, format_name)], deadline)[0]
+
+
+def extract_document_segments(content: bytes, file_extension: str, timeout: Optional[float] = None) -> List[str]:
+    """
+    Extracts the text of a document in the extraction process pool, so parsing
+    never runs on the caller's thread. Large PDFs are split into page ranges that
+    are extracted in parallel. Images and PDF pages without a text layer are
+    OCRed, one pool task per page. Results are cached by content hash, so a
+    document uploaded again is not parsed again.
+
+    Args:
+        content: The raw document content in bytes
+        file_extension: The file extension (e.g., '.pdf', '.xlsx', etc.), used
+            when the content's format is ambiguous
+        timeout: Seconds before extraction is abandoned (defaults to EXTRACTION_TIMEOUT).
+
+    Raises:
+        TimeoutError: If extraction takes longer than the timeout.
+        MemoryError: If a worker exceeds EXTRACTION_MEMORY_LIMIT_MB.
+        ValueError: If the file type is not supported.
+
+    Returns:
+        The extracted text as consecutive segments (pages, paragraphs or blocks of
+        rows), which callers can chunk without joining them into one string.
+    """
+    format_name = detect_format(content, file_extension)
+    cache, document_hash, text = _cached_text(content, format_name)
+    if text is not None:
+        return [text[i:i + _TEXT_READ_SIZE] for i in range(0, len(text), _TEXT_READ_SIZE)]
+    segments = _extract(content, format_name, EXTRACTION_TIMEOUT if timeout is None else timeout)
+    if cache is not None:
+        cache.put(document_hash, _cache_key(format_name), segments)
+    return segments
+
+
+def extract_document_text(content: bytes, file_extension: str, timeout: Optional[float] = None) -> str:
+    """
+    Extracts the full text of a document as one string; see extract_document_segments.
+    """
+    return "".join(extract_document_segments(content, file_extension, timeout))
+
+
+def _extract(content: bytes, format_name: str, timeout: float) -> List[str]:
+    deadline = time.monotonic() + timeout
+    for attempt in range(2):
+        pool = _get_extraction_pool()
+        if pool is None:
+            return _extract_segments(content, format_name)
+        try:
+            return _extract_in_pool(pool, content, format_name, deadline)
+        except BrokenProcessPool:
+            # A worker died (killed over a timeout or by the OOM killer); retry once in a fresh pool
+            _kill_extraction_pool(pool)
+            if attempt:
+                raise MemoryError("Document extraction worker died")
+            print("Document extraction pool broke; retrying in a fresh pool.")
+
+
+async def extract_document_text_async(content: bytes, file_extension: str, timeout: Optional[float] = None) -> str:
+    """
+    Awaitable extract_document_text: the event loop keeps serving other requests
+    while the document is parsed.
+    """
+    return await asyncio.to_thread(extract_document_text, content, file_extension, timeout)
@@ -0,0 +1,176 @@
+import os
+import re
+import time
+from typing import List, Union
+
+import numpy as np
+
+# Directory holding exported ONNX models and their tokenizers
+ONNX_MODEL_DIRECTORY = os.environ.get("ONNX_MODEL_DIRECTORY", "./embedding_models")
+# Intra-op threads for ONNX Runtime (0 lets ONNX Runtime use every core)
+ONNX_NUM_THREADS = int(os.environ.get("ONNX_NUM_THREADS", "0"))
+
+_ONNX_INPUTS = ["input_ids", "attention_mask", "token_type_ids"]
+
+
+class OnnxEmbeddingModel:
+    """
+    Runs a mean-pooled, normalized sentence embedding model through ONNX Runtime.
+
+    Exposes the subset of the SentenceTransformer `encode` interface used by
+    vector_db, so it can be swapped in for the torch model.
+    """
+
+    def __init__(self, model_path: str, tokenizer_directory: str, max_seq_length: int = 256):
+        # The tokenizers library is used directly so that torch is never imported
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        options = onnxruntime.SessionOptions()
+        if ONNX_NUM_THREADS > 0:
+            options.intra_op_num_threads = ONNX_NUM_THREADS
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(tokenizer_directory, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_seq_length)
+        if self.tokenizer.padding is None:
+            self.tokenizer.enable_padding()
+        self.max_seq_length = max_seq_length
+        self.model_path = model_path
+
+    def encode(self, texts: Union[str, List[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+
+        # Encode similar lengths together to keep padding to a minimum
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        results = [None] * len(texts)
+        for start in range(0, len(texts), batch_size):
+            batch_indexes = order[start:start + batch_size]
+            batch = [texts[i] for i in batch_indexes]
+            encodings = self.tokenizer.encode_batch(batch)
+            features = {
+                "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+                "attention_mask": np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64),
+                "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+            }
+            inputs = {name: features[name] for name in _ONNX_INPUTS if name in self.input_names}
+            token_embeddings = self.session.run(None, inputs)[0]
+
+            # Mean pooling over real tokens, then L2 normalisation
+            mask = features["attention_mask"][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            for i, vector in zip(batch_indexes, pooled):
+                results[i] = vector
+
+        if not results:
+            return np.empty((0, 0), dtype=np.float32)
+        embeddings = np.vstack(results).astype(np.float32)
+        return embeddings[0] if single else embeddings
+
+
+def _model_directory(model_name: str, model_directory: str) -> str:
+    return os.path.join(model_directory, re.sub(r'[^a-zA-Z0-9_.-]', '_', model_name))
+
+
+def export_onnx_model(model_name: str, model_directory: str = ONNX_MODEL_DIRECTORY) -> str:
+    """
+    Exports the transformer of a SentenceTransformer model to ONNX, along with
+    an int8 dynamically quantized copy and the tokenizer.
+
+    Only mean-pooled models (optionally normalized), such as all-MiniLM-L6-v2, are supported.
+
+    Returns:
+        The directory holding model.onnx, model_int8.onnx and the tokenizer files.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+
+    output_directory = _model_directory(model_name, model_directory)
+    os.makedirs(output_directory, exist_ok=True)
+
+    model = SentenceTransformer(model_name, device="cpu")
+    module_names = [type(module).__name__ for module in model]
+    pooling = model[1] if len(model) > 1 else None
+    if module_names[:2] != ["Transformer", "Pooling"] or getattr(pooling, "pooling_mode", "mean") != "mean":
+        raise ValueError(f"Unsupported model layout for ONNX export: {module_names}")
+
+    transformer = model[0]
+    transformer.tokenizer.save_pretrained(output_directory)
+
+    class _TokenEmbeddings(torch.nn.Module):
+        def __init__(self, auto_model):
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.auto_model(input_ids=input_ids, attention_mask=attention_mask,
+                                   token_type_ids=token_type_ids).last_hidden_state
+
+    sample = transformer.tokenizer(["warm-up text"], return_tensors="pt")
+    sample_inputs = tuple(sample.get(name, torch.zeros_like(sample["input_ids"])) for name in _ONNX_INPUTS)
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in _ONNX_INPUTS + ["last_hidden_state"]}
+
+    model_path = os.path.join(output_directory, "model.onnx")
+    torch.onnx.export(
+        _TokenEmbeddings(transformer.auto_model).eval(),
+        sample_inputs,
+        model_path,
+        input_names=_ONNX_INPUTS,
+        output_names=["last_hidden_state"],
+        dynamic_axes=dynamic_axes,
+        opset_version=17,
+        dynamo=False,
+    )
+    quantize_dynamic(model_path, os.path.join(output_directory, "model_int8.onnx"), weight_type=QuantType.QInt8)
+    with open(os.path.join(output_directory, "max_seq_length"), "w") as f:
+        f.write(str(transformer.max_seq_length))
+    print(f"Exported ONNX embedding model for {model_name} to {output_directory}.")
+    return output_directory
+
+
+def load_onnx_embedding_model(model_name: str, quantized: bool = False,
+                              model_directory: str = ONNX_MODEL_DIRECTORY) -> OnnxEmbeddingModel:
+    """
+    Loads the ONNX (or int8 quantized ONNX) version of a model, exporting it first if needed.
+    """
+    directory = _model_directory(model_name, model_directory)
+    file_name = "model_int8.onnx" if quantized else "model.onnx"
+    if not os.path.exists(os.path.join(directory, file_name)):
+        export_onnx_model(model_name, model_directory)
+
+    max_seq_length = 256
+    max_seq_length_path = os.path.join(directory, "max_seq_length")
+    if os.path.exists(max_seq_length_path):
+        with open(max_seq_length_path) as f:
+            max_seq_length = int(f.read().strip())
+    return OnnxEmbeddingModel(os.path.join(directory, file_name), directory, max_seq_length=max_seq_length)
+
+
+def check_embedding_parity(reference_model, candidate_model, texts: List[str], batch_size: int = 32) -> dict:
+    """
+    Compares two embedding models on the same texts by cosine similarity.
+
+    Returns:
+        Dictionary with the min/mean cosine agreement and each model's encode time.
+    """
+    start = time.perf_counter()
+    reference = np.asarray(reference_model.encode(texts, batch_size=batch_size), dtype=np.float32)
+    reference_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    candidate = np.asarray(candidate_model.encode(texts, batch_size=batch_size), dtype=np.float32)
+    candidate_seconds = time.perf_counter() - start
+
+    reference /= np.clip(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12, None)
+    candidate /= np.clip(np.linalg.norm(candidate, axis=1, keepdims=True), 1e-12, None)
+    cosines = (reference * candidate).sum(axis=1)
+    return {
+        "texts": len(texts),
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "reference_seconds": reference_seconds,
+        "candidate_seconds": candidate_seconds,
+    }
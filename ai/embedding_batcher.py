@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+# Longest time in milliseconds the first queued text waits for others to join its batch
+DEFAULT_EMBEDDING_BATCHER_MAX_WAIT_MS = float(os.environ.get("EMBEDDING_BATCHER_MAX_WAIT_MS", "5"))
+# Most texts encoded together in one batch
+DEFAULT_EMBEDDING_BATCHER_MAX_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCHER_MAX_BATCH_SIZE", "32"))
+
+
+class MicroBatcher:
+    """
+    Collects encode requests from concurrent callers and runs them as one batch
+    on a dedicated worker thread.
+
+    A batch is closed once it holds `max_batch_size` texts or its oldest text has
+    waited `max_wait_ms`, whichever comes first; `encode` is then called once for
+    the whole batch and each caller's future is resolved with its own result. If
+    `encode` raises, every future of the batch gets the exception. The worker
+    thread starts on the first submit.
+    """
+
+    def __init__(self, encode: Callable[[List[str]], list],
+                 max_batch_size: int = DEFAULT_EMBEDDING_BATCHER_MAX_BATCH_SIZE,
+                 max_wait_ms: float = DEFAULT_EMBEDDING_BATCHER_MAX_WAIT_MS, name: str = "embedding-batcher"):
+        self.encode_batch = encode
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max_wait_ms
+        self.name = name
+        # (text, future, enqueue time) in arrival order
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._stats = {
+            "batches": 0,
+            "items": 0,
+            "largest_batch": 0,
+            "max_queue_depth": 0,
+            "queue_wait_seconds": 0.0,
+            "encode_seconds": 0.0,
+            "errors": 0,
+        }
+
+    def submit(self, texts: List[str]) -> List[Future]:
+        """
+        Queues texts for encoding and returns one future per text, resolved with its embedding.
+
+        Raises:
+            RuntimeError: If the batcher has been stopped.
+        """
+        futures = [Future() for _ in texts]
+        now = time.monotonic()
+        with self._condition:
+            if self._stopping:
+                raise RuntimeError("Embedding batcher is stopped")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._pending.extend((text, future, now) for text, future in zip(texts, futures))
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], len(self._pending))
+            self._condition.notify()
+        return futures
+
+    def encode(self, texts: List[str], timeout: Optional[float] = None) -> list:
+        """
+        Encodes texts in the shared batches and waits for the results, in input order.
+        """
+        return [future.result(timeout) for future in self.submit(texts)]
+
+    def _next_batch(self) -> Optional[list]:
+        """Blocks until a batch is ready and dequeues it; returns None once stopped and drained."""
+        with self._condition:
+            while not self._pending and not self._stopping:
+                self._condition.wait()
+            if not self._pending:
+                return None
+            deadline = self._pending[0][2] + self.max_wait_ms / 1000
+            while len(self._pending) < self.max_batch_size and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return [self._pending.popleft() for _ in range(min(len(self._pending), self.max_batch_size))]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            started = time.monotonic()
+            try:
+                results = self.encode_batch([text for text, _, _ in batch])
+            except Exception as e:
+                self._stats["errors"] += 1
+                for _, future, _ in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+            self._stats["batches"] += 1
+            self._stats["items"] += len(batch)
+            self._stats["largest_batch"] = max(self._stats["largest_batch"], len(batch))
+            self._stats["queue_wait_seconds"] += sum(started - enqueued for _, _, enqueued in batch)
+            self._stats["encode_seconds"] += time.monotonic() - started
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Encodes whatever is still queued, then stops the worker thread. Later submits raise.
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def queue_depth(self) -> int:
+        with self._condition:
+            return len(self._pending)
+
+    def stats(self) -> dict:
+        batches = self._stats["batches"]
+        items = self._stats["items"]
+        return {
+            "queue_depth": self.queue_depth(),
+            "max_queue_depth": self._stats["max_queue_depth"],
+            "batches": batches,
+            "items": items,
+            "mean_batch_size": items / batches if batches else 0.0,
+            "largest_batch": self._stats["largest_batch"],
+            "mean_queue_wait_ms": 1000 * self._stats["queue_wait_seconds"] / items if items else 0.0,
+            "mean_encode_ms": 1000 * self._stats["encode_seconds"] / batches if batches else 0.0,
+            "errors": self._stats["errors"],
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "running": self._thread is not None and self._thread.is_alive(),
+        }
@@ -0,0 +1,78 @@
+import hashlib
+import os
+from typing import List, Optional
+
+import numpy as np
+
+from sqlite_cache import SQLiteLRUCache
+
+# Default on-disk location of the embedding cache
+DEFAULT_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "./embedding_cache/embeddings.sqlite3")
+# Maximum number of cached embeddings before least-recently-used entries are evicted
+DEFAULT_MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+# SQLite limits the number of bound parameters per statement
+_SQL_BATCH = 500
+
+
+def text_hash(text: str) -> str:
+    """
+    Returns the content hash used to key a chunk of text.
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache(SQLiteLRUCache):
+    """
+    Persistent, content-addressed embedding cache backed by SQLite.
+
+    Entries are keyed by (model name, SHA-256 of the text) and stored as float32
+    blobs. Once more than `max_entries` embeddings are stored the least recently
+    used ones are evicted.
+    """
+
+    TABLE = "embeddings"
+    KEY_COLUMNS = ("model", "text_hash")
+    VALUE_COLUMN = "vector"
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        super().__init__(path, max_entries)
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Looks up embeddings for the given texts.
+
+        Returns:
+            A list aligned with `texts`, holding the cached embedding or None for a miss.
+        """
+        hashes = [text_hash(text) for text in texts]
+        found = {}
+        with self._lock:
+            unique = list(dict.fromkeys(hashes))
+            for start in range(0, len(unique), _SQL_BATCH):
+                batch = unique[start:start + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                self._touch((model, key) for key in found)
+                self._conn.commit()
+
+            results = [found.get(key) for key in hashes]
+            hit_count = sum(1 for result in results if result is not None)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+        return results
+
+    def put_many(self, model: str, texts: List[str], embeddings: List[List[float]]):
+        """
+        Stores embeddings for the given texts and evicts old entries if over capacity.
+        """
+        self._put_rows(
+            (model, text_hash(text), np.asarray(embedding, dtype=np.float32).tobytes())
+            for text, embedding in zip(texts, embeddings)
+        )
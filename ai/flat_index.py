@@ -0,0 +1,312 @@
+import json
+import os
+import shutil
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Directory, inside a DB directory, holding the flat exact-search index
+FLAT_INDEX_DIRECTORY = "flat_index"
+# Storage precision of flat index embeddings: "float32", "bfloat16" (the upper half of each
+# float32, 2x smaller) or "int8" (scalar-quantized with a float32 scale per vector, ~4x smaller)
+FLAT_INDEX_DTYPE = os.environ.get("FLAT_INDEX_DTYPE", "float32").lower()
+FLAT_INDEX_DTYPES = ("float32", "bfloat16", "int8")
+# Compressed indexes rank this many candidates per requested result, then rescore them
+# with exact float32 embeddings when the caller can supply them (0 disables rescoring)
+FLAT_INDEX_RESCORE_MULTIPLIER = int(os.environ.get("FLAT_INDEX_RESCORE_MULTIPLIER", "4"))
+# Distance spaces of ChromaDB collections; the flat index reports distances in the
+# space of the collection it was exported from
+DISTANCE_SPACES = ("l2", "cosine", "ip")
+
+_EMBEDDINGS_FILE = "embeddings.npy"
+_SCALES_FILE = "scales.npy"
+# Stored embeddings converted to float32 at a time while scoring, so compressed indexes
+# are never expanded to a full float32 copy per query
+_SCORE_BLOCK_ROWS = 1024
+_CHUNKS_FILE = "chunks.json"
+_COMPARISONS = {
+    "$eq": lambda value, target: value == target,
+    "$ne": lambda value, target: value != target,
+    "$in": lambda value, target: value in target,
+    "$nin": lambda value, target: value not in target,
+    "$gt": lambda value, target: value is not None and value > target,
+    "$gte": lambda value, target: value is not None and value >= target,
+    "$lt": lambda value, target: value is not None and value < target,
+    "$lte": lambda value, target: value is not None and value <= target,
+}
+
+
+class UnsupportedFilter(ValueError):
+    """Raised for metadata filters the flat index cannot evaluate."""
+
+
+def similarity_to_distance(similarity: float, space: str = "l2") -> float:
+    """
+    Converts the cosine similarity of two normalised vectors to the distance
+    ChromaDB reports in the given space: squared L2 (2 - 2 * cosine) for "l2",
+    1 - cosine for "cosine" and "ip".
+    """
+    return float(2 - 2 * similarity) if space == "l2" else float(1 - similarity)
+
+
+def matches_where(metadata: dict, where: Optional[dict]) -> bool:
+    """
+    Evaluates a ChromaDB-style metadata filter ($and/$or and field comparisons) against one chunk.
+    """
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif key.startswith("$"):
+            raise UnsupportedFilter(f"Unsupported filter operator: {key}")
+        elif isinstance(condition, dict):
+            for operator, target in condition.items():
+                if operator not in _COMPARISONS:
+                    raise UnsupportedFilter(f"Unsupported filter operator: {operator}")
+                try:
+                    if not _COMPARISONS[operator](metadata.get(key), target):
+                        return False
+                except TypeError:
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+def to_bfloat16(vectors: np.ndarray) -> np.ndarray:
+    """
+    Rounds float32 vectors to bfloat16, returned as the uint16 upper halves of their
+    float32 bit patterns. Unlike float16, widening them back (see _widen) is an
+    integer shift, which NumPy vectorizes, so scanning them stays fast.
+    """
+    bits = np.ascontiguousarray(vectors, dtype=np.float32).view(np.uint32)
+    # Round to nearest, ties to even
+    return ((bits + 0x7FFF + ((bits >> 16) & 1)) >> 16).astype(np.uint16)
+
+
+def _widen(vectors: np.ndarray) -> np.ndarray:
+    """Returns stored embeddings (float32, bfloat16 halves or int8 codes) as a float32 array."""
+    if vectors.dtype == np.uint16:
+        bits = vectors.astype(np.uint32)
+        bits <<= 16
+        return bits.view(np.float32)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Scalar-quantizes vectors to int8 with one symmetric scale per vector, so that
+    vectors[i] ~= codes[i] * scales[i].
+
+    Returns:
+        (codes, scales) as int8 and float32 arrays.
+    """
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class FlatIndex:
+    """
+    Exact nearest-neighbour index for small collections.
+
+    Normalized embeddings live in a memory-mapped .npy file and chunk ids, texts and
+    metadata in a compact JSON file next to it. Queries are answered with one
+    vectorized dot product and argpartition, with no index structures to open.
+
+    Embeddings may be stored as bfloat16 or as int8 codes with a per-vector scale
+    (see FLAT_INDEX_DTYPE). Queries then scan only the compressed codes, a block
+    of rows at a time, and their scores are approximate; search_many can rescore
+    the top candidates with exact embeddings supplied by the caller.
+    """
+
+    def __init__(self, directory: str, embeddings: np.ndarray, ids: List[str], documents: List[str],
+                 metadatas: List[dict], scales: Optional[np.ndarray] = None, space: str = "l2"):
+        self.directory = directory
+        self.embeddings = embeddings
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        # Per-vector scales of int8 embeddings (None for float embeddings)
+        self.scales = scales
+        # Distance space of the source collection, one of DISTANCE_SPACES
+        self.space = space
+        # Row of each chunk id, built on first use by vectors()
+        self._rows = None
+
+    @staticmethod
+    def path(db_directory: str) -> str:
+        return os.path.join(db_directory, FLAT_INDEX_DIRECTORY)
+
+    @classmethod
+    def exists(cls, db_directory: str) -> bool:
+        return os.path.exists(os.path.join(cls.path(db_directory), _CHUNKS_FILE))
+
+    @classmethod
+    def build(cls, db_directory: str, ids: List[str], embeddings, documents: List[str], metadatas: List[dict],
+              dtype: Optional[str] = None, space: str = "l2") -> "FlatIndex":
+        """
+        Writes a flat index for the given chunks, replacing any existing one.
+
+        Args:
+            dtype: One of FLAT_INDEX_DTYPES; defaults to FLAT_INDEX_DTYPE.
+            space: Distance space search results are reported in, one of DISTANCE_SPACES.
+        """
+        dtype = (dtype or FLAT_INDEX_DTYPE).lower()
+        if dtype not in FLAT_INDEX_DTYPES:
+            raise ValueError(f"Unknown flat index dtype '{dtype}', expected one of {FLAT_INDEX_DTYPES}")
+        if space not in DISTANCE_SPACES:
+            raise ValueError(f"Unknown distance space '{space}', expected one of {DISTANCE_SPACES}")
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+        directory = cls.path(db_directory)
+        staging = directory + ".tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        if dtype == "int8":
+            codes, scales = quantize_int8(vectors)
+            np.save(os.path.join(staging, _EMBEDDINGS_FILE), codes)
+            np.save(os.path.join(staging, _SCALES_FILE), scales)
+        elif dtype == "bfloat16":
+            np.save(os.path.join(staging, _EMBEDDINGS_FILE), to_bfloat16(vectors))
+        else:
+            np.save(os.path.join(staging, _EMBEDDINGS_FILE), vectors)
+        with open(os.path.join(staging, _CHUNKS_FILE), "w", encoding="utf-8") as f:
+            json.dump({"ids": ids, "documents": documents, "metadatas": [m or {} for m in metadatas],
+                       "space": space}, f, separators=(",", ":"))
+        # Swap the finished index in with a rename so readers never see a partial one
+        shutil.rmtree(directory, ignore_errors=True)
+        os.rename(staging, directory)
+        return cls.load(db_directory)
+
+    @classmethod
+    def load(cls, db_directory: str) -> "FlatIndex":
+        directory = cls.path(db_directory)
+        with open(os.path.join(directory, _CHUNKS_FILE), encoding="utf-8") as f:
+            chunks = json.load(f)
+        embeddings = np.load(os.path.join(directory, _EMBEDDINGS_FILE), mmap_mode="r")
+        scales = None
+        if os.path.exists(os.path.join(directory, _SCALES_FILE)):
+            scales = np.load(os.path.join(directory, _SCALES_FILE), mmap_mode="r")
+        return cls(db_directory, embeddings, chunks["ids"], chunks["documents"], chunks["metadatas"], scales,
+                   chunks.get("space", "l2"))
+
+    @classmethod
+    def remove(cls, db_directory: str):
+        shutil.rmtree(cls.path(db_directory), ignore_errors=True)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def compressed(self) -> bool:
+        """True if embeddings are stored with less than float32 precision."""
+        return self.embeddings.dtype != np.float32
+
+    @property
+    def dtype(self) -> str:
+        """The storage precision, one of FLAT_INDEX_DTYPES."""
+        return "bfloat16" if self.embeddings.dtype == np.uint16 else self.embeddings.dtype.name
+
+    def stored_as(self, dtype: Optional[str] = None) -> bool:
+        """True if embeddings are stored with the given precision (defaults to FLAT_INDEX_DTYPE)."""
+        return self.dtype == (dtype or FLAT_INDEX_DTYPE).lower()
+
+    def vectors(self, chunk_ids: List[str]) -> np.ndarray:
+        """
+        Returns the stored embeddings of chunks as float32 rows, in the order of
+        chunk_ids (normalised; approximate for compressed indexes).
+        """
+        if self._rows is None:
+            self._rows = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        rows = [self._rows[chunk_id] for chunk_id in chunk_ids]
+        vectors = _widen(self.embeddings[rows])
+        if self.scales is not None:
+            vectors *= np.asarray(self.scales[rows], dtype=np.float32)[:, None]
+        return vectors
+
+    def bytes_per_vector(self) -> int:
+        """Bytes stored, and scanned by each query, per vector: the codes plus the int8 scale."""
+        return self.embeddings.shape[1] * self.embeddings.dtype.itemsize + (4 if self.scales is not None else 0)
+
+    def search_many(self, query_embeddings, n_results: int, where: Optional[dict] = None,
+                    rescore: Optional[Callable[[List[str]], Sequence]] = None,
+                    rescore_multiplier: Optional[int] = None) -> List[List[Tuple[str, str, dict, float]]]:
+        """
+        Finds the closest chunks to each query by cosine similarity.
+
+        Args:
+            rescore: For compressed indexes, a function returning the exact float
+                embeddings of a list of chunk ids. The top n_results * rescore_multiplier
+                candidates are then re-ranked by their exact similarity.
+            rescore_multiplier: Defaults to FLAT_INDEX_RESCORE_MULTIPLIER (0 disables rescoring).
+
+        Raises:
+            UnsupportedFilter: If `where` uses an operator the flat index does not implement.
+
+        Returns:
+            (chunk id, text, metadata, distance) tuples for each query, best first. The
+            distance is the one ChromaDB reports in the index's space (see
+            similarity_to_distance), e.g. 2 - 2 * cosine for the default "l2" space.
+        """
+        if rescore_multiplier is None:
+            rescore_multiplier = FLAT_INDEX_RESCORE_MULTIPLIER
+        if rescore is None or not self.compressed or rescore_multiplier <= 0:
+            return self._search(query_embeddings, n_results, where)
+
+        candidates = self._search(query_embeddings, n_results * rescore_multiplier, where)
+        ids = list(dict.fromkeys(hit[0] for hits in candidates for hit in hits))
+        if not ids:
+            return candidates
+        exact = np.asarray(rescore(ids), dtype=np.float32).reshape(len(ids), -1)
+        exact /= np.clip(np.linalg.norm(exact, axis=1, keepdims=True), 1e-12, None)
+        rows = {chunk_id: row for row, chunk_id in enumerate(ids)}
+
+        queries = np.array(query_embeddings, dtype=np.float32)
+        queries /= np.clip(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12, None)
+        results = []
+        for query, hits in zip(queries, candidates):
+            scores = exact[[rows[hit[0]] for hit in hits]] @ query if hits else np.zeros(0, dtype=np.float32)
+            order = np.argsort(-scores, kind="stable")[:n_results]
+            results.append([hits[i][:3] + (similarity_to_distance(scores[i], self.space),) for i in order])
+        return results
+
+    def _search(self, query_embeddings, n_results: int,
+                where: Optional[dict] = None) -> List[List[Tuple[str, str, dict, float]]]:
+        """Ranks chunks by the similarity to their stored (possibly compressed) embeddings."""
+        if len(self.ids) == 0:
+            return [[] for _ in query_embeddings]
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries /= np.clip(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12, None)
+
+        candidates = np.arange(len(self.ids))
+        if where:
+            candidates = np.array([i for i in candidates if matches_where(self.metadatas[i], where)], dtype=np.int64)
+            if len(candidates) == 0:
+                return [[] for _ in query_embeddings]
+            vectors = self.embeddings[candidates]
+            scales = self.scales[candidates] if self.scales is not None else None
+        else:
+            vectors = self.embeddings
+            scales = self.scales
+
+        scores = np.empty((len(queries), len(candidates)), dtype=np.float32)
+        for start in range(0, len(candidates), _SCORE_BLOCK_ROWS):
+            scores[:, start:start + _SCORE_BLOCK_ROWS] = queries @ _widen(vectors[start:start + _SCORE_BLOCK_ROWS]).T
+        if scales is not None:
+            scores *= np.asarray(scales, dtype=np.float32)
+        k = min(n_results, scores.shape[1])
+        results = []
+        for row in scores:
+            top = np.argpartition(-row, k - 1)[:k] if k < len(row) else np.arange(len(row))
+            top = top[np.argsort(-row[top], kind="stable")]
+            results.append([(self.ids[candidates[i]], self.documents[candidates[i]], self.metadatas[candidates[i]],
+                             similarity_to_distance(row[i], self.space)) for i in top])
+        return results
@@ -0,0 +1,31 @@
+"""
+Migrates per-document ChromaDB directories into the shared collection.
+
+Usage:
+    python migrate_vector_dbs.py ./chroma_db_report.txt_1234 --bucket data-storage --tenant acme
+    python migrate_vector_dbs.py ./chroma_db_* --delete-source
+"""
+import argparse
+
+from vector_db import migrate_directory_to_shared
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate per-document vector DBs into the shared collection")
+    parser.add_argument("directories", nargs="+", help="Per-document DB directories to migrate")
+    parser.add_argument("--bucket", help="Bucket to tag the migrated chunks with")
+    parser.add_argument("--tenant", help="Tenant to tag the migrated chunks with")
+    parser.add_argument("--delete-source", action="store_true", help="Delete each directory after migrating it")
+    args = parser.parse_args()
+
+    for db_directory in args.directories:
+        try:
+            shared_name = migrate_directory_to_shared(db_directory, bucket=args.bucket, tenant=args.tenant,
+                                                      delete_source=args.delete_source)
+            print(f"{db_directory} -> {shared_name}")
+        except Exception as e:
+            print(f"Error migrating {db_directory}: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import io
+import os
+from typing import List, Optional
+
+import cv2
+import numpy as np
+import pytesseract
+from PIL import Image, ImageSequence
+
+# Run OCR on image documents and on PDF pages that have no text layer
+OCR_ENABLED = os.environ.get("OCR_ENABLED", "true").lower() == "true"
+# Longest side in pixels an image is downscaled to before OCR (0 = never downscale)
+OCR_MAX_DIMENSION = int(os.environ.get("OCR_MAX_DIMENSION", "2000"))
+# Tesseract language codes, e.g. "eng" or "eng+hin"
+OCR_LANGUAGES = os.environ.get("OCR_LANGUAGES", "eng")
+# Seconds tesseract may spend on one page before it is abandoned (0 = no limit)
+OCR_PAGE_TIMEOUT = float(os.environ.get("OCR_PAGE_TIMEOUT", "60"))
+
+if os.environ.get("TESSERACT_CMD"):
+    pytesseract.pytesseract.tesseract_cmd = os.environ["TESSERACT_CMD"]
+
+
+def prepare_image(image: Image.Image, max_dimension: Optional[int] = None) -> np.ndarray:
+    """
+    Converts an image to the grayscale array tesseract reads, downscaled so its
+    longest side is at most max_dimension (defaults to OCR_MAX_DIMENSION). Phone
+    photos of receipts are often 4000px or more, far beyond what OCR needs, and
+    tesseract's time grows with the pixel count.
+    """
+    if max_dimension is None:
+        max_dimension = OCR_MAX_DIMENSION
+    gray = np.asarray(image.convert("L"))
+    longest = max(gray.shape)
+    if max_dimension > 0 and longest > max_dimension:
+        scale = max_dimension / longest
+        size = (max(1, round(gray.shape[1] * scale)), max(1, round(gray.shape[0] * scale)))
+        gray = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+    return gray
+
+
+def ocr_image(content: bytes) -> str:
+    """
+    Recognises the text of an image, one block of text per frame (multi-page
+    TIFF scans have several).
+
+    Raises:
+        pytesseract.TesseractError: If tesseract fails or times out.
+        PIL.UnidentifiedImageError: If the content is not an image.
+    """
+    with Image.open(io.BytesIO(content)) as image:
+        frames = [prepare_image(frame) for frame in ImageSequence.Iterator(image)]
+    return "\n".join(
+        pytesseract.image_to_string(frame, lang=OCR_LANGUAGES, timeout=OCR_PAGE_TIMEOUT).strip()
+        for frame in frames
+    )
+
+
+def ocr_page(content: bytes) -> Optional[str]:
+    """
+    ocr_image for one page of a document: returns None instead of raising, so one
+    unreadable page (or a missing tesseract binary) does not fail the whole document.
+    """
+    try:
+        return ocr_image(content)
+    except Exception as e:
+        print(f"OCR failed for page: {e}")
+        return None
+
+
+def scanned_page_image(page) -> Optional[bytes]:
+    """
+    Returns the encoded bytes of the largest image on a PyPDF2 page, which for a
+    scanned page is the scan itself, or None if the page has no readable image.
+    """
+    try:
+        images: List = list(page.images)
+    except Exception as e:
+        print(f"Could not read images of PDF page: {e}")
+        return None
+    if not images:
+        return None
+    return max(images, key=lambda image: len(image.data)).data
@@ -0,0 +1,120 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, Tuple
+
+# Fraction of max_entries evicted beyond the excess, so that a full cache does not
+# have to count and evict its rows again on every put
+_EVICTION_SLACK = 0.01
+
+
+class SQLiteLRUCache:
+    """
+    Persistent least-recently-used cache backed by one SQLite table.
+
+    Subclasses name the table, its key columns and its BLOB value column, and
+    implement their own lookups on top of the helpers here. Every row records
+    when it was last read or written; once more than `max_entries` rows are
+    stored the least recently used ones are evicted, along with another
+    _EVICTION_SLACK of the capacity.
+
+    The row count is kept in memory, so puts never count the table. It only
+    covers this process's writes, and the table is counted again whenever the
+    tracked count goes over capacity.
+    """
+
+    # Table name, key column names and value column name, set by subclasses
+    TABLE: str = ""
+    KEY_COLUMNS: Tuple[str, ...] = ()
+    VALUE_COLUMN: str = ""
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        keys = "".join(f"{column} TEXT NOT NULL, " for column in self.KEY_COLUMNS)
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.TABLE} ({keys}{self.VALUE_COLUMN} BLOB NOT NULL, "
+            f"last_access REAL NOT NULL, PRIMARY KEY ({', '.join(self.KEY_COLUMNS)}))"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.TABLE}_last_access ON {self.TABLE}(last_access)")
+        self._conn.commit()
+        self._count = self._conn.execute(f"SELECT COUNT(*) FROM {self.TABLE}").fetchone()[0]
+
+    def _key_condition(self) -> str:
+        return " AND ".join(f"{column} = ?" for column in self.KEY_COLUMNS)
+
+    def _touch(self, keys: Iterable[tuple]):
+        """Marks rows as just used. Caller holds the lock and commits."""
+        now = time.time()
+        self._conn.executemany(
+            f"UPDATE {self.TABLE} SET last_access = ? WHERE {self._key_condition()}",
+            [(now, *key) for key in keys],
+        )
+
+    def _put_rows(self, rows: Iterable[tuple]):
+        """Stores (*key, value) rows and evicts old entries if over capacity."""
+        now = time.time()
+        columns = ", ".join((*self.KEY_COLUMNS, self.VALUE_COLUMN, "last_access"))
+        placeholders = ", ".join("?" * (len(self.KEY_COLUMNS) + 2))
+        insert = f"INSERT OR IGNORE INTO {self.TABLE} ({columns}) VALUES ({placeholders})"
+        update = f"UPDATE {self.TABLE} SET {self.VALUE_COLUMN} = ?, last_access = ? WHERE {self._key_condition()}"
+        with self._lock:
+            for row in rows:
+                # Inserting and updating separately tells new rows, which grow the count, from replaced ones
+                if self._conn.execute(insert, (*row, now)).rowcount:
+                    self._count += 1
+                else:
+                    self._conn.execute(update, (row[-1], now, *row[:-1]))
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Deletes least-recently-used entries beyond max_entries. Caller holds the lock."""
+        if self._count <= self.max_entries:
+            return
+        # Other processes sharing the file may have added or evicted rows; count them once here
+        self._count = self._conn.execute(f"SELECT COUNT(*) FROM {self.TABLE}").fetchone()[0]
+        excess = self._count - self.max_entries
+        if excess > 0:
+            deleted = self._conn.execute(
+                f"DELETE FROM {self.TABLE} WHERE rowid IN "
+                f"(SELECT rowid FROM {self.TABLE} ORDER BY last_access ASC LIMIT ?)",
+                (excess + int(self.max_entries * _EVICTION_SLACK),),
+            ).rowcount
+            self._count -= deleted
+            self.evictions += deleted
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.TABLE}")
+            self._conn.commit()
+            self._count = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
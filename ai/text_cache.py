@@ -0,0 +1,61 @@
+import hashlib
+import os
+import zlib
+from typing import Iterable, Optional, Union
+
+from sqlite_cache import SQLiteLRUCache
+
+# Default on-disk location of the extracted text cache
+DEFAULT_TEXT_CACHE_PATH = os.environ.get("TEXT_CACHE_PATH", "./embedding_cache/texts.sqlite3")
+# Maximum number of cached documents before least-recently-used entries are evicted
+DEFAULT_TEXT_CACHE_MAX_ENTRIES = int(os.environ.get("TEXT_CACHE_MAX_ENTRIES", "1000"))
+
+
+def content_hash(content: bytes) -> str:
+    """
+    Returns the content hash used to key a document's extracted text.
+    """
+    return hashlib.sha256(content).hexdigest()
+
+
+class TextCache(SQLiteLRUCache):
+    """
+    Persistent cache of extracted document text backed by SQLite.
+
+    Entries are keyed by (SHA-256 of the document bytes, extractor key) and stored
+    zlib-compressed. Once more than `max_entries` documents are stored the least
+    recently used ones are evicted.
+    """
+
+    TABLE = "texts"
+    KEY_COLUMNS = ("content_hash", "extractor")
+    VALUE_COLUMN = "text"
+
+    def __init__(self, path: str = DEFAULT_TEXT_CACHE_PATH, max_entries: int = DEFAULT_TEXT_CACHE_MAX_ENTRIES):
+        super().__init__(path, max_entries)
+
+    def get(self, document_hash: str, extractor: str) -> Optional[str]:
+        """
+        Returns the cached text of a document, or None on a miss.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text FROM texts WHERE content_hash = ? AND extractor = ?", (document_hash, extractor)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._touch([(document_hash, extractor)])
+            self._conn.commit()
+            self.hits += 1
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def put(self, document_hash: str, extractor: str, text: Union[str, Iterable[str]]):
+        """
+        Stores the text of a document, given whole or as consecutive segments, and
+        evicts old entries if over capacity. Segments are compressed one at a time.
+        """
+        compressor = zlib.compressobj(1)
+        segments = [text] if isinstance(text, str) else text
+        compressed = b"".join(compressor.compress(segment.encode("utf-8")) for segment in segments) + compressor.flush()
+        self._put_rows([(document_hash, extractor, compressed)])
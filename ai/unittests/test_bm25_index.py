@@ -0,0 +1,76 @@
+"""
+Tests for the persistent BM25 keyword index.
+"""
+import shutil
+import tempfile
+import unittest
+
+from bm25_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+class TestBM25Index(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="bm25_index_test_")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_tokenize_keeps_identifiers_and_amounts(self):
+        """Invoice numbers, amounts and dates stay single tokens"""
+        self.assertEqual(tokenize("Invoice INV-00042 for 1,200.50 INR on 2024-03-20."),
+                         ["invoice", "inv-00042", "for", "1,200.50", "inr", "on", "2024-03-20"])
+
+    def test_exact_token_ranks_first_and_persists(self):
+        """Chunks with the exact query token rank first, also after reopening"""
+        index = BM25Index(self.directory)
+        index.add(["a", "b", "c"], ["Invoice INV-00042 from Acme", "Invoice INV-00043 from Acme",
+                                    "Hotel stay in Pune"])
+        self.assertEqual(index.search("INV-00043")[0][0], "b")
+        index.close()
+
+        reopened = BM25Index(self.directory)
+        self.addCleanup(reopened.close)
+        self.assertEqual(len(reopened), 3)
+        self.assertEqual([chunk_id for chunk_id, _ in reopened.search("acme invoice")], ["a", "b"])
+
+    def test_incremental_delete_by_doc_key(self):
+        """Deleting a document's chunks removes them from results"""
+        index = BM25Index(self.directory)
+        self.addCleanup(index.close)
+        index.add(["hotel_0"], ["Taxi fare 300 INR"], doc_key="hotel")
+        index.add(["trip_0"], ["Taxi fare 450 INR"], doc_key="trip")
+        self.assertEqual([chunk_id for chunk_id, _ in index.search("taxi", doc_key="trip")], ["trip_0"])
+
+        index.delete(doc_key="trip")
+        self.assertEqual([chunk_id for chunk_id, _ in index.search("taxi")], ["hotel_0"])
+
+    def test_corpus_statistics_follow_adds_deletes_and_replacements(self):
+        """The stored chunk count and total length match the chunks table after every change"""
+        index = BM25Index(self.directory)
+        self.addCleanup(index.close)
+        stats = lambda: index._conn.execute("SELECT chunk_count, total_length FROM stats").fetchone()
+        actual = lambda: index._conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks").fetchone()
+
+        index.add(["a", "b"], ["taxi fare 300 inr", "hotel"], doc_key="trip")
+        index.add(["b", "c"], ["hotel stay in pune", "meals"])
+        self.assertEqual(stats(), (3, 9))
+        index.delete(["a", "missing"])
+        self.assertEqual(stats(), actual())
+        index.delete(doc_key="trip")
+        self.assertEqual((len(index), stats()), (2, actual()))
+
+        # Indexes written before the stats table existed are counted once when opened
+        index._conn.execute("DROP TABLE stats")
+        index._conn.commit()
+        reopened = BM25Index(self.directory)
+        self.addCleanup(reopened.close)
+        self.assertEqual(len(reopened), 2)
+
+    def test_reciprocal_rank_fusion(self):
+        """Items ranked well by several retrievers come first"""
+        fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]])
+        self.assertEqual([item for item, _ in fused], ["b", "a", "d", "c"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+"""
+Tests for the /chat endpoint.
+"""
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import vector_db
+import waitress_server
+from waitress_server import app
+import document_extraction
+from embedding_batcher import MicroBatcher
+from embedding_cache import EmbeddingCache
+from text_cache import TextCache
+from search_cache import LRUCache
+from unittests.test_vector_db import FakeEmbeddingModel
+
+
+class TestChatEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        self.root = tempfile.mkdtemp(prefix="chat_test_")
+        self.cache = EmbeddingCache(os.path.join(self.root, "embeddings.sqlite3"))
+        self.addCleanup(self.cache.close)
+        self.text_cache = TextCache(os.path.join(self.root, "texts.sqlite3"))
+        self.addCleanup(self.text_cache.close)
+
+        patches = [
+            patch.object(document_extraction, '_text_cache', self.text_cache),
+            patch.object(vector_db, 'embedding_model', FakeEmbeddingModel()),
+            patch.object(vector_db, 'embedding_cache', self.cache),
+            patch.object(vector_db, 'query_embedding_cache', LRUCache(100)),
+            patch.object(vector_db, 'search_result_cache', LRUCache(100)),
+            patch('waitress_server.get_chatbot_response', return_value="The hotel budget is 5000 INR."),
+            patch('waitress_server.fetch_document_from_api',
+                  new=AsyncMock(return_value=b"Hotel budget for the trip is 5000 INR.")),
+            patch('waitress_server.document_index_name',
+                  side_effect=lambda doc_id, content, **kwargs: vector_db.document_db_directory(doc_id, content, root=self.root)),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def _ask(self, question):
+        return self.app.post(
+            '/chat',
+            data=json.dumps({"document_id": "budget.txt", "bucket_name": "data-storage", "question": question}),
+            content_type='application/json'
+        )
+
+    def test_document_db_is_reused(self):
+        """A second question about the same document does not rebuild its DB"""
+        with patch('waitress_server.process_document_content',
+                   wraps=waitress_server.process_document_content) as process:
+            first = self._ask("What is the hotel budget?")
+            second = self._ask("How much for the hotel?")
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        first_db = json.loads(first.data)['vector_db_name_used']
+        self.assertEqual(first_db, json.loads(second.data)['vector_db_name_used'])
+        self.assertEqual(process.call_count, 1)
+
+    def test_concurrent_first_requests_extract_once(self):
+        """Requests arriving together for a new document parse it once, in the build they share"""
+        barrier = threading.Barrier(4)
+        statuses = []
+
+        def ask(question):
+            client = app.test_client()
+            barrier.wait()
+            statuses.append(client.post(
+                '/chat',
+                data=json.dumps({"document_id": "budget.txt", "bucket_name": "data-storage", "question": question}),
+                content_type='application/json'
+            ).status_code)
+
+        with patch('waitress_server.extract_document_segments',
+                   wraps=waitress_server.extract_document_segments) as extract:
+            threads = [threading.Thread(target=ask, args=(f"What is budget item {i}?",)) for i in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(10)
+
+        self.assertEqual(statuses, [200] * 4)
+        self.assertEqual(extract.call_count, 1)
+
+    def test_batch_chat_searches_once(self):
+        """/chat/batch answers every question from one batched search"""
+        questions = ["What is the hotel budget?", "Which trip is this for?"]
+        with patch('waitress_server.search_db_hits_many', wraps=waitress_server.search_db_hits_many) as search:
+            response = self.app.post(
+                '/chat/batch',
+                data=json.dumps({"document_id": "budget.txt", "bucket_name": "data-storage", "questions": questions}),
+                content_type='application/json'
+            )
+
+        self.assertEqual(response.status_code, 200)
+        body = json.loads(response.data)
+        self.assertEqual([item["question"] for item in body["responses"]], questions)
+        self.assertIn("vector_db_name_used", body)
+        self.assertEqual(search.call_count, 1)
+
+    def test_blocking_work_runs_off_the_event_loop(self):
+        """Search, context assembly and the LLM call never run on the request's event loop"""
+        on_loop = []
+
+        def record(name, function):
+            def wrapper(*args, **kwargs):
+                try:
+                    asyncio.get_running_loop()
+                    on_loop.append(name)
+                except RuntimeError:
+                    pass
+                return function(*args, **kwargs)
+            return wrapper
+
+        with patch('waitress_server.search_db_hits_many', new=record("search", waitress_server.search_db_hits_many)), \
+             patch('waitress_server.assemble_context', new=record("assemble", waitress_server.assemble_context)), \
+             patch('waitress_server.get_chatbot_response', new=record("llm", lambda question, context: "5000 INR")):
+            self.assertEqual(self._ask("What is the hotel budget?").status_code, 200)
+            response = self.app.post(
+                '/chat/batch',
+                data=json.dumps({"document_id": "budget.txt", "bucket_name": "data-storage",
+                                 "questions": ["Hotel budget?", "Meals?"]}),
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(on_loop, [])
+
+    def test_concurrent_requests_share_embedding_batches(self):
+        """Questions sent to /chat at the same time are encoded together by the micro-batcher"""
+        self.assertEqual(self._ask("What is the hotel budget?").status_code, 200)
+        questions = [f"How much is budgeted for item {i}?" for i in range(4)]
+        batcher = MicroBatcher(lambda texts: vector_db.get_embeddings(texts), max_batch_size=len(questions),
+                               max_wait_ms=2000)
+        self.addCleanup(batcher.stop, 5)
+        barrier = threading.Barrier(len(questions))
+        statuses = []
+
+        def ask(question):
+            client = app.test_client()
+            barrier.wait()
+            statuses.append(client.post(
+                '/chat',
+                data=json.dumps({"document_id": "budget.txt", "bucket_name": "data-storage", "question": question}),
+                content_type='application/json'
+            ).status_code)
+
+        with patch.object(vector_db, 'embedding_batcher', batcher), \
+                patch.object(vector_db, 'EMBEDDING_BATCHER_ENABLED', True):
+            threads = [threading.Thread(target=ask, args=(question,)) for question in questions]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(10)
+
+        self.assertEqual(statuses, [200] * len(questions))
+        self.assertGreater(batcher.stats()["largest_batch"], 1)
+
+    def test_ready_reports_warm_up(self):
+        """/ready returns 503 until the embedding model is warmed up"""
+        with patch('waitress_server.EMBEDDING_WARMUP', "background"), \
+             patch.dict(vector_db._embedding_model_stats, {"warmed_up": False}):
+            self.assertEqual(self.app.get('/ready').status_code, 503)
+            self.assertEqual(self.app.post('/warmup').status_code, 200)
+            self.assertEqual(self.app.get('/ready').status_code, 200)
+
+    def test_missing_question(self):
+        """The question field is required"""
+        response = self.app.post('/chat', data=json.dumps({"vector_db_name": "x"}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+Tests for the chunking strategies.
+"""
+import unittest
+
+import pandas as pd
+
+from chunking import SentenceChunker, TableRowChunker, load_tokenizer, make_chunker
+
+POLICY = "".join(f"Rule {i}: hotel stays in city {i} are capped at {1000 + i * 10} INR per night. "
+                 + ("\n\n" if i % 5 == 4 else "") for i in range(120))
+
+
+def _segments(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class TestChunking(unittest.TestCase):
+    def test_sentence_chunks_keep_sentences_whole(self):
+        """Sentence chunks respect the size limit, never split a sentence and cover the text"""
+        chunks = list(SentenceChunker(chunk_size=300, overlap=100).chunk(_segments(POLICY, 997)))
+        self.assertTrue(all(len(chunk) <= 300 for chunk in chunks))
+        for chunk in chunks:
+            self.assertRegex(chunk, r"^Rule \d+:")
+            self.assertRegex(chunk.rstrip(), r"INR per night\.$")
+        self.assertTrue(all(f"Rule {i}:" in "".join(chunks) for i in range(120)))
+
+    def test_chunks_do_not_depend_on_segmentation(self):
+        """Each strategy yields the same chunks however the text stream is split"""
+        for strategy in ("fixed", "sentence", "table", "content"):
+            chunker = make_chunker(strategy, chunk_size=300, overlap=60)
+            expected = list(chunker.chunk([POLICY]))
+            for size in (1, 50, 333, 4096):
+                self.assertEqual(list(chunker.chunk(_segments(POLICY, size))), expected, (strategy, size))
+
+    def test_table_chunks_repeat_header_and_keep_rows_whole(self):
+        """Table chunks start with the header and hold whole rows"""
+        df = pd.DataFrame({"vendor": [f"Vendor {i}" for i in range(100)], "amount": range(100)})
+        text = df.to_string() + "\n"
+        header = text.splitlines()[0]
+        chunks = list(TableRowChunker(chunk_size=250).chunk(_segments(text, 77)))
+
+        self.assertGreater(len(chunks), 1)
+        rows = []
+        for chunk in chunks:
+            lines = chunk.splitlines()
+            self.assertEqual(lines[0], header)
+            self.assertLessEqual(len(chunk), 250)
+            rows.extend(lines[1:])
+        self.assertEqual(rows, text.splitlines()[1:])
+        self.assertIsInstance(make_chunker("auto", ".csv"), TableRowChunker)
+        self.assertIsInstance(make_chunker("auto", ".pdf"), SentenceChunker)
+
+    def test_content_defined_chunks_survive_edits(self):
+        """Inserting text only changes the content-defined chunks around the edit"""
+        for extension, text in ((".txt", POLICY), (".csv", POLICY.replace(". ", ".\n"))):
+            chunker = make_chunker("content", extension, chunk_size=300, overlap=60)
+            chunks = list(chunker.chunk([text]))
+            self.assertGreater(len(chunks), 10)
+            self.assertTrue(all(len(chunk) <= 300 for chunk in chunks))
+            for rule in (3, 40, 77, 110):
+                edited = text.replace(f"Rule {rule}:", f"Rule {rule} (revised in 2024):")
+                self.assertLessEqual(len(set(chunker.chunk([edited])) - set(chunks)), 2, (extension, rule))
+        fixed = make_chunker("fixed", chunk_size=300, overlap=60)
+        edited = POLICY.replace("Rule 3:", "Rule 3 (revised in 2024):")
+        self.assertGreater(len(set(fixed.chunk([edited])) - set(fixed.chunk([POLICY]))), 10)
+
+    def test_token_chunks_fit_the_model_limit(self):
+        """Token chunks stay within the model's sequence limit and overlap"""
+        try:
+            tokenizer = load_tokenizer("all-MiniLM-L6-v2")
+        except Exception as e:
+            self.skipTest(f"Tokenizer not available: {e}")
+        chunker = make_chunker("token", model_name="all-MiniLM-L6-v2", max_tokens=64)
+        chunks = list(chunker.chunk(_segments(POLICY, 500)))
+
+        lengths = [len(tokenizer.encode(chunk, add_special_tokens=False).ids) for chunk in chunks]
+        self.assertTrue(all(length <= 62 for length in lengths))
+        self.assertTrue(all(length >= 50 for length in lengths[:-1]))
+        self.assertIn("Rule 119:", chunks[-1])
+        self.assertEqual(list(chunker.chunk([POLICY])), chunks)
+
+    def test_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            make_chunker("paragraphs")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""
+Tests for assembling LLM context from search hits.
+"""
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+import context_assembly
+from context_assembly import assemble_context, merge_adjacent, mmr_select
+from chunking import make_chunker
+from vector_db import iter_chunks
+
+
+def _hit(chunk_id, text, chunk_index, **metadata):
+    return {"id": chunk_id, "document": text, "metadata": {"chunk_index": chunk_index, **metadata}}
+
+
+class TestContextAssembly(unittest.TestCase):
+    def test_merge_adjacent_strips_overlap(self):
+        """Consecutive chunks of one document are merged back into the original text"""
+        text = "".join(f"Line {i}: taxi fare {i * 10} INR. " for i in range(60))
+        chunks = list(iter_chunks([text]))
+        hits = [_hit(f"trip.txt_{i}", chunk, i) for i, chunk in enumerate(chunks)]
+        hits.reverse()
+
+        self.assertEqual(merge_adjacent(hits), [text])
+
+    def test_merge_adjacent_strips_carried_sentences(self):
+        """Sentences the content-defined chunker carries into the next chunk appear once"""
+        text = "".join(f"Receipt {i} lists a taxi fare of {i * 10} INR for the airport run. " for i in range(80))
+        chunks = list(make_chunker("content", ".txt", chunk_size=500, overlap=100).chunk([text]))
+        hits = [_hit(f"trip.txt_{i}", chunk, i, chunking="content", file_type="txt") for i, chunk in enumerate(chunks)]
+
+        self.assertGreater(len(chunks), 2)
+        self.assertEqual(merge_adjacent(hits), [text])
+
+    def test_merge_adjacent_keeps_coincidental_matches(self):
+        """A chunk starting with the same word the previous one ended with is not overlap"""
+        chunks = ["Hotel 5000 INR. Total was ", "as approved by the manager."]
+        expected = ["Hotel 5000 INR. Total was as approved by the manager."]
+        for metadata in ({"chunking": "sentence", "file_type": "txt"}, {}):
+            hits = [_hit(f"trip.txt_{i}", chunk, i, **metadata) for i, chunk in enumerate(chunks)]
+            self.assertEqual(merge_adjacent(hits), expected)
+
+    def test_merge_adjacent_drops_repeated_table_headers(self):
+        """Merged table chunks keep their header row once"""
+        chunks = ["date,amount\n2024-01-02,300\n", "date,amount\n2024-01-03,450\n", "date,amount\n2024-01-04,120\n"]
+        hits = [_hit(f"fares.csv_{i}", chunk, i, chunking="table", file_type="csv") for i, chunk in enumerate(chunks)]
+
+        self.assertEqual(merge_adjacent(hits), ["date,amount\n2024-01-02,300\n2024-01-03,450\n2024-01-04,120\n"])
+
+    def test_merge_adjacent_keeps_separate_passages_in_rank_order(self):
+        """Non-adjacent chunks and other documents stay separate, best-ranked first"""
+        hits = [_hit("b.txt_4", "budget four", 4), _hit("a.txt_1", "alpha one", 1), _hit("b.txt_0", "budget zero", 0)]
+        self.assertEqual(merge_adjacent(hits), ["budget four", "alpha one", "budget zero"])
+
+    def test_mmr_skips_near_duplicates(self):
+        """A duplicate of an already selected chunk loses to a diverse one"""
+        query = [1.0, 0.0]
+        embeddings = [[1.0, 0.1], [1.0, 0.1], [0.8, -0.6]]
+        self.assertEqual(mmr_select(query, embeddings, 2, mmr_lambda=0.5), [0, 2])
+        self.assertEqual(mmr_select(query, embeddings, 2, mmr_lambda=1.0), [0, 1])
+
+    def test_assemble_context_respects_token_budget(self):
+        """Whole passages are kept until the token budget is spent"""
+        hits = [_hit(f"doc{i}.txt_0", f"passage {i} " * 20, 0) for i in range(5)]
+        rng = np.random.default_rng(0)
+        with patch.object(context_assembly.vector_db, 'get_query_embeddings', return_value=[[1.0, 0.0, 0.0]]), \
+             patch.object(context_assembly.vector_db, 'get_embeddings',
+                          return_value=rng.random((5, 3)).tolist()):
+            stats = {}
+            context = assemble_context("question", hits, max_chunks=5, token_budget=120, stats=stats)
+
+        self.assertLessEqual(stats["context_tokens"], 120)
+        self.assertLess(stats["context_tokens"], stats["candidate_tokens"])
+        self.assertEqual(len(context.split("\n")), 2)
+        self.assertEqual(assemble_context("question", []), "")
+
+    def test_assemble_context_uses_embeddings_returned_by_the_search(self):
+        """Hits that carry their stored embedding are not embedded again"""
+        hits = [{**_hit(f"doc{i}.txt_0", f"passage {i}", 0), "embedding": np.eye(3)[i % 3]} for i in range(3)]
+        hits.append(_hit("doc3.txt_0", "passage 3", 0))
+        with patch.object(context_assembly.vector_db, 'get_query_embeddings', return_value=[[1.0, 0.0, 0.0]]), \
+             patch.object(context_assembly.vector_db, 'get_embeddings', return_value=[[0.0, 1.0, 1.0]]) as embed:
+            context = assemble_context("question", hits, max_chunks=2)
+
+        embed.assert_called_once_with(["passage 3"])
+        self.assertEqual(context.split("\n")[0], "passage 0")
+
+
+if __name__ == '__main__':
+    unittest.main()
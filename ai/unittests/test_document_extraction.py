@@ -0,0 +1,208 @@
+"""
+Tests for process-pool document text extraction.
+"""
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import openpyxl
+from PIL import Image
+
+import document_extraction
+import ocr_extraction
+from document_extraction import detect_format, extract_document_text, iter_document_text
+from text_cache import TextCache
+
+
+def make_jpeg(width, height, shade=255):
+    buffer = io.BytesIO()
+    Image.new("L", (width, height), shade).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def make_pdf(pages):
+    """Builds a minimal PDF with one line of text per page; bytes pages are JPEG scans without text."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in pages:
+        resources = b"/Font << /F1 3 0 R >>"
+        if isinstance(page, bytes):
+            with Image.open(io.BytesIO(page)) as image:
+                width, height = image.size
+            objects.append(b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray "
+                           b"/BitsPerComponent 8 /Filter /DCTDecode /Length %d >>\nstream\n%s\nendstream"
+                           % (width, height, len(page), page))
+            resources = b"/XObject << /Im1 %d 0 R >>" % len(objects)
+            stream = b"q 612 0 0 792 0 0 cm /Im1 Do Q"
+        else:
+            stream = f"BT /F1 12 Tf 72 720 Td ({page}) Tj ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       b"/Resources << %s >> /Contents %d 0 R >>" % (resources, len(objects)))
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), len(kids))
+
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return pdf
+
+
+class TestDocumentExtraction(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="extraction_test_")
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.cache = TextCache(os.path.join(self.root, "texts.sqlite3"))
+        self.addCleanup(self.cache.close)
+        patches = [
+            patch.object(document_extraction, 'EXTRACTION_PROCESSES', 2),
+            patch.object(document_extraction, '_text_cache', self.cache),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(document_extraction.stop_extraction_pool)
+
+    def test_pool_matches_in_process_extraction(self):
+        """Text extracted in the pool is identical to streaming it in-process"""
+        content = b"Hotel budget for the trip is 5000 INR.\n" * 100
+        self.assertEqual(extract_document_text(content, ".TXT"), "".join(iter_document_text(content, ".txt")))
+
+    def test_large_pdf_pages_are_extracted_in_parallel_in_order(self):
+        """A PDF larger than one task is split into page ranges and reassembled in page order"""
+        content = make_pdf([f"Receipt page {i}" for i in range(7)])
+        with patch.object(document_extraction, 'EXTRACTION_PDF_PAGES_PER_TASK', 2), \
+                patch.object(document_extraction, '_run_tasks', wraps=document_extraction._run_tasks) as run_tasks:
+            text = extract_document_text(content, ".pdf")
+
+        self.assertEqual(text, "".join(iter_document_text(content, ".pdf")))
+        self.assertLess(text.index("Receipt page 2"), text.index("Receipt page 6"))
+        page_tasks = run_tasks.call_args_list[-1].args[2]
+        self.assertEqual([(start, stop) for _, start, stop in page_tasks], [(0, 2), (2, 4), (4, 6), (6, 7)])
+
+    def test_timeout_kills_pool_and_next_document_succeeds(self):
+        """A document that exceeds its timeout raises, and the pool is replaced for later documents"""
+        with self.assertRaises(TimeoutError):
+            extract_document_text(b"a,b\n" + b"1,2\n" * 200000, ".csv", timeout=0)
+        self.assertEqual(extract_document_text(b"Taxi fare 300 INR.", ".txt"), "Taxi fare 300 INR.")
+
+    def test_import_and_text_documents_do_not_load_ocr(self):
+        """OpenCV and tesseract are only imported once an image or a scanned page needs OCR"""
+        code = ("import sys, document_extraction; "
+                "document_extraction.TEXT_CACHE_ENABLED = False; "
+                "''.join(document_extraction.iter_document_text(b'Taxi fare 300 INR.', '.txt')); "
+                "print('ocr_extraction' in sys.modules or 'cv2' in sys.modules)")
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(document_extraction.__file__))).stdout
+        self.assertEqual(output.strip().splitlines()[-1], "False")
+
+    def test_unsupported_type_raises(self):
+        with self.assertRaises(ValueError):
+            extract_document_text(bytes(range(256)), ".bin")
+
+    def test_format_is_detected_from_content(self):
+        """Binary signatures win over the extension; ambiguous text keeps its extension's format"""
+        self.assertEqual(detect_format(make_pdf(["Invoice"]), ".txt"), "pdf")
+        self.assertEqual(detect_format(b"date,amount\n2024-01-02,300\n", ".csv"), "csv")
+        self.assertEqual(detect_format(b'{"amount": 300}', ".json"), "json")
+        self.assertEqual(detect_format(b"Taxi fare 300 INR.", ".bin"), "text")
+        self.assertEqual(detect_format(make_pdf(["Invoice"]), ""), "pdf")
+
+    def test_repeated_upload_is_not_parsed_again(self):
+        """Extracted text is cached by content hash, for the pool and the streaming path alike"""
+        content = b"date,amount\n2024-01-02,300\n2024-01-03,450\n"
+        with patch.object(document_extraction, '_extract', wraps=document_extraction._extract) as extract:
+            first = extract_document_text(content, ".csv")
+            second = extract_document_text(content, "")
+        self.assertEqual(first, second)
+        self.assertEqual(extract.call_count, 1)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+        with patch.dict(document_extraction.EXTRACTORS, {"csv": None}):
+            self.assertEqual("".join(iter_document_text(content, ".csv")), first)
+
+    def test_spreadsheets_stream_compact_rows(self):
+        """CSV and .xlsx rows come out as compact CSV lines, with the header once and no padding"""
+        csv_text = "".join(iter_document_text(b"date,amount,note\n2024-01-02,300,\n2024-01-03,4500.5,taxi\n", ".csv"))
+        self.assertEqual(csv_text, "date,amount,note\n2024-01-02,300,\n2024-01-03,4500.5,taxi\n")
+
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(["date", "vendor", "amount"])
+        for i in range(450):
+            sheet.append([f"2024-02-{1 + i % 28:02d}", f"Vendor, {i}", 100 + i])
+        sheet.append([None, None, None])
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+
+        with patch.object(document_extraction, '_TABLE_ROWS_PER_SEGMENT', 200):
+            segments = list(iter_document_text(buffer.getvalue(), ".xlsx"))
+        self.assertEqual([segment.count("\n") for segment in segments], [200, 200, 51])
+        lines = "".join(segments).splitlines()
+        self.assertEqual(lines[:2], ["date,vendor,amount", '2024-02-01,"Vendor, 0",100'])
+        self.assertEqual(len(lines), 451)
+
+    def test_image_is_downscaled_and_ocred(self):
+        """Receipt photos are OCRed as grayscale, with the longest side capped at OCR_MAX_DIMENSION"""
+        buffer = io.BytesIO()
+        Image.new("RGB", (3000, 1500), "white").save(buffer, format="PNG")
+        with patch.object(document_extraction, 'EXTRACTION_PROCESSES', 0), \
+                patch.object(ocr_extraction, 'OCR_MAX_DIMENSION', 1000), \
+                patch.object(ocr_extraction.pytesseract, 'image_to_string', return_value="Taxi fare 300 INR\n") as ocr:
+            self.assertEqual(detect_format(buffer.getvalue(), ".png"), "image")
+            self.assertEqual(extract_document_text(buffer.getvalue(), ".png"), "Taxi fare 300 INR\n")
+        self.assertEqual(ocr.call_args.args[0].shape, (500, 1000))
+
+    def test_scanned_pdf_pages_are_ocred_once_per_scan(self):
+        """Pages without a text layer are OCRed in order, and a scan seen before comes from the cache"""
+        scan = make_jpeg(60, 80)
+        with patch.object(document_extraction, 'EXTRACTION_PROCESSES', 0), \
+                patch.object(ocr_extraction.pytesseract, 'image_to_string', return_value="Hotel 5000 INR") as ocr:
+            first = extract_document_text(make_pdf(["Expense report", scan]), ".pdf")
+            second = "".join(iter_document_text(make_pdf([scan, "Appendix"]), ".pdf"))
+        self.assertEqual(first.split("\n")[1], "Hotel 5000 INR")
+        self.assertLess(second.index("Hotel 5000 INR"), second.index("Appendix"))
+        self.assertEqual(ocr.call_count, 1)
+
+    def test_failed_ocr_page_is_left_empty_and_not_cached(self):
+        scan = make_jpeg(60, 80, shade=128)
+        error = ocr_extraction.pytesseract.TesseractNotFoundError()
+        with patch.object(document_extraction, 'EXTRACTION_PROCESSES', 0), \
+                patch.object(ocr_extraction.pytesseract, 'image_to_string', side_effect=error):
+            text = extract_document_text(make_pdf(["Invoice", scan]), ".pdf")
+        self.assertIn("Invoice", text)
+        self.assertEqual(text.split("\n")[1:], ["", ""])
+        self.assertIsNone(self.cache.get(document_extraction.content_hash(scan), document_extraction._ocr_cache_key()))
+
+    def test_text_cache_evicts_least_recently_used(self):
+        cache = TextCache(os.path.join(self.root, "small.sqlite3"), max_entries=2)
+        self.addCleanup(cache.close)
+        cache.put("a", "text:v1", "first")
+        cache.put("b", "text:v1", "second")
+        self.assertEqual(cache.get("a", "text:v1"), "first")
+        cache.put("c", "text:v1", "third")
+        self.assertIsNone(cache.get("b", "text:v1"))
+        self.assertEqual((len(cache), cache.evictions), (2, 1))
+
+    def test_in_process_when_pool_disabled(self):
+        with patch.object(document_extraction, 'EXTRACTION_PROCESSES', 0), \
+                patch.object(document_extraction, '_extract_segments', wraps=document_extraction._extract_segments) as extract:
+            self.assertEqual(extract_document_text(b"Meals 800 INR.", ".txt"), "Meals 800 INR.")
+        extract.assert_called_once_with(b"Meals 800 INR.", "text")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+"""
+Tests for the ONNX embedding backends.
+"""
+import shutil
+import tempfile
+import unittest
+
+try:
+    import onnxruntime  # noqa: F401
+    HAS_ONNXRUNTIME = True
+except ImportError:
+    HAS_ONNXRUNTIME = False
+
+import embedding_backends
+import vector_db
+
+
+@unittest.skipUnless(HAS_ONNXRUNTIME, "onnxruntime is not installed")
+class TestOnnxBackend(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.model_directory = tempfile.mkdtemp(prefix="onnx_models_test_")
+        from sentence_transformers import SentenceTransformer
+        cls.reference = SentenceTransformer(vector_db.EMBEDDING_MODEL_NAME)
+        cls.texts = [
+            "Hotel invoice INV-00042 from Acme Travel, 4500 INR including 18% GST.",
+            "Meal allowance is capped at 800 INR per day.",
+            "What is the hotel budget?",
+        ]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.model_directory, ignore_errors=True)
+
+    def test_onnx_matches_torch(self):
+        """The ONNX export agrees with the SentenceTransformer output"""
+        model = embedding_backends.load_onnx_embedding_model(vector_db.EMBEDDING_MODEL_NAME,
+                                                             model_directory=self.model_directory)
+        parity = embedding_backends.check_embedding_parity(self.reference, model, self.texts)
+        self.assertGreater(parity["min_cosine"], 0.999)
+        self.assertEqual(model.encode(self.texts[0]).shape, (self.reference.get_sentence_embedding_dimension(),))
+
+    def test_int8_close_to_torch(self):
+        """The int8 quantized export stays close to the SentenceTransformer output"""
+        model = embedding_backends.load_onnx_embedding_model(vector_db.EMBEDDING_MODEL_NAME, quantized=True,
+                                                             model_directory=self.model_directory)
+        parity = embedding_backends.check_embedding_parity(self.reference, model, self.texts)
+        self.assertGreater(parity["mean_cosine"], 0.97)
+
+
+if __name__ == '__main__':
+    unittest.main()
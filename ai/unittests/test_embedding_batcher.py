@@ -0,0 +1,93 @@
+"""
+Tests for cross-request micro-batching of query embeddings.
+"""
+import threading
+import unittest
+
+from embedding_batcher import MicroBatcher
+
+
+class RecordingEncoder:
+    """Encodes a text as [len(text)] and records every batch it is called with."""
+
+    def __init__(self, gate: threading.Event = None):
+        self.batches = []
+        self.gate = gate
+
+    def __call__(self, texts):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.batches.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+
+class TestMicroBatcher(unittest.TestCase):
+    def _batcher(self, encoder, **kwargs):
+        batcher = MicroBatcher(encoder, **kwargs)
+        self.addCleanup(batcher.stop, 5)
+        return batcher
+
+    def test_concurrent_callers_share_one_batch(self):
+        """Texts queued by different callers within the wait window are encoded together"""
+        encoder = RecordingEncoder()
+        batcher = self._batcher(encoder, max_batch_size=8, max_wait_ms=200)
+        results = {}
+        start = threading.Barrier(4)
+
+        def ask(question):
+            start.wait(5)
+            results[question] = batcher.encode([question])[0]
+
+        threads = [threading.Thread(target=ask, args=(f"question {'?' * i}",)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(encoder.batches), 1)
+        self.assertEqual(sorted(encoder.batches[0]), sorted(results))
+        self.assertTrue(all(embedding == [float(len(question))] for question, embedding in results.items()))
+        stats = batcher.stats()
+        self.assertEqual((stats["batches"], stats["items"], stats["largest_batch"]), (1, 4, 4))
+        self.assertEqual(stats["queue_depth"], 0)
+
+    def test_full_batch_does_not_wait_and_results_keep_order(self):
+        """A batch closes as soon as max_batch_size texts are queued, long before max_wait_ms"""
+        encoder = RecordingEncoder()
+        batcher = self._batcher(encoder, max_batch_size=2, max_wait_ms=60000)
+        texts = ["a", "bb", "ccc", "dddd"]
+        self.assertEqual(batcher.encode(texts, timeout=5), [[1.0], [2.0], [3.0], [4.0]])
+        self.assertEqual(encoder.batches, [["a", "bb"], ["ccc", "dddd"]])
+
+    def test_queue_depth_is_reported_while_worker_is_busy(self):
+        gate = threading.Event()
+        batcher = self._batcher(RecordingEncoder(gate), max_batch_size=1, max_wait_ms=0)
+        futures = batcher.submit(["first", "second", "third"])
+        self.assertGreaterEqual(batcher.stats()["max_queue_depth"], 3)
+        gate.set()
+        self.assertEqual([future.result(5) for future in futures], [[5.0], [6.0], [5.0]])
+        self.assertEqual(batcher.stats()["queue_depth"], 0)
+
+    def test_encode_error_fails_every_caller_of_the_batch(self):
+        def failing_encoder(texts):
+            raise RuntimeError("model not loaded")
+
+        batcher = self._batcher(failing_encoder, max_batch_size=4, max_wait_ms=0)
+        futures = batcher.submit(["taxi", "hotel"])
+        for future in futures:
+            with self.assertRaises(RuntimeError):
+                future.result(5)
+        self.assertEqual(batcher.stats()["errors"], 1)
+
+    def test_stop_drains_queue_then_rejects_new_work(self):
+        encoder = RecordingEncoder()
+        batcher = MicroBatcher(encoder, max_batch_size=10, max_wait_ms=60000)
+        futures = batcher.submit(["meals"])
+        batcher.stop(5)
+        self.assertEqual(futures[0].result(0), [5.0])
+        with self.assertRaises(RuntimeError):
+            batcher.submit(["taxi"])
+
+
+if __name__ == '__main__':
+    unittest.main()
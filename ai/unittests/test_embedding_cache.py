@@ -0,0 +1,72 @@
+"""
+Tests for the persistent embedding cache.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from embedding_cache import EmbeddingCache
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="embedding_cache_test_")
+        self.path = os.path.join(self.directory, "embeddings.sqlite3")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_round_trip_and_counters(self):
+        """Stored embeddings are returned and hits/misses are counted"""
+        cache = EmbeddingCache(self.path)
+        self.addCleanup(cache.close)
+        cache.put_many("model", ["a"], [[0.5, 0.25]])
+
+        self.assertEqual(cache.get_many("model", ["a", "b"]), [[0.5, 0.25], None])
+        self.assertEqual(cache.get_many("other-model", ["a"]), [None])
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+
+    def test_persists_across_instances(self):
+        """Entries survive reopening the cache file"""
+        cache = EmbeddingCache(self.path)
+        cache.put_many("model", ["policy"], [[1.0, 0.0]])
+        cache.close()
+
+        reopened = EmbeddingCache(self.path)
+        self.addCleanup(reopened.close)
+        self.assertEqual(reopened.get_many("model", ["policy"]), [[1.0, 0.0]])
+
+    def test_lru_eviction(self):
+        """The least recently used entry is evicted once over capacity"""
+        cache = EmbeddingCache(self.path, max_entries=2)
+        self.addCleanup(cache.close)
+        cache.put_many("model", ["a"], [[1.0]])
+        cache.put_many("model", ["b"], [[2.0]])
+        cache.get_many("model", ["a"])  # "b" is now least recently used
+        cache.put_many("model", ["c"], [[3.0]])
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get_many("model", ["a", "b", "c"]), [[1.0], None, [3.0]])
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+
+    def test_puts_below_capacity_do_not_count_rows(self):
+        """The row count is tracked in memory; replaced entries do not grow it"""
+        cache = EmbeddingCache(self.path, max_entries=3)
+        self.addCleanup(cache.close)
+        statements = []
+        cache._conn.set_trace_callback(statements.append)
+        cache.put_many("model", ["a", "b"], [[1.0], [2.0]])
+        cache.put_many("model", ["a", "b"], [[1.5], [2.5]])
+        cache.put_many("model", ["c"], [[3.0]])
+
+        self.assertFalse([statement for statement in statements if "COUNT(*)" in statement])
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.get_many("model", ["a"]), [[1.5]])
+        self.assertEqual(cache.stats()["evictions"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+"""
+Tests for the in-memory LRU cache used for query embeddings and search results.
+"""
+import unittest
+
+from search_cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        """Reading an entry keeps it; the oldest unread entry is evicted"""
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["evictions"]), (3, 1, 1))
+        self.assertEqual(stats["hit_ratio"], 0.75)
+
+    def test_zero_size_disables_cache(self):
+        """A cache with max_entries=0 never stores anything"""
+        cache = LRUCache(0)
+        cache.put("a", 1)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,703 @@
+"""
+Tests for the vector database helpers.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+import document_extraction
+import flat_index
+import vector_db
+from embedding_cache import EmbeddingCache
+from search_cache import LRUCache
+
+
+class FakeEmbeddingModel:
+    """Deterministic stand-in for the SentenceTransformer model."""
+
+    def __init__(self, dimension=8):
+        self.dimension = dimension
+        self.encode_calls = []
+
+    def _vector(self, text):
+        rng = np.random.default_rng(abs(hash(text)) % (2 ** 32))
+        vector = rng.random(self.dimension).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        self.encode_calls.append(texts)
+        if isinstance(texts, str):
+            return self._vector(texts)
+        return np.array([self._vector(text) for text in texts])
+
+
+class TestVectorDB(unittest.TestCase):
+    def setUp(self):
+        self.db_directory = tempfile.mkdtemp(prefix="chroma_db_test_")
+        self.model = FakeEmbeddingModel()
+        self.cache = EmbeddingCache(os.path.join(self.db_directory, "embeddings.sqlite3"))
+        for name, value in (('embedding_model', self.model), ('embedding_cache', self.cache),
+                            ('query_embedding_cache', LRUCache(100)), ('search_result_cache', LRUCache(100))):
+            patcher = patch.object(vector_db, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(document_extraction, 'TEXT_CACHE_ENABLED', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.cache.close)
+
+    def tearDown(self):
+        shutil.rmtree(self.db_directory, ignore_errors=True)
+
+    def test_get_embeddings_preserves_order(self):
+        """Batched embeddings match the single-text embeddings in order"""
+        texts = [f"chunk {i}" for i in range(5)]
+        batched = vector_db.get_embeddings(texts, batch_size=2)
+        single = [vector_db.get_embedding(text) for text in texts]
+        np.testing.assert_allclose(batched, single, rtol=1e-6)
+
+    def test_get_embeddings_reads_through_cache(self):
+        """Only texts missing from the cache reach the model"""
+        vector_db.get_embeddings(["receipt a", "receipt b"])
+        vector_db.get_embeddings(["receipt a", "receipt b", "receipt c", "receipt c"])
+        self.assertEqual(self.model.encode_calls, [["receipt a", "receipt b"], ["receipt c"]])
+        self.assertEqual(self.cache.hits, 2)
+        self.assertEqual(self.cache.misses, 4)
+
+    def test_warm_up_runs_dummy_encode(self):
+        """warm_up_embedding_model encodes once and reports the model as warm"""
+        status = vector_db.warm_up_embedding_model()
+        self.assertTrue(status["warmed_up"])
+        self.assertEqual(self.model.encode_calls, [["warm-up"]])
+
+    def test_import_does_not_load_model(self):
+        """Importing vector_db does not import sentence_transformers or torch"""
+        code = "import sys, vector_db; print('sentence_transformers' in sys.modules or 'torch' in sys.modules)"
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(vector_db.__file__))).stdout
+        self.assertEqual(output.strip().splitlines()[-1], "False")
+
+    def test_import_does_not_create_embedding_cache(self):
+        """The embedding cache is opened on first use, not when vector_db is imported"""
+        directory = tempfile.mkdtemp(prefix="vector_db_import_")
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        environment = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(vector_db.__file__)))
+        subprocess.run([sys.executable, "-c", "import vector_db"], cwd=directory, env=environment, check=True)
+        self.assertEqual(os.listdir(directory), [])
+
+    def test_ingest_groups_reach_the_embedding_pool(self):
+        """With the pool enabled, ingest embeds groups large enough for the pool to take them"""
+        text = "".join(f"Expense line {i}: vendor {i} charged {100 + i} INR. ".ljust(100) for i in range(60))
+        pool = object()
+        with patch.object(vector_db, 'EMBEDDING_POOL_PROCESSES', 2), \
+             patch.object(vector_db, 'EMBEDDING_POOL_MIN_TEXTS', 8), \
+             patch.object(vector_db, 'EMBEDDING_BATCH_SIZE', 4), \
+             patch.object(vector_db, '_get_embedding_pool', return_value=pool), \
+             patch.object(self.model, 'encode', wraps=self.model.encode) as encode:
+            vector_db.add_document_to_db(text, "expenses.txt", db_directory=self.db_directory)
+        calls = encode.call_args_list
+        self.assertTrue(calls)
+        self.assertTrue(all(call.kwargs.get("pool") is pool for call in calls[:-1]))
+        self.assertTrue(all(len(call.args[0]) == 8 for call in calls[:-1]))
+
+    def test_get_embeddings_empty(self):
+        """No encode call is made for an empty input"""
+        self.assertEqual(vector_db.get_embeddings([]), [])
+        self.assertEqual(self.model.encode_calls, [])
+
+    def test_add_document_encodes_chunks_in_one_call(self):
+        """add_document_to_db embeds all chunks through the batch path"""
+        text = "Hotel budget for the Bangalore trip is 5000 INR. " * 40
+        vector_db.add_document_to_db(text, "policy.txt", db_directory=self.db_directory)
+
+        self.assertEqual(len(self.model.encode_calls), 1)
+        self.assertGreater(len(self.model.encode_calls[0]), 1)
+
+        results = vector_db.search_db("hotel budget", n_results=2, db_directory=self.db_directory)
+        self.assertEqual(len(results), 2)
+
+    def test_add_document_streams_batches(self):
+        """Chunks are written batch by batch and are searchable mid-ingest"""
+        text = "Invoice INV-001 from Acme Travel for 1200 INR. " * 60
+        progress = []
+        partial_results = []
+
+        def on_progress(chunks_written):
+            progress.append(chunks_written)
+            partial_results.append(len(vector_db.search_db("invoice", n_results=100, db_directory=self.db_directory)))
+
+        with patch.object(vector_db, 'EMBEDDING_BATCH_SIZE', 2):
+            total = vector_db.add_document_to_db(text, "invoice.txt", db_directory=self.db_directory,
+                                                 progress_callback=on_progress)
+
+        self.assertEqual(progress, list(range(2, total + 1, 2)) + ([total] if total % 2 else []))
+        self.assertEqual(partial_results, progress)
+
+    def test_spreadsheet_is_chunked_by_rows_with_header(self):
+        """Spreadsheet rows are packed into chunks that each start with the header and never split a row"""
+        rows = "".join(f"2024-01-{1 + i % 28:02d},Vendor {i},{100 + i}.50\n" for i in range(300))
+        content = ("date,vendor,amount_inr\n" + rows).encode("utf-8")
+        total = vector_db.add_document_to_db(content, "card_export.csv", db_directory=self.db_directory)
+
+        with vector_db.vector_db_registry.collection(self.db_directory) as collection:
+            chunks = collection.get(include=["documents"])["documents"]
+        self.assertEqual(len(chunks), total)
+        self.assertTrue(all(chunk.startswith("date,vendor,amount_inr\n") for chunk in chunks))
+        self.assertTrue(all(len(chunk) <= vector_db.CHUNK_SIZE and chunk.endswith("\n") for chunk in chunks))
+        self.assertEqual(sum(chunk.count("\n") - 1 for chunk in chunks), 300)
+
+    def test_upsert_document_embeds_only_changed_chunks(self):
+        """Re-indexing an edited document embeds only the edited chunk and drops removed ones"""
+        lines = [f"Line {i:03d}: hotel allowance for city {i} is {1000 + i} INR.".ljust(99) + "\n" for i in range(20)]
+        original = "".join(lines)
+        first = vector_db.upsert_document(original, "budget.txt", db_directory=self.db_directory)
+        self.assertEqual((first["embedded"], first["deleted"]), (first["chunks"], 0))
+
+        self.model.encode_calls.clear()
+        lines[7] = lines[7].replace("1007 INR", "2007 INR")
+        edited = "".join(lines[:15])
+        second = vector_db.upsert_document(edited, "budget.txt", db_directory=self.db_directory)
+
+        self.assertLessEqual(second["embedded"], 2)
+        self.assertGreater(second["deleted"], 0)
+        self.assertEqual(sum(len(texts) for texts in self.model.encode_calls), second["embedded"])
+        with vector_db.vector_db_registry.collection(self.db_directory) as collection:
+            self.assertEqual(collection.count(), second["chunks"])
+        results = vector_db.search_db("2007", n_results=1, db_directory=self.db_directory, mode="keyword")
+        self.assertIn("2007 INR", results[0])
+
+    def test_upsert_of_an_added_document_keeps_its_chunking(self):
+        """Upserting unchanged content into a DB built by add_document_to_db embeds nothing"""
+        text = "".join(f"Expense line {i}: vendor {i} charged {100 + i} INR. " for i in range(80))
+        added = vector_db.add_document_to_db(text, "expenses.txt", db_directory=self.db_directory)
+        self.model.encode_calls.clear()
+
+        counts = vector_db.upsert_document(text, "expenses.txt", db_directory=self.db_directory)
+        self.assertEqual(counts, {"chunks": added, "unchanged": added, "reused": 0, "embedded": 0, "deleted": 0})
+        self.assertEqual(self.model.encode_calls, [])
+
+    def test_upsert_document_embeds_about_one_chunk_for_an_edit_that_shifts_text(self):
+        """An edit that changes the text's length near the top does not re-embed the chunks after it"""
+        lines = [f"Line {i}: hotel allowance for city {i} is {1000 + i} INR, meals {200 + i % 7} INR.\n"
+                 for i in range(200)]
+        first = vector_db.upsert_document("".join(lines), "policy.txt", db_directory=self.db_directory)
+
+        self.model.encode_calls.clear()
+        lines[3] = lines[3].replace("hotel allowance", "hotel and hostel allowance")
+        second = vector_db.upsert_document("".join(lines), "policy.txt", db_directory=self.db_directory)
+
+        self.assertGreater(first["chunks"], 40)
+        self.assertLessEqual(second["embedded"], 3)
+        self.assertEqual(sum(len(texts) for texts in self.model.encode_calls), second["embedded"])
+        results = vector_db.search_db("hostel", n_results=1, db_directory=self.db_directory, mode="keyword")
+        self.assertIn("hotel and hostel allowance", results[0])
+
+    def test_snapshot_round_trip_restores_searchable_db(self):
+        """An exported snapshot imports into a new DB that searches like the original, without re-embedding"""
+        text = "".join(f"Trip day {i}: hotel Ã  Pune cost {2000 + i} INR, invoice INV-{i:04d}. ".ljust(100)
+                       for i in range(30))
+        source = os.path.join(self.db_directory, "chroma_db_trip")
+        chunks = vector_db.add_document_to_db(text, "trip.txt", db_directory=source,
+                                              metadata={"bucket": "data-storage"})
+        snapshot = os.path.join(self.db_directory, "trip.npz")
+        manifest = vector_db.export_vector_db(source, snapshot)
+        self.assertEqual(manifest, vector_db.read_snapshot_manifest(snapshot))
+        self.assertEqual((manifest["chunks"], manifest["dimension"]), (chunks, self.model.dimension))
+
+        restored = os.path.join(self.db_directory, "chroma_db_restored")
+        self.model.encode_calls.clear()
+        self.assertEqual(vector_db.import_vector_db(snapshot, restored), manifest["chunks"])
+        self.assertEqual(self.model.encode_calls, [])
+        self.assertTrue(vector_db.is_document_db_ready(restored))
+        for mode in ("vector", "keyword"):
+            self.assertEqual(vector_db.search_db_many(["hotel cost", "INV-0007"], n_results=3, db_directory=restored,
+                                                      mode=mode),
+                             vector_db.search_db_many(["hotel cost", "INV-0007"], n_results=3, db_directory=source,
+                                                      mode=mode))
+        hit = vector_db.search_db_hits_many(["INV-0007"], n_results=1, db_directory=restored, mode="keyword")[0][0]
+        self.assertEqual(hit["metadata"]["bucket"], "data-storage")
+
+        with self.assertRaises(ValueError):
+            vector_db.import_vector_db(snapshot, restored)
+        self.assertEqual(vector_db.import_vector_db(snapshot, restored, replace=True), manifest["chunks"])
+        with patch.object(vector_db, 'EMBEDDING_BACKEND', "onnx"), self.assertRaises(ValueError):
+            vector_db.import_vector_db(snapshot, os.path.join(self.db_directory, "chroma_db_other"))
+
+    def test_iter_chunks_matches_sliding_window(self):
+        """Streaming chunking yields the same chunks as slicing the whole text"""
+        text = "".join(chr(ord('a') + i % 26) for i in range(2345))
+        expected = []
+        start = 0
+        while start < len(text):
+            expected.append(text[start:start + 500])
+            start += 400
+
+        for segment_size in (1, 7, 400, 500, 1000, 5000):
+            segments = [text[i:i + segment_size] for i in range(0, len(text), segment_size)]
+            self.assertEqual(list(vector_db.iter_chunks(segments)), expected)
+
+    def test_delete_vector_db_closes_cached_handle(self):
+        """delete_vector_db removes a directory that the registry had open"""
+        vector_db.add_document_to_db("Flight to Delhi cost 7000 INR.", "trip.txt", db_directory=self.db_directory)
+        self.assertTrue(vector_db.delete_vector_db(self.db_directory))
+        self.assertFalse(os.path.exists(self.db_directory))
+        self.assertEqual(vector_db.search_db("flight", db_directory=self.db_directory), [])
+
+    def test_search_db_many_batches_queries(self):
+        """search_db_many embeds all queries in one call and matches search_db"""
+        vector_db.add_document_to_db("Hotel budget is 5000 INR. " * 30 + "Taxi fare is 300 INR. " * 30,
+                                     "policy.txt", db_directory=self.db_directory)
+        queries = ["hotel budget", "taxi fare", "meal allowance"]
+        self.model.encode_calls.clear()
+
+        batched = vector_db.search_db_many(queries, n_results=3, db_directory=self.db_directory)
+        self.assertEqual(self.model.encode_calls, [queries])
+        self.assertEqual(batched, [vector_db.search_db(query, n_results=3, db_directory=self.db_directory)
+                                   for query in queries])
+        self.assertEqual(vector_db.search_db_many(queries, db_directory=os.path.join(self.db_directory, "missing")),
+                         [[], [], []])
+
+    def test_fan_out_search_merges_dbs_by_distance(self):
+        """A search over several DBs returns the global top hits by distance, each tagged with its DB"""
+        per_db = {}
+        with patch.object(vector_db, 'CHUNK_SIZE', 100), patch.object(vector_db, 'CHUNK_OVERLAP', 0):
+            for trip in ("goa", "delhi", "pune"):
+                directory = os.path.join(self.db_directory, f"chroma_db_{trip}")
+                text = "".join(f"{trip} trip day {i}: hotel cost {2000 + i} INR.".ljust(100) for i in range(6))
+                vector_db.add_document_to_db(text, f"{trip}.txt", db_directory=directory)
+                per_db[directory] = vector_db.search_db_hits_many(["hotel cost"], n_results=6, db_directory=directory)[0]
+        expected = sorted((hit["distance"], directory, hit["id"]) for directory, hits in per_db.items() for hit in hits)
+
+        db_names = list(per_db) + [os.path.join(self.db_directory, "missing")]
+        merged = vector_db.search_dbs("hotel cost", db_names, n_results=4)
+        self.assertEqual([(hit["distance"], hit["vector_db_name"], hit["id"]) for hit in merged], expected[:4])
+
+        filtered = vector_db.search_dbs("hotel cost", db_names, n_results=10, where={"chunk_index": {"$lt": 2}})
+        self.assertEqual(len(filtered), 6)
+        self.assertTrue(all(hit["metadata"]["chunk_index"] < 2 for hit in filtered))
+
+        keyword = vector_db.search_dbs("2003", db_names, n_results=3, mode="keyword")
+        self.assertEqual({hit["vector_db_name"] for hit in keyword}, set(per_db))
+        self.assertTrue(all("2003 INR" in hit["document"] for hit in keyword))
+
+    def test_search_results_are_cached_until_the_collection_changes(self):
+        """Repeated questions are served from cache, and writes invalidate cached results"""
+        vector_db.add_document_to_db("Hotel budget is 5000 INR.", "hotel.txt", db_directory=self.db_directory)
+        hits = vector_db.search_result_cache.hits
+        first = vector_db.search_db("hotel budget", n_results=5, db_directory=self.db_directory)
+        self.model.encode_calls.clear()
+        self.assertEqual(vector_db.search_db("hotel budget", n_results=5, db_directory=self.db_directory), first)
+        self.assertEqual(vector_db.search_result_cache.hits, hits + 1)
+        self.assertEqual(self.model.encode_calls, [])
+
+        vector_db.add_document_to_db("Meal budget is 800 INR.", "meals.txt", db_directory=self.db_directory)
+        updated = vector_db.search_db("hotel budget", n_results=5, db_directory=self.db_directory)
+        self.assertEqual(len(updated), 2)
+        # The query embedding was still reused from memory
+        self.assertEqual(self.model.encode_calls, [["Meal budget is 800 INR."]])
+        self.assertIn("hit_ratio", vector_db.cache_stats()["search_results"])
+
+    def test_small_ready_db_uses_flat_index(self):
+        """Complete small DBs are searched through the flat index with the same results as ChromaDB"""
+        text = "".join(f"Expense line {i}: vendor {i} charged {100 + i} INR. ".ljust(100) for i in range(40))
+        build = lambda db_directory: vector_db.add_document_to_db(text, "expenses.txt", db_directory=db_directory) > 0
+        queries = ["vendor 7 charge", "expense line 30"]
+        self.assertTrue(vector_db.ensure_document_db(self.db_directory, build))
+        with patch.object(vector_db, 'FLAT_INDEX_MAX_CHUNKS', 0):
+            expected = vector_db.search_db_many(queries, n_results=3, db_directory=self.db_directory)
+
+        with patch.object(vector_db, 'search_result_cache', LRUCache(0)), \
+             patch.object(vector_db.vector_db_registry, 'handles') as chroma:
+            flat = vector_db.search_db_many(queries, n_results=3, db_directory=self.db_directory)
+        self.assertEqual(flat, expected)
+        chroma.assert_not_called()
+        self.assertTrue(os.path.exists(os.path.join(self.db_directory, "flat_index", "embeddings.npy")))
+
+        filtered = vector_db.search_db("vendor", n_results=50, db_directory=self.db_directory,
+                                       where={"chunk_index": {"$lt": 2}})
+        self.assertEqual(len(filtered), 2)
+
+        # Writes drop the flat index; it is re-exported on the next search
+        vector_db.upsert_document(text + "Late fee 999 INR.", "expenses.txt", db_directory=self.db_directory)
+        self.assertFalse(os.path.exists(os.path.join(self.db_directory, "flat_index")))
+        self.assertIn("Late fee 999 INR.", vector_db.search_db("late fee", n_results=50, db_directory=self.db_directory))
+
+    def test_flat_index_export_does_not_block_deletes_or_other_dbs(self):
+        """A first search waiting on a DB being deleted holds no lock that the delete or other DBs need"""
+        build = lambda db_directory: vector_db.add_document_to_db("Taxi fare was 350 INR.", "trip.txt",
+                                                                  db_directory=db_directory) > 0
+        other = os.path.join(self.db_directory, "chroma_db_other")
+        self.assertTrue(vector_db.ensure_document_db(self.db_directory, build))
+        self.assertTrue(vector_db.ensure_document_db(other, build))
+        vector_db.vector_db_registry.close_all()
+
+        with vector_db.vector_db_registry.exclusive(self.db_directory):
+            # This search now waits for the registry entry, as it would behind delete_vector_db
+            search = threading.Thread(target=vector_db._get_flat_index, args=(self.db_directory,), daemon=True)
+            search.start()
+            time.sleep(0.2)
+            while_deleting = threading.Thread(target=lambda: (vector_db._bump_collection_version(self.db_directory),
+                                                              vector_db._get_flat_index(other)), daemon=True)
+            while_deleting.start()
+            while_deleting.join(10)
+            self.assertFalse(while_deleting.is_alive())
+        search.join(10)
+        self.assertFalse(search.is_alive())
+        self.assertIsNotNone(vector_db._get_flat_index(other))
+
+    def test_hits_can_carry_their_stored_embeddings(self):
+        """include_embeddings returns each hit's stored embedding from ChromaDB and from the flat index"""
+        text = "".join(f"Expense line {i}: vendor {i} charged {100 + i} INR. ".ljust(100) for i in range(20))
+        build = lambda db_directory: vector_db.add_document_to_db(text, "expenses.txt", db_directory=db_directory) > 0
+        self.assertTrue(vector_db.ensure_document_db(self.db_directory, build))
+
+        for mode, max_chunks in (("vector", 0), ("vector", 5000), ("hybrid", 5000), ("keyword", 5000)):
+            with patch.object(vector_db, 'FLAT_INDEX_MAX_CHUNKS', max_chunks):
+                self.model.encode_calls.clear()
+                hits = vector_db.search_db_hits_many(["vendor 7"], n_results=3, db_directory=self.db_directory,
+                                                     mode=mode, include_embeddings=True)[0]
+            self.assertEqual(len(hits), 3)
+            self.assertTrue(all(texts == ["vendor 7"] for texts in self.model.encode_calls), mode)
+            for hit in hits:
+                np.testing.assert_allclose(hit["embedding"], self.model._vector(hit["document"]), atol=1e-5)
+
+    def test_int8_flat_index_rescores_with_exact_embeddings(self):
+        """An int8 flat index is ~4x smaller per vector and, rescored with the candidates' exact embeddings, ranks like ChromaDB"""
+        text = "".join(f"Expense line {i}: vendor {i} charged {100 + i} INR. ".ljust(100) for i in range(200))
+        build = lambda db_directory: vector_db.add_document_to_db(text, "expenses.txt", db_directory=db_directory) > 0
+        queries = ["vendor 7 charge", "expense line 30"]
+        self.assertTrue(vector_db.ensure_document_db(self.db_directory, build))
+        with patch.object(vector_db, 'FLAT_INDEX_MAX_CHUNKS', 0):
+            expected = vector_db.search_db_hits_many(queries, n_results=3, db_directory=self.db_directory)
+
+        with patch.object(flat_index, 'FLAT_INDEX_DTYPE', 'int8'), \
+             patch.object(flat_index, '_SCORE_BLOCK_ROWS', 7), \
+             patch.object(vector_db, 'search_result_cache', LRUCache(0)), \
+             patch.object(vector_db, '_stored_embeddings', wraps=vector_db._stored_embeddings) as stored_embeddings:
+            hits = vector_db.search_db_hits_many(queries, n_results=3, db_directory=self.db_directory)
+            index = vector_db._get_flat_index(self.db_directory)
+        self.assertEqual(index.dtype, "int8")
+        self.assertEqual(index.bytes_per_vector(), 8 + 4)
+        self.assertEqual(sorted(os.listdir(flat_index.FlatIndex.path(self.db_directory))),
+                         ["chunks.json", "embeddings.npy", "scales.npy"])
+        # Only the top candidates' exact embeddings are fetched from the collection
+        stored_embeddings.assert_called_once()
+        self.assertLessEqual(len(stored_embeddings.call_args[0][1]), len(queries) * 3 * flat_index.FLAT_INDEX_RESCORE_MULTIPLIER)
+        self.assertLess(len(stored_embeddings.call_args[0][1]), len(index))
+        self.assertEqual([[hit["id"] for hit in query_hits] for query_hits in hits],
+                         [[hit["id"] for hit in query_hits] for query_hits in expected])
+        for query_hits, expected_hits in zip(hits, expected):
+            for hit, expected_hit in zip(query_hits, expected_hits):
+                self.assertAlmostEqual(hit["distance"], expected_hit["distance"], places=4)
+
+        # Codes and scales reconstruct the normalized embeddings closely
+        with vector_db.vector_db_registry.collection(self.db_directory) as collection:
+            stored = collection.get(ids=index.ids, include=["embeddings"])
+        by_id = dict(zip(stored["ids"], stored["embeddings"]))
+        vectors = np.asarray([by_id[chunk_id] for chunk_id in index.ids], dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        reconstructed = np.asarray(index.embeddings, dtype=np.float32) * np.asarray(index.scales)[:, None]
+        self.assertLess(np.abs(reconstructed - vectors).max(), 0.01)
+
+    def test_bfloat16_flat_index_scores_in_blocks(self):
+        """A bfloat16 flat index is half the size of a float32 one and, scored block by block, ranks the same"""
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((50, 16)).astype(np.float32)
+        ids = [f"chunk_{i}" for i in range(50)]
+        queries = rng.standard_normal((3, 16)).astype(np.float32)
+        exact = flat_index.FlatIndex.build(self.db_directory, ids, vectors, [""] * 50, [{}] * 50)
+        expected = [[hit[0] for hit in hits] for hits in exact.search_many(queries, 5)]
+
+        with patch.object(flat_index, '_SCORE_BLOCK_ROWS', 8):
+            index = flat_index.FlatIndex.build(self.db_directory, ids, vectors, [""] * 50, [{}] * 50, dtype="bfloat16")
+            hits = index.search_many(queries, 5)
+        self.assertEqual((index.dtype, index.bytes_per_vector()), ("bfloat16", 16 * 2))
+        self.assertEqual([[hit[0] for hit in query_hits] for query_hits in hits], expected)
+        np.testing.assert_allclose(index.vectors(ids), exact.vectors(ids), rtol=2 ** -8, atol=1e-7)
+
+    def test_hnsw_parameters_apply_to_new_collections(self):
+        """HNSW_* settings are stored on new collections and the flat index reports distances in their space"""
+        text = "".join(f"Expense line {i}: vendor {i} charged {100 + i} INR. ".ljust(100) for i in range(20))
+        build = lambda db_directory: vector_db.add_document_to_db(text, "expenses.txt", db_directory=db_directory) > 0
+        queries = ["vendor 7 charge", "expense line 12"]
+        with patch.object(vector_db, 'HNSW_SPACE', "cosine"), patch.object(vector_db, 'HNSW_M', 32), \
+             patch.object(vector_db, 'HNSW_SEARCH_EF', 64):
+            self.assertTrue(vector_db.ensure_document_db(self.db_directory, build))
+        self.assertEqual(vector_db.hnsw_settings(self.db_directory),
+                         {"hnsw:space": "cosine", "hnsw:M": 32, "hnsw:search_ef": 64})
+
+        with patch.object(vector_db, 'FLAT_INDEX_MAX_CHUNKS', 0):
+            expected = vector_db.search_db_hits_many(queries, n_results=3, db_directory=self.db_directory)
+        with patch.object(vector_db, 'search_result_cache', LRUCache(0)):
+            hits = vector_db.search_db_hits_many(queries, n_results=3, db_directory=self.db_directory)
+        self.assertEqual(vector_db._get_flat_index(self.db_directory).space, "cosine")
+        for query_hits, expected_hits in zip(hits, expected):
+            self.assertEqual([hit["id"] for hit in query_hits], [hit["id"] for hit in expected_hits])
+            for hit, expected_hit in zip(query_hits, expected_hits):
+                self.assertAlmostEqual(hit["distance"], expected_hit["distance"], places=4)
+
+        with self.assertRaises(ValueError):
+            vector_db.hnsw_metadata(space="manhattan")
+        with self.assertRaises(ValueError):
+            vector_db.hnsw_metadata(m=-1)
+        for parameter in ("m", "construction_ef", "search_ef"):
+            with self.assertRaises(ValueError):
+                vector_db.hnsw_metadata(**{parameter: 0})
+
+    def test_hnsw_configuration_persists_and_defaults_to_chromadb(self):
+        """Configured HNSW parameters survive reopening the DB; unset ones keep ChromaDB's defaults"""
+        build = lambda db_directory: vector_db.add_document_to_db("Taxi fare was 350 INR.", "trip.txt",
+                                                                  db_directory=db_directory) > 0
+        configured = os.path.join(self.db_directory, "chroma_db_configured")
+        default = os.path.join(self.db_directory, "chroma_db_default")
+        with patch.object(vector_db, 'HNSW_SEARCH_EF', 64), patch.object(vector_db, 'HNSW_M', 32):
+            self.assertTrue(vector_db.ensure_document_db(configured, build))
+        self.assertEqual(vector_db.hnsw_metadata(), {})
+        self.assertTrue(vector_db.ensure_document_db(default, build))
+        vector_db.vector_db_registry.close_all()
+
+        with vector_db.vector_db_registry.collection(configured) as collection:
+            hnsw = collection.configuration_json["hnsw"]
+        self.assertEqual((hnsw["ef_search"], hnsw["max_neighbors"], hnsw["ef_construction"]), (64, 32, 100))
+        self.assertEqual(vector_db.hnsw_settings(configured), {"hnsw:M": 32, "hnsw:search_ef": 64})
+
+        with vector_db.vector_db_registry.collection(default) as collection:
+            hnsw = collection.configuration_json["hnsw"]
+        self.assertEqual((hnsw["space"], hnsw["ef_search"]), ("l2", 100))
+        self.assertEqual(vector_db.hnsw_settings(default), {})
+
+    def test_hybrid_search_finds_exact_tokens(self):
+        """Keyword and hybrid modes surface chunks containing an exact invoice number"""
+        chunks = [f"Invoice INV-{i:05d} from Acme Travel for {1000 + i} INR." for i in range(30)]
+        with patch.object(vector_db, 'CHUNK_SIZE', 60), patch.object(vector_db, 'CHUNK_OVERLAP', 0):
+            vector_db.add_document_to_db("".join(chunk.ljust(60) for chunk in chunks), "invoices.txt",
+                                         db_directory=self.db_directory)
+
+        keyword = vector_db.search_db("INV-00017", n_results=1, db_directory=self.db_directory, mode="keyword")
+        self.assertIn("INV-00017", keyword[0])
+        hybrid = vector_db.search_db("INV-00017", n_results=3, db_directory=self.db_directory, mode="hybrid")
+        # The fake embeddings rank chunks randomly, so the keyword hit ties with the top vector hit
+        self.assertTrue(any("INV-00017" in chunk for chunk in hybrid[:2]))
+        self.assertEqual(len(hybrid), 3)
+        with self.assertRaises(ValueError):
+            vector_db.search_db("INV-00017", db_directory=self.db_directory, mode="fuzzy")
+
+    def test_keyword_index_is_backfilled(self):
+        """Collections without a keyword index get one on the first keyword search"""
+        vector_db.add_document_to_db("Parking receipt P-7781 for 120 INR.", "parking.txt",
+                                     db_directory=self.db_directory)
+        with vector_db.vector_db_registry.handles(self.db_directory) as (_, keyword_index):
+            keyword_index.delete(doc_key=None, chunk_ids=["parking.txt_0"])
+            self.assertEqual(len(keyword_index), 0)
+
+        results = vector_db.search_db("P-7781", db_directory=self.db_directory, mode="keyword")
+        self.assertEqual(results, ["Parking receipt P-7781 for 120 INR."])
+
+    def test_ensure_document_db_builds_once(self):
+        """Concurrent and later callers share a single build of a document DB"""
+        document_db = vector_db.document_db_directory("budget.txt", b"Hotel budget 5000", root=self.db_directory)
+        builds = []
+
+        def build(db_directory):
+            builds.append(db_directory)
+            time.sleep(0.1)
+            vector_db.add_document_to_db("Hotel budget 5000", "budget.txt", db_directory=db_directory)
+            return True
+
+        threads = [threading.Thread(target=vector_db.ensure_document_db, args=(document_db, build)) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertTrue(vector_db.ensure_document_db(document_db, build))
+        self.assertEqual(builds, [document_db])
+        self.assertTrue(vector_db.is_document_db_ready(document_db))
+
+    def test_ensure_document_db_without_wait_returns_during_build(self):
+        """wait=False does not block on an in-progress build"""
+        document_db = os.path.join(self.db_directory, "chroma_db_slow")
+        started = threading.Event()
+        release = threading.Event()
+
+        def build(db_directory):
+            vector_db.add_document_to_db("Meal allowance is 800 INR per day.", "policy.txt", db_directory=db_directory)
+            started.set()
+            release.wait()
+            return True
+
+        thread = threading.Thread(target=vector_db.ensure_document_db, args=(document_db, build))
+        thread.start()
+        started.wait()
+        self.assertTrue(vector_db.ensure_document_db(document_db, build, wait=False))
+        status = vector_db.document_build_status(document_db)
+        self.assertEqual((status["ready"], status["building"], status["chunks_indexed"]), (False, True, 1))
+        self.assertEqual(len(vector_db.search_db("meal", db_directory=document_db)), 1)
+
+        release.set()
+        thread.join()
+        self.assertTrue(vector_db.document_build_status(document_db)["ready"])
+
+    def test_ensure_document_db_cleans_up_failed_build(self):
+        """A failed build leaves no partial directory behind"""
+        document_db = os.path.join(self.db_directory, "chroma_db_failed")
+
+        def build(db_directory):
+            vector_db.add_document_to_db("partial", "failed.txt", db_directory=db_directory)
+            return False
+
+        self.assertFalse(vector_db.ensure_document_db(document_db, build))
+        self.assertFalse(os.path.exists(document_db))
+
+    def test_document_db_directory_is_content_addressed(self):
+        """The same bytes map to the same directory, changed bytes to a new one"""
+        first = vector_db.document_db_directory("report.pdf", b"v1")
+        self.assertEqual(first, vector_db.document_db_directory("report.pdf", b"v1"))
+        self.assertNotEqual(first, vector_db.document_db_directory("report.pdf", b"v2"))
+
+
+class TestSharedCollection(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="chroma_shared_test_")
+        self.cache = EmbeddingCache(os.path.join(self.root, "embeddings.sqlite3"))
+        patches = [
+            patch.object(vector_db, 'embedding_model', FakeEmbeddingModel()),
+            patch.object(vector_db, 'embedding_cache', self.cache),
+            patch.object(vector_db, 'query_embedding_cache', LRUCache(100)),
+            patch.object(vector_db, 'search_result_cache', LRUCache(100)),
+            patch.object(vector_db, 'SHARED_DB_DIRECTORY', os.path.join(self.root, "chroma_db_shared")),
+            patch.object(vector_db, 'VECTOR_DB_STORAGE_MODE', "shared"),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.cache.close)
+
+    def tearDown(self):
+        vector_db.vector_db_registry.close_all()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_documents_are_isolated_by_metadata(self):
+        """Each shared-collection name only sees its own document's chunks"""
+        hotel = vector_db.document_index_name("hotel.txt", b"hotel", bucket="data-storage", tenant="acme")
+        flight = vector_db.document_index_name("flight.txt", b"flight", bucket="data-storage", tenant="acme")
+        self.assertTrue(vector_db.is_shared_db_name(hotel))
+
+        vector_db.add_document_to_db("Hotel costs 4000 INR per night.", "hotel.txt", db_directory=hotel,
+                                     metadata={"bucket": "data-storage", "tenant": "acme"})
+        vector_db.add_document_to_db("Flight costs 9000 INR.", "flight.txt", db_directory=flight)
+
+        self.assertEqual(vector_db.search_db("cost", db_directory=hotel), ["Hotel costs 4000 INR per night."])
+        self.assertEqual(vector_db.search_db("cost", db_directory=flight), ["Flight costs 9000 INR."])
+        self.assertEqual(vector_db.search_db("cost", db_directory=hotel, where={"tenant": "other"}), [])
+        self.assertEqual(vector_db.search_db("costs", db_directory=flight, mode="hybrid"), ["Flight costs 9000 INR."])
+        self.assertEqual(vector_db.search_db("costs", db_directory=hotel, where={"tenant": "other"}, mode="keyword"), [])
+
+        self.assertTrue(vector_db.delete_vector_db(hotel))
+        self.assertEqual(vector_db.search_db("cost", db_directory=hotel), [])
+        self.assertEqual(vector_db.search_db("cost", db_directory=flight), ["Flight costs 9000 INR."])
+
+    def test_ensure_document_db_marks_shared_document_ready(self):
+        """Ready markers work for shared-collection names"""
+        name = vector_db.document_index_name("policy.txt", b"policy")
+        build = lambda db_name: vector_db.add_document_to_db("Meals up to 800 INR.", "policy.txt", db_directory=db_name) > 0
+        self.assertTrue(vector_db.ensure_document_db(name, build))
+        self.assertTrue(vector_db.is_document_db_ready(name))
+        vector_db.delete_vector_db(name)
+        self.assertFalse(vector_db.is_document_db_ready(name))
+
+    def test_migrate_directory_to_shared(self):
+        """A per-directory DB can be copied into the shared collection"""
+        source = os.path.join(self.root, "chroma_db_trip.txt_abc")
+        vector_db.add_document_to_db("Taxi fare was 350 INR.", "trip.txt", db_directory=source)
+
+        name = vector_db.migrate_directory_to_shared(source, bucket="data-storage", delete_source=True)
+        self.assertFalse(os.path.exists(source))
+        self.assertTrue(vector_db.is_document_db_ready(name))
+        self.assertEqual(vector_db.search_db("taxi", db_directory=name), ["Taxi fare was 350 INR."])
+
+    def test_migrated_document_is_reused_by_chat_lookup(self):
+        """A migrated DB is found under the name /chat resolves the same document to"""
+        content = b"Hotel in Pune cost 4000 INR per night."
+        doc_id = "reports/pune trip.txt"
+        source = vector_db.document_db_directory(doc_id, content, root=self.root)
+        vector_db.add_document_to_db(content.decode(), doc_id, db_directory=source,
+                                     metadata={"doc_id": doc_id, "bucket": "data-storage", "tenant": "acme"})
+
+        name = vector_db.migrate_directory_to_shared(source)
+        self.assertEqual(name, vector_db.document_index_name(doc_id, content, bucket="data-storage", tenant="acme"))
+        self.assertTrue(vector_db.is_document_db_ready(name))
+        self.assertEqual(vector_db.search_db("hotel", db_directory=name), [content.decode()])
+
+
+class TestVectorDBRegistry(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="chroma_registry_test_")
+        self.registry = vector_db.VectorDBRegistry(max_open=2)
+        self.addCleanup(self.registry.close_all)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def _directory(self, name):
+        return os.path.join(self.root, name)
+
+    def test_collection_is_reused(self):
+        """Repeated lookups for one directory share a single client"""
+        with self.registry.collection(self._directory("a")) as first:
+            pass
+        with self.registry.collection(self._directory("a")) as second:
+            pass
+        self.assertIs(first, second)
+        self.assertEqual(self.registry.stats()["open_handles"], 1)
+
+    def test_idle_handles_are_evicted_lru(self):
+        """Opening more directories than max_open evicts the least recently used"""
+        for name in ("a", "b", "c"):
+            with self.registry.collection(self._directory(name)):
+                pass
+        stats = self.registry.stats()
+        self.assertEqual(stats["open_handles"], 2)
+        self.assertEqual(stats["evictions"], 1)
+
+    def test_pinned_handles_are_not_evicted(self):
+        """A handle in use survives eviction pressure"""
+        with self.registry.collection(self._directory("a")) as pinned:
+            for name in ("b", "c", "d"):
+                with self.registry.collection(self._directory(name)):
+                    pass
+            with self.registry.collection(self._directory("a")) as again:
+                self.assertIs(pinned, again)
+
+    def test_exclusive_waits_for_users(self):
+        """exclusive() blocks until in-flight users release the directory"""
+        directory = self._directory("a")
+        events = []
+        acquired = threading.Event()
+
+        def user():
+            with self.registry.collection(directory):
+                acquired.set()
+                time.sleep(0.2)
+                events.append("user done")
+
+        thread = threading.Thread(target=user)
+        thread.start()
+        acquired.wait()
+        with self.registry.exclusive(directory):
+            events.append("exclusive")
+        thread.join()
+        self.assertEqual(events, ["user done", "exclusive"])
+        self.assertEqual(self.registry.stats()["open_handles"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+"""
+Tests for the background vector database reaper.
+"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import vector_db
+from embedding_cache import EmbeddingCache
+from search_cache import LRUCache
+from unittests.test_vector_db import FakeEmbeddingModel
+from vector_db_reaper import VectorDBReaper
+
+
+class TestVectorDBReaper(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="reaper_test_")
+        self.cache = EmbeddingCache(os.path.join(self.root, "embeddings.sqlite3"))
+        self.addCleanup(self.cache.close)
+        patches = [
+            patch.object(vector_db, 'embedding_model', FakeEmbeddingModel()),
+            patch.object(vector_db, 'embedding_cache', self.cache),
+            patch.object(vector_db, 'query_embedding_cache', LRUCache(100)),
+            patch.object(vector_db, 'search_result_cache', LRUCache(100)),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def _build(self, name, text):
+        directory = os.path.join(self.root, f"chroma_db_{name}")
+        self.assertTrue(vector_db.ensure_document_db(
+            directory, lambda db_directory: vector_db.add_document_to_db(text, f"{name}.txt", db_directory=db_directory) > 0))
+        return directory
+
+    def test_budget_evicts_least_recently_searched(self):
+        """Over budget, the least recently searched DB is deleted even with an open client"""
+        old = self._build("old", "Hotel invoice 4000 INR. " * 50)
+        new = self._build("new", "Taxi invoice 300 INR. " * 50)
+        vector_db.search_db("hotel", db_directory=old)
+        time.sleep(0.01)
+        vector_db.search_db("taxi", db_directory=new)
+
+        reaper = VectorDBReaper(root=self.root, disk_budget_mb=0, idle_ttl=0)
+        usage = reaper.sweep()["disk_usage_bytes"]
+        reaper.disk_budget_mb = (usage - 1) / (1024 * 1024)
+        stats = reaper.sweep()
+
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(new))
+        self.assertEqual((stats["evicted_budget"], stats["databases"]), (1, 1))
+        self.assertGreater(stats["bytes_freed"], 0)
+        self.assertEqual(len(vector_db.search_db("taxi", n_results=1, db_directory=new)), 1)
+
+    def test_idle_ttl_skips_recently_searched(self):
+        """Only DBs idle for longer than the TTL are deleted"""
+        idle = self._build("idle", "Meal receipt 250 INR.")
+        active = self._build("active", "Parking receipt 80 INR.")
+        vector_db.search_db("meal", db_directory=idle)
+        vector_db.search_db("parking", db_directory=active)
+        # Age the first DB's last search by an hour
+        with patch.dict(vector_db._last_used_times, {os.path.abspath(idle): time.time() - 3600}):
+            stats = VectorDBReaper(root=self.root, idle_ttl=60).sweep()
+
+        self.assertFalse(os.path.exists(idle))
+        self.assertTrue(os.path.exists(active))
+        self.assertEqual(stats["evicted_idle"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
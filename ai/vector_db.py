@@ -1,26 +1,152 @@
 import chromadb
-from sentence_transformers import SentenceTransformer
 import os
+import sys
 import uuid # Import uuid for generating unique IDs
 import shutil # Import shutil for directory removal
-import io
-import pandas as pd
-from PyPDF2 import PdfReader
-import docx
 import json
-from typing import Union
+import re
+import hashlib
+import atexit
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, Union
+from embedding_cache import EmbeddingCache, text_hash
+from embedding_batcher import MicroBatcher
+from document_extraction import iter_document_text, extract_document_text, get_text_cache
+from chunking import FixedCharChunker, make_chunker, TABLE_EXTENSIONS
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from flat_index import FlatIndex, UnsupportedFilter, DISTANCE_SPACES
+from search_cache import LRUCache, DEFAULT_QUERY_EMBEDDING_CACHE_SIZE, DEFAULT_SEARCH_RESULT_CACHE_SIZE
 
-# Initialize a local embedding model
+# Local embedding model, loaded lazily by get_embedding_model()
 # You can choose a different model depending on your needs
 # See https://www.sbert.net/docs/pretrained_models.html
-embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+# Inference backend: "torch" (SentenceTransformer), "onnx" or "onnx-int8" (ONNX Runtime on CPU)
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch").lower()
+embedding_model = None
+_embedding_model_lock = threading.Lock()
+_embedding_model_stats = {"load_seconds": None, "warmup_seconds": None, "warmed_up": False}
 
 # Default persistent DB directory
 DEFAULT_DB_DIRECTORY = "./chroma_db"
 
+# Number of texts handed to a single encode call
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "64"))
+# Worker processes for multi-process encoding (0 disables the pool)
+EMBEDDING_POOL_PROCESSES = int(os.environ.get("EMBEDDING_POOL_PROCESSES", "0"))
+# Minimum number of texts before the multi-process pool is worth its IPC overhead
+EMBEDDING_POOL_MIN_TEXTS = int(os.environ.get("EMBEDDING_POOL_MIN_TEXTS", "256"))
+
+_embedding_pool = None
+_embedding_pool_lock = threading.Lock()
+
+# Persistent embedding cache shared by get_embedding and get_embeddings, opened on first use
+# by get_embedding_cache() so that importing this module creates nothing on disk
+EMBEDDING_CACHE_ENABLED = os.environ.get("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+# Query embeddings from concurrent requests are encoded together in micro-batches on one worker
+# thread (see embedding_batcher); when disabled each request encodes on its own thread
+EMBEDDING_BATCHER_ENABLED = os.environ.get("EMBEDDING_BATCHER_ENABLED", "true").lower() == "true"
+embedding_batcher = MicroBatcher(lambda texts: get_embeddings(texts))
+
+# In-memory caches for repeated questions. Search results are keyed by the collection
+# version, which every write bumps, so stale results are never served.
+query_embedding_cache = LRUCache(DEFAULT_QUERY_EMBEDDING_CACHE_SIZE)
+search_result_cache = LRUCache(DEFAULT_SEARCH_RESULT_CACHE_SIZE)
+_collection_versions = {}
+_collection_versions_lock = threading.Lock()
+# Last search (or reuse) time per DB directory, used by the reaper for LRU/TTL eviction
+_last_used_times = {}
+
+# Name of the collection that holds document chunks in every DB directory
+COLLECTION_NAME = "document_chunks"
+# Maximum number of ChromaDB clients kept open by the registry
+VECTOR_DB_MAX_OPEN_CLIENTS = int(os.environ.get("VECTOR_DB_MAX_OPEN_CLIENTS", "32"))
+
+# HNSW index parameters of newly created collections (see hnsw_metadata). Unset ones
+# (None) are left to ChromaDB's own defaults, which differ between ChromaDB versions.
+# Existing collections keep the parameters they were created with.
+# Distance space: "l2" (squared L2), "cosine" or "ip" (inner product)
+HNSW_SPACE = os.environ.get("HNSW_SPACE", "").lower() or None
+# Graph links per node; more links raise recall and memory use
+HNSW_M = int(os.environ["HNSW_M"]) if os.environ.get("HNSW_M") else None
+# Candidate list size while inserting; larger builds a better graph, more slowly
+HNSW_CONSTRUCTION_EF = int(os.environ["HNSW_CONSTRUCTION_EF"]) if os.environ.get("HNSW_CONSTRUCTION_EF") else None
+# Candidate list size while querying; larger raises recall and query latency
+HNSW_SEARCH_EF = int(os.environ["HNSW_SEARCH_EF"]) if os.environ.get("HNSW_SEARCH_EF") else None
+
+# Storage mode for document indexes: "directory" keeps one ChromaDB directory per
+# document, "shared" keeps every document in one collection tagged with metadata
+VECTOR_DB_STORAGE_MODE = os.environ.get("VECTOR_DB_STORAGE_MODE", "directory").lower()
+SHARED_DB_DIRECTORY = os.environ.get("SHARED_DB_DIRECTORY", "./chroma_db_shared")
+# DB names with this prefix refer to one document inside the shared collection
+SHARED_DB_PREFIX = "shared:"
+
+# File written into a per-document DB directory once its index is fully built
+INDEX_COMPLETE_MARKER = ".index_complete"
+_document_build_locks = {}
+_document_build_locks_lock = threading.Lock()
+# Chunks written so far for document DBs that are currently being built
+_document_build_progress = {}
+
+# Sliding-window chunking parameters
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 100
+# Chunking strategy: "fixed", "sentence", "token", "table" or "auto" (see chunking.make_chunker)
+CHUNKING_STRATEGY = os.environ.get("CHUNKING_STRATEGY", "fixed").lower()
+# Spreadsheet ingest: "rows" packs whole CSV/Excel rows into chunks with the header repeated
+# (whatever CHUNKING_STRATEGY says), "text" chunks them like any other document
+SPREADSHEET_INGEST_MODE = os.environ.get("SPREADSHEET_INGEST_MODE", "rows").lower()
+# Chunking strategy of documents first indexed by upsert_document. "content" picks chunk
+# boundaries from the text itself, so an edit only changes the chunks around it instead of
+# shifting every later chunk. Documents already indexed are re-chunked with the strategy
+# stored with their chunks, so their unchanged text is never re-embedded
+UPSERT_CHUNKING_STRATEGY = os.environ.get("UPSERT_CHUNKING_STRATEGY", "content").lower()
+# Sequence limit of the embedding model in tokens; longer chunks are truncated when embedded
+EMBEDDING_MAX_TOKENS = int(os.environ.get("EMBEDDING_MAX_TOKENS", "256"))
+# Characters per segment when streaming text that is already extracted
+_TEXT_READ_SIZE = 64 * 1024
+
+# Complete per-document DBs with at most this many chunks are searched through a
+# memory-mapped exact-search index instead of ChromaDB's HNSW (0 disables it).
+# Its storage precision is set by FLAT_INDEX_DTYPE (see flat_index)
+FLAT_INDEX_MAX_CHUNKS = int(os.environ.get("FLAT_INDEX_MAX_CHUNKS", "5000"))
+# Loaded flat indexes (or None for DBs too large for one), keyed by DB directory.
+# _flat_indexes_lock only guards the dict; exports run under a per-directory build lock,
+# so one DB's export never blocks searches of other DBs
+_flat_indexes = OrderedDict()
+_flat_indexes_lock = threading.Lock()
+_flat_index_build_locks = {}
+
+# Layout version of snapshot files written by export_vector_db
+SNAPSHOT_FORMAT_VERSION = 1
+# Chunks read or written per ChromaDB call when exporting or importing a snapshot
+SNAPSHOT_BATCH_SIZE = int(os.environ.get("SNAPSHOT_BATCH_SIZE", "1000"))
+
+# Retrieval mode for search_db: "vector", "keyword" (BM25) or "hybrid" (both, fused with RRF)
+SEARCH_MODE = os.environ.get("SEARCH_MODE", "vector").lower()
+SEARCH_MODES = ("vector", "keyword", "hybrid")
+# Candidates fetched from each retriever per requested hybrid result before fusion
+HYBRID_CANDIDATE_MULTIPLIER = int(os.environ.get("HYBRID_CANDIDATE_MULTIPLIER", "4"))
+# Threads that search the DBs of a fan-out search (search_dbs_hits_many) concurrently
+SEARCH_FANOUT_WORKERS = int(os.environ.get("SEARCH_FANOUT_WORKERS", "8"))
+
+_fanout_executor = None
+_fanout_executor_lock = threading.Lock()
+
 def process_document_content(content: bytes, file_extension: str) -> str:
     """
     Process document content based on file type and extract text.
+    The format is detected from the content and the text is extracted in the
+    document extraction pool (see document_extraction.extract_document_text).
     
     Args:
         content: The raw document content in bytes
@@ -30,174 +156,1284 @@ def process_document_content(content: bytes, file_extension: str) -> str:
         Extracted text content from the document
     """
     try:
-        file_extension = file_extension.lower()
-        
-        if file_extension == '.txt':
-            return content.decode('utf-8')
-            
-        elif file_extension == '.pdf':
-            pdf_file = io.BytesIO(content)
-            reader = PdfReader(pdf_file)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            return text
-            
-        elif file_extension in ['.xls', '.xlsx']:
-            excel_file = io.BytesIO(content)
-            df = pd.read_excel(excel_file)
-            # Convert DataFrame to string representation
-            return df.to_string()
-            
-        elif file_extension in ['.doc', '.docx']:
-            doc_file = io.BytesIO(content)
-            doc = docx.Document(doc_file)
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text
-            
-        elif file_extension == '.json':
-            return json.dumps(json.loads(content), indent=2)
-            
-        elif file_extension == '.csv':
-            csv_file = io.BytesIO(content)
-            df = pd.read_csv(csv_file)
-            return df.to_string()
-            
-        else:
-            raise ValueError(f"Unsupported file type: {file_extension}")
-            
+        return extract_document_text(content, file_extension)
     except Exception as e:
         print(f"Error processing document: {e}")
         raise
 
+def iter_chunks(segments: Iterable[str], chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> Iterator[str]:
+    """
+    Splits a stream of text segments into overlapping fixed-size chunks.
+    Produces the same chunks as sliding a window over the concatenated text,
+    while only buffering the unconsumed tail of the stream.
+    """
+    return FixedCharChunker(chunk_size, overlap).chunk(segments)
+
+def _chunking_strategy(file_extension: str) -> str:
+    """
+    The strategy add_document_to_db chunks a document of the given type with: "table"
+    for spreadsheets in "rows" SPREADSHEET_INGEST_MODE and CHUNKING_STRATEGY otherwise.
+    """
+    if SPREADSHEET_INGEST_MODE == "rows" and file_extension.lower() in TABLE_EXTENSIONS:
+        return "table"
+    return CHUNKING_STRATEGY
+
+def get_document_chunker(file_extension: str, strategy: Optional[str] = None):
+    """
+    Returns the chunker used to index a document of the given type.
+
+    Args:
+        file_extension: The document's extension (e.g. '.csv').
+        strategy: One of chunking.CHUNKING_STRATEGIES; defaults to the strategy
+            add_document_to_db uses (see _chunking_strategy).
+    """
+    return make_chunker(strategy or _chunking_strategy(file_extension), file_extension, chunk_size=CHUNK_SIZE,
+                        overlap=CHUNK_OVERLAP, model_name=EMBEDDING_MODEL_NAME, max_tokens=EMBEDDING_MAX_TOKENS)
+
+def _ingest_batch_size() -> int:
+    """
+    Chunks embedded and written per step of streaming ingest. With the multi-process
+    pool enabled, steps hold at least EMBEDDING_POOL_MIN_TEXTS chunks so that their
+    encode calls are large enough to go to the pool; each call still encodes in
+    batches of EMBEDDING_BATCH_SIZE.
+    """
+    if EMBEDDING_POOL_PROCESSES > 0 and EMBEDDING_BACKEND == "torch":
+        return max(EMBEDDING_BATCH_SIZE, EMBEDDING_POOL_MIN_TEXTS)
+    return EMBEDDING_BATCH_SIZE
+
+def _batched(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def _rss_mb() -> Optional[float]:
+    """Peak resident set size of this process in MB, where the platform reports it."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is reported in KB on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def get_embedding_model():
+    """
+    Returns the embedding model, loading it on first use.
+    Loading happens at most once per process, behind a lock.
+    """
+    global embedding_model
+    if embedding_model is not None:
+        return embedding_model
+    with _embedding_model_lock:
+        if embedding_model is None:
+            start = time.perf_counter()
+            if EMBEDDING_BACKEND in ("onnx", "onnx-int8"):
+                from embedding_backends import load_onnx_embedding_model
+                embedding_model = load_onnx_embedding_model(EMBEDDING_MODEL_NAME,
+                                                            quantized=EMBEDDING_BACKEND == "onnx-int8")
+            else:
+                # Imported here so processes that never embed do not pay for torch
+                from sentence_transformers import SentenceTransformer
+                embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+            _embedding_model_stats["load_seconds"] = time.perf_counter() - start
+            print(f"Loaded embedding model {EMBEDDING_MODEL_NAME} ({EMBEDDING_BACKEND}) "
+                  f"in {_embedding_model_stats['load_seconds']:.2f}s.")
+        return embedding_model
+
+def warm_up_embedding_model() -> dict:
+    """
+    Loads the embedding model and runs one dummy encode so the first real
+    request does not pay for model loading or lazy initialisation.
+
+    Returns:
+        The embedding model status (see embedding_model_status).
+    """
+    model = get_embedding_model()
+    start = time.perf_counter()
+    model.encode(["warm-up"], batch_size=1)
+    _embedding_model_stats["warmup_seconds"] = time.perf_counter() - start
+    _embedding_model_stats["warmed_up"] = True
+    print(f"Embedding model warm-up encode took {_embedding_model_stats['warmup_seconds']:.2f}s.")
+    return embedding_model_status()
+
+def embedding_model_status() -> dict:
+    """
+    Reports whether the embedding model is loaded and warmed up, how long that
+    took, and the process's peak RSS.
+    """
+    return {
+        "model": EMBEDDING_MODEL_NAME,
+        "backend": EMBEDDING_BACKEND,
+        "loaded": embedding_model is not None,
+        **_embedding_model_stats,
+        "peak_rss_mb": _rss_mb(),
+        "batcher": embedding_batcher.stats() if EMBEDDING_BATCHER_ENABLED else None,
+    }
+
+def _embedding_cache_key() -> str:
+    """
+    Model key for the embedding cache. Backends produce slightly different
+    vectors, so non-default backends get their own cache entries.
+    """
+    if EMBEDDING_BACKEND == "torch":
+        return EMBEDDING_MODEL_NAME
+    return f"{EMBEDDING_MODEL_NAME}:{EMBEDDING_BACKEND}"
+
 def get_embedding(text: str):
     """
     Generates an embedding for the given text using the local model.
+    Reads through the embedding cache.
+    """
+    return get_embeddings([text])[0]
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    Returns the persistent embedding cache, opening it on first use.
+    Returns None when EMBEDDING_CACHE_ENABLED is false.
+    """
+    global embedding_cache
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+    with _embedding_cache_lock:
+        if embedding_cache is None:
+            embedding_cache = EmbeddingCache()
+        return embedding_cache
+
+def get_query_embeddings(queries: List[str]) -> List[List[float]]:
+    """
+    Embeds search queries, reusing recently seen query embeddings from memory.
+    Misses are encoded in micro-batches shared with concurrent requests (see
+    embedding_batcher) through get_embeddings, and so the persistent embedding cache.
+    """
+    cache_key = _embedding_cache_key()
+    embeddings = [query_embedding_cache.get((cache_key, query)) for query in queries]
+    missing = list(dict.fromkeys(query for query, embedding in zip(queries, embeddings) if embedding is None))
+    if missing:
+        encoded = embedding_batcher.encode(missing) if EMBEDDING_BATCHER_ENABLED else get_embeddings(missing)
+        by_query = dict(zip(missing, encoded))
+        for query, embedding in by_query.items():
+            query_embedding_cache.put((cache_key, query), embedding)
+        embeddings = [embedding if embedding is not None else by_query[query]
+                      for query, embedding in zip(queries, embeddings)]
+    return embeddings
+
+def _get_embedding_pool():
+    """
+    Returns the multi-process encode pool, starting it on first use.
+    Returns None when EMBEDDING_POOL_PROCESSES is 0 or the backend is not torch
+    (ONNX Runtime already spreads a batch across cores).
     """
-    return embedding_model.encode(text).tolist()
+    global _embedding_pool
+    if EMBEDDING_POOL_PROCESSES <= 0 or EMBEDDING_BACKEND != "torch":
+        return None
+    with _embedding_pool_lock:
+        if _embedding_pool is None:
+            print(f"Starting embedding pool with {EMBEDDING_POOL_PROCESSES} processes.")
+            _embedding_pool = get_embedding_model().start_multi_process_pool(
+                target_devices=["cpu"] * EMBEDDING_POOL_PROCESSES
+            )
+            atexit.register(stop_embedding_pool)
+        return _embedding_pool
+
+def stop_embedding_batcher(timeout: Optional[float] = None):
+    """
+    Encodes the queries still queued for micro-batching and stops the batcher thread.
+    """
+    embedding_batcher.stop(timeout)
+
+def stop_embedding_pool():
+    """
+    Stops the multi-process encode pool if it was started.
+    """
+    global _embedding_pool
+    with _embedding_pool_lock:
+        if _embedding_pool is not None:
+            get_embedding_model().stop_multi_process_pool(_embedding_pool)
+            _embedding_pool = None
+            print("Embedding pool stopped.")
+
+def get_embeddings(texts: List[str], batch_size: int = None) -> List[List[float]]:
+    """
+    Generates embeddings for a list of texts in batches.
+
+    Texts already in the embedding cache are not re-encoded. Large inputs are
+    spread across the multi-process pool when one is configured; otherwise the
+    texts are encoded in-process.
+
+    Args:
+        texts: The texts to embed.
+        batch_size: Number of texts per encode call (defaults to EMBEDDING_BATCH_SIZE).
+
+    Returns:
+        A list of embeddings, in the same order as the input texts.
+    """
+    if not texts:
+        return []
+    embedding_cache = get_embedding_cache()
+    if embedding_cache is None:
+        return _encode(texts, batch_size)
+
+    cache_key = _embedding_cache_key()
+    embeddings = embedding_cache.get_many(cache_key, texts)
+    # Encode each distinct missing text once
+    missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+    if missing:
+        encoded = _encode(missing, batch_size)
+        embedding_cache.put_many(cache_key, missing, encoded)
+        by_text = dict(zip(missing, encoded))
+        embeddings = [embedding if embedding is not None else by_text[text]
+                      for text, embedding in zip(texts, embeddings)]
+    return embeddings
+
+def _encode(texts: List[str], batch_size: int = None) -> List[List[float]]:
+    """
+    Encodes texts with the embedding model, bypassing the cache.
+    """
+    batch_size = batch_size or EMBEDDING_BATCH_SIZE
+    model = get_embedding_model()
+    pool = _get_embedding_pool() if len(texts) >= EMBEDDING_POOL_MIN_TEXTS else None
+    if pool is not None:
+        embeddings = model.encode(texts, batch_size=batch_size, pool=pool)
+    else:
+        embeddings = model.encode(texts, batch_size=batch_size)
+    return embeddings.tolist()
+
+def hnsw_metadata(space: Optional[str] = None, m: Optional[int] = None, construction_ef: Optional[int] = None,
+                  search_ef: Optional[int] = None) -> dict:
+    """
+    Returns the collection metadata that sets ChromaDB's HNSW index parameters,
+    defaulting each one to its HNSW_* setting. Parameters that are neither given
+    nor configured are left out, so ChromaDB applies its own defaults; with
+    nothing configured the result is empty.
+
+    Raises:
+        ValueError: If the space is unknown or a size parameter is not positive.
+    """
+    space = space if space is not None else HNSW_SPACE
+    metadata = {
+        "hnsw:space": space.lower() if space is not None else None,
+        "hnsw:M": m if m is not None else HNSW_M,
+        "hnsw:construction_ef": construction_ef if construction_ef is not None else HNSW_CONSTRUCTION_EF,
+        "hnsw:search_ef": search_ef if search_ef is not None else HNSW_SEARCH_EF,
+    }
+    metadata = {key: value for key, value in metadata.items() if value is not None}
+    if metadata.get("hnsw:space", "l2") not in DISTANCE_SPACES:
+        raise ValueError(f"Unknown HNSW space '{metadata['hnsw:space']}', expected one of {DISTANCE_SPACES}")
+    for key, value in metadata.items():
+        if key != "hnsw:space" and value <= 0:
+            raise ValueError(f"{key} must be positive, got {value}")
+    return metadata
+
+def collection_space(collection) -> str:
+    """Returns the distance space a collection's HNSW index was created with."""
+    return (collection.metadata or {}).get("hnsw:space", "l2")
+
+class _RegistryEntry:
+    """
+    Cached client and collection for one DB directory.
+    All fields are guarded by `lock`; `idle` is signalled when `users` drops to 0.
+    """
+
+    def __init__(self, db_directory: str):
+        self.db_directory = db_directory
+        self.lock = threading.RLock()
+        self.idle = threading.Condition(self.lock)
+        self.client = None
+        self.collection = None
+        self.keyword_index = None
+        self.users = 0
+        self.last_used = time.time()
+        self.removed = False
+
+    def open(self):
+        self.client = chromadb.PersistentClient(path=self.db_directory)
+        # The metadata only takes effect when the collection is created; ChromaDB rejects an empty one
+        self.collection = self.client.get_or_create_collection(name=COLLECTION_NAME,
+                                                                 metadata=hnsw_metadata() or None)
+
+    def get_keyword_index(self) -> BM25Index:
+        with self.lock:
+            if self.keyword_index is None:
+                self.keyword_index = BM25Index(self.db_directory)
+            return self.keyword_index
+
+    def close(self):
+        if self.keyword_index is not None:
+            self.keyword_index.close()
+            self.keyword_index = None
+        if self.client is not None:
+            try:
+                close = getattr(self.client, "close", None)
+                if close is not None:
+                    close()
+            except Exception as e:
+                print(f"Error closing ChromaDB client for {self.db_directory}: {e}")
+        self.client = None
+        self.collection = None
+
+
+class VectorDBRegistry:
+    """
+    Process-wide, thread-safe cache of ChromaDB clients and collections keyed by DB directory.
+
+    Handles are reference counted while in use. Idle handles are closed in
+    least-recently-used order once more than `max_open` directories are cached.
+    """
+
+    def __init__(self, max_open: int = VECTOR_DB_MAX_OPEN_CLIENTS):
+        self.max_open = max_open
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    @staticmethod
+    def _key(db_directory: str) -> str:
+        return os.path.abspath(db_directory)
+
+    def _entry(self, key: str) -> _RegistryEntry:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = _RegistryEntry(key)
+                self._entries[key] = entry
+            self._entries.move_to_end(key)
+            return entry
+
+    def _evict_idle(self):
+        """Closes idle handles, oldest first, until the cache is within max_open."""
+        with self._lock:
+            for key in list(self._entries):
+                if len(self._entries) <= self.max_open:
+                    break
+                entry = self._entries[key]
+                # Never block on a directory that is being opened or deleted
+                if not entry.lock.acquire(blocking=False):
+                    continue
+                try:
+                    if entry.users == 0:
+                        entry.close()
+                        entry.removed = True
+                        del self._entries[key]
+                        self.evictions += 1
+                        print(f"Evicted idle ChromaDB handle for {entry.db_directory}.")
+                finally:
+                    entry.lock.release()
+
+    @contextmanager
+    def _pinned(self, db_directory: str):
+        """
+        Yields the registry entry for db_directory, opening the client if needed.
+        The entry is pinned (never evicted or deleted) until the block exits.
+        """
+        key = self._key(db_directory)
+        while True:
+            entry = self._entry(key)
+            with entry.lock:
+                if entry.removed:
+                    continue
+                if entry.collection is None:
+                    entry.open()
+                entry.users += 1
+                break
+        self._evict_idle()
+        try:
+            yield entry
+        finally:
+            with entry.lock:
+                entry.users -= 1
+                entry.last_used = time.time()
+                if entry.users == 0:
+                    entry.idle.notify_all()
+
+    @contextmanager
+    def collection(self, db_directory: str):
+        """
+        Yields the cached collection for db_directory, opening the client if needed.
+        The handle is pinned (never evicted or deleted) until the block exits.
+        """
+        with self._pinned(db_directory) as entry:
+            yield entry.collection
+
+    @contextmanager
+    def handles(self, db_directory: str):
+        """
+        Yields the cached (collection, keyword index) pair for db_directory, pinned
+        until the block exits.
+        """
+        with self._pinned(db_directory) as entry:
+            yield entry.collection, entry.get_keyword_index()
+
+    @contextmanager
+    def exclusive(self, db_directory: str):
+        """
+        Waits for all users of db_directory to finish, closes its cached handle and
+        blocks new users until the block exits. Used before deleting a directory.
+        """
+        key = self._key(db_directory)
+        while True:
+            entry = self._entry(key)
+            with entry.lock:
+                if entry.removed:
+                    continue
+                while entry.users > 0:
+                    entry.idle.wait()
+                entry.close()
+                try:
+                    yield
+                finally:
+                    entry.removed = True
+                    with self._lock:
+                        if self._entries.get(key) is entry:
+                            del self._entries[key]
+                return
+
+    def close_all(self):
+        """Closes every idle cached handle."""
+        with self._lock:
+            entries = list(self._entries.items())
+        for key, entry in entries:
+            with entry.lock:
+                if entry.users == 0:
+                    entry.close()
+                    entry.removed = True
+                    with self._lock:
+                        if self._entries.get(key) is entry:
+                            del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "open_handles": len(self._entries),
+                "max_open": self.max_open,
+                "evictions": self.evictions,
+            }
+
+
+vector_db_registry = VectorDBRegistry()
+atexit.register(vector_db_registry.close_all)
+
+def collection_version(db_directory: str) -> int:
+    """
+    Returns the write version of a DB directory. Cached search results are keyed by it.
+    """
+    with _collection_versions_lock:
+        return _collection_versions.get(os.path.abspath(db_directory), 0)
+
+def _bump_collection_version(db_directory: str):
+    """Invalidates cached search results and the flat index of a DB directory after a write or delete."""
+    with _collection_versions_lock:
+        key = os.path.abspath(db_directory)
+        _collection_versions[key] = _collection_versions.get(key, 0) + 1
+    with _flat_indexes_lock:
+        _flat_indexes.pop(key, None)
+    if os.path.exists(FlatIndex.path(db_directory)):
+        FlatIndex.remove(db_directory)
+
+def _get_flat_index(db_directory: str) -> Optional[FlatIndex]:
+    """
+    Returns the flat exact-search index of a complete, small per-document DB,
+    exporting it from the collection on first use. Returns None for DBs that
+    are still being built or hold more than FLAT_INDEX_MAX_CHUNKS chunks.
+    """
+    if FLAT_INDEX_MAX_CHUNKS <= 0:
+        return None
+    key = os.path.abspath(db_directory)
+    with _flat_indexes_lock:
+        if key in _flat_indexes:
+            _flat_indexes.move_to_end(key)
+            return _flat_indexes[key]
+        build_lock = _flat_index_build_locks.setdefault(key, threading.Lock())
+
+    # Never hold _flat_indexes_lock while opening the collection: delete_vector_db holds the
+    # registry entry lock and _bump_collection_version takes _flat_indexes_lock
+    with build_lock:
+        with _flat_indexes_lock:
+            if key in _flat_indexes:
+                # Loaded by a search that held the build lock before us
+                return _flat_indexes[key]
+        if not is_document_db_ready(db_directory):
+            return None
+
+        version = collection_version(db_directory)
+        index = FlatIndex.load(db_directory) if FlatIndex.exists(db_directory) else None
+        if index is None or not index.stored_as():
+            # Not exported yet, or stored with another FLAT_INDEX_DTYPE
+            index = None
+            with vector_db_registry.collection(db_directory) as collection:
+                if 0 < collection.count() <= FLAT_INDEX_MAX_CHUNKS:
+                    page = collection.get(include=["embeddings", "documents", "metadatas"])
+                    index = FlatIndex.build(db_directory, page["ids"], page["embeddings"], page["documents"],
+                                            page["metadatas"], space=collection_space(collection))
+
+        with _flat_indexes_lock:
+            # Checked under the lock _bump_collection_version pops with, so a write either
+            # shows up here or evicts the entry after it is added
+            current = collection_version(db_directory) == version
+            if current:
+                _flat_indexes[key] = index
+                while len(_flat_indexes) > VECTOR_DB_MAX_OPEN_CLIENTS:
+                    _flat_indexes.popitem(last=False)
+        if not current:
+            # A write raced the export; it is rebuilt on the next search
+            if index is not None:
+                FlatIndex.remove(db_directory)
+            return None
+        return index
+
+def _stored_embeddings(db_directory: str, ids: List[str]) -> List[List[float]]:
+    """
+    Exact float32 embeddings of chunks, read from the collection; used to rescore
+    the candidates of a compressed flat index.
+    """
+    with vector_db_registry.collection(db_directory) as collection:
+        page = collection.get(ids=ids, include=["embeddings"])
+    by_id = dict(zip(page["ids"], page["embeddings"]))
+    return [by_id[chunk_id] for chunk_id in ids]
+
+def _touch_db(db_directory: str):
+    """Records that a DB directory was just searched or reused."""
+    with _collection_versions_lock:
+        _last_used_times[os.path.abspath(db_directory)] = time.time()
+
+def last_used_time(db_directory: str) -> Optional[float]:
+    """
+    Returns when a DB directory was last searched or reused by this process, or None.
+    """
+    with _collection_versions_lock:
+        return _last_used_times.get(os.path.abspath(db_directory))
+
+def cache_stats() -> dict:
+    """
+    Reports sizes and hit ratios of the query-embedding, search-result, embedding and extracted text caches.
+    """
+    embedding_cache = get_embedding_cache()
+    text_cache = get_text_cache()
+    return {
+        "query_embeddings": query_embedding_cache.stats(),
+        "search_results": search_result_cache.stats(),
+        "embeddings": embedding_cache.stats() if embedding_cache is not None else None,
+        "extracted_texts": text_cache.stats() if text_cache is not None else None,
+        "vector_db_clients": vector_db_registry.stats(),
+    }
 
 def get_or_create_vector_db_client(db_directory: str = DEFAULT_DB_DIRECTORY):
     """
     Gets or creates a persistent ChromaDB client.
+    Note: the returned client is not registry-managed; the caller should close it.
     """
     return chromadb.PersistentClient(path=db_directory)
 
 def get_or_create_vector_db_collection(db_directory: str = DEFAULT_DB_DIRECTORY):
     """
-    Gets or creates a persistent ChromaDB client and returns the collection.
+    Returns the registry-cached collection for the given directory.
+    Note: the handle is not pinned; prefer `vector_db_registry.collection()` for
+    anything that may run concurrently with `delete_vector_db`.
+    """
+    with vector_db_registry.collection(db_directory) as collection:
+        return collection, db_directory
+
+def hnsw_settings(db_name: str = DEFAULT_DB_DIRECTORY) -> dict:
+    """
+    Returns the HNSW parameters ("hnsw:*" metadata) a vector DB's collection was
+    created with. Parameters left at ChromaDB's defaults are omitted.
     """
-    client = get_or_create_vector_db_client(db_directory)
-    collection = client.get_or_create_collection(name="document_chunks")
-    return collection, db_directory
+    target_directory, _ = _resolve_db(db_name)
+    with vector_db_registry.collection(target_directory) as collection:
+        return {key: value for key, value in (collection.metadata or {}).items() if key.startswith("hnsw:")}
 
-def add_document_to_db(document_content: Union[bytes, str], doc_id: str, db_directory: str = DEFAULT_DB_DIRECTORY):
+def is_shared_db_name(db_name: str) -> bool:
+    """
+    Returns True if the DB name refers to a document in the shared collection.
+    """
+    return db_name.startswith(SHARED_DB_PREFIX)
+
+def _resolve_db(db_name: str) -> Tuple[str, Optional[str]]:
+    """
+    Maps a DB name to the directory that stores it and, for shared-collection
+    names, the document key its chunks are tagged with.
+    """
+    if is_shared_db_name(db_name):
+        return SHARED_DB_DIRECTORY, db_name[len(SHARED_DB_PREFIX):]
+    return db_name, None
+
+def _combine_where(*clauses: Optional[dict]) -> Optional[dict]:
+    clauses = [clause for clause in clauses if clause]
+    if not clauses:
+        return None
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
+
+def _document_segments(document_content: Union[bytes, str, Iterable[str]], file_extension: str) -> Iterator[str]:
+    """Streams document text: extracted by type for bytes, read in slices for text, as is for segments."""
+    if isinstance(document_content, bytes):
+        return iter_document_text(document_content, file_extension)
+    if isinstance(document_content, str):
+        return (document_content[i:i + _TEXT_READ_SIZE] for i in range(0, len(document_content), _TEXT_READ_SIZE))
+    return iter(document_content)
+
+def _chunk_metadata(file_extension: str, chunk_index: int, chunk: str, base_metadata: dict, chunking: str) -> dict:
+    """
+    Metadata stored with every chunk. chunk_hash lets upsert_document skip unchanged
+    chunks, and chunking (the strategy the document was chunked with) lets it cut the
+    new version at the same boundaries.
+    """
+    return {"file_type": file_extension[1:], "chunk_index": chunk_index, "chunk_hash": text_hash(chunk),
+            "chunking": chunking, **base_metadata}
+
+def add_document_to_db(document_content: Union[bytes, str, Iterable[str]], doc_id: str, db_directory: str = DEFAULT_DB_DIRECTORY,
+                       progress_callback: Optional[Callable[[int], None]] = None,
+                       metadata: Optional[dict] = None) -> int:
     """
     Adds a document to the specified ChromaDB collection.
 
+    The document is streamed through extract -> chunk -> embed -> write: text is
+    chunked as it is extracted, chunks are embedded in groups of
+    _ingest_batch_size(), and each group is written before the next one is
+    embedded. Memory stays bounded by the group size, and chunks written so far
+    are already searchable while the rest of the document is being indexed.
+
     Args:
-        document_content: The document content (either as text string or bytes)
+        document_content: The document content (either as text string or bytes), or
+            its already extracted text as consecutive segments
         doc_id: A unique ID for the document (should include file extension)
-        db_directory: The directory path for the persistent ChromaDB.
+        db_directory: The directory path for the persistent ChromaDB, or a
+            shared-collection name (see document_index_name).
+        progress_callback: Optional callable invoked with the number of chunks written so far.
+        metadata: Optional extra metadata (e.g. bucket, tenant) stored with every chunk.
+
+    Returns:
+        The number of chunks added.
     """
     try:
-        collection, current_db_directory = get_or_create_vector_db_collection(db_directory)
+        target_directory, doc_key = _resolve_db(db_directory)
+        # Chunk ids must be unique across documents in the shared collection
+        id_prefix = doc_key or doc_id
+        base_metadata = {key: value for key, value in (metadata or {}).items() if value is not None}
+        if doc_key:
+            base_metadata["doc_key"] = doc_key
 
         # Get file extension from doc_id
         _, file_extension = os.path.splitext(doc_id)
-        
-        # Process document content based on type
-        if isinstance(document_content, bytes):
-            text_content = process_document_content(document_content, file_extension)
-        else:
-            text_content = document_content
-
-        # Split text into chunks with overlap for better context
-        chunk_size = 500
-        overlap = 100
-        chunks = []
-        start = 0
-        while start < len(text_content):
-            end = start + chunk_size
-            chunk = text_content[start:end]
-            chunks.append(chunk)
-            start = end - overlap
-
-        chunk_ids = [f"{doc_id}_{i}" for i in range(len(chunks))]
-        embeddings = [get_embedding(chunk) for chunk in chunks]
-
-        # Add chunks and embeddings to ChromaDB
-        collection.add(
-            embeddings=embeddings,
-            documents=chunks,
-            ids=chunk_ids,
-            metadatas=[{"file_type": file_extension[1:], "chunk_index": i} for i in range(len(chunks))]
-        )
-        print(f"Added {len(chunks)} chunks for document {doc_id} to ChromaDB at {current_db_directory}.")
+
+        chunk_count = 0
+        chunking = _chunking_strategy(file_extension)
+        chunker = get_document_chunker(file_extension, chunking)
+        for chunks in _batched(chunker.chunk(_document_segments(document_content, file_extension)), _ingest_batch_size()):
+            embeddings = get_embeddings(chunks)
+            indexes = range(chunk_count, chunk_count + len(chunks))
+
+            ids = [f"{id_prefix}_{i}" for i in indexes]
+
+            # Add this batch of chunks and embeddings to ChromaDB and the keyword index
+            with vector_db_registry.handles(target_directory) as (collection, keyword_index):
+                collection.add(
+                    embeddings=embeddings,
+                    documents=chunks,
+                    ids=ids,
+                    metadatas=[_chunk_metadata(file_extension, i, chunk, base_metadata, chunking)
+                               for i, chunk in zip(indexes, chunks)]
+                )
+                keyword_index.add(ids, chunks, doc_key=doc_key)
+            _bump_collection_version(target_directory)
+            chunk_count += len(chunks)
+            _record_build_progress(db_directory, len(chunks))
+            if progress_callback is not None:
+                progress_callback(chunk_count)
+
+        print(f"Added {chunk_count} chunks for document {doc_id} to ChromaDB at {db_directory}.")
+        return chunk_count
 
     except Exception as e:
         print(f"Error adding document {doc_id} to ChromaDB: {e}")
         raise
 
-def search_db(query: str, n_results: int = 5, db_directory: str = DEFAULT_DB_DIRECTORY):
+def _stored_document_chunks(collection, id_prefix: str, doc_key: Optional[str]) -> Tuple[dict, Optional[str]]:
+    """
+    Reads the chunks of one document already in a collection.
+
+    Returns:
+        A dict mapping chunk index to (chunk id, chunk hash), and the chunking strategy
+        the chunks were stored with (None if they record none). Chunks written before
+        chunk hashes were stored are hashed from their text.
+    """
+    stored = {}
+    chunking = None
+    offset = 0
+    where = {"doc_key": doc_key} if doc_key else None
+    while True:
+        page = collection.get(where=where, include=["documents", "metadatas"], limit=EMBEDDING_BATCH_SIZE, offset=offset)
+        if not page["ids"]:
+            return stored, chunking
+        for chunk_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+            suffix = chunk_id[len(id_prefix) + 1:]
+            if chunk_id.startswith(f"{id_prefix}_") and suffix.isdigit():
+                metadata = metadata or {}
+                stored[int(suffix)] = (chunk_id, metadata.get("chunk_hash") or text_hash(document))
+                chunking = chunking or metadata.get("chunking")
+        offset += len(page["ids"])
+
+def upsert_document(document_content: Union[bytes, str], doc_id: str, db_directory: str = DEFAULT_DB_DIRECTORY,
+                    metadata: Optional[dict] = None) -> dict:
+    """
+    Re-indexes an updated document in place, embedding only chunks whose text is new.
+
+    Each chunk is hashed and compared with the chunk hashes stored in the collection:
+    chunks whose text is unchanged at the same position are left alone, chunks whose
+    text already exists elsewhere in the document reuse the stored embedding, and only
+    genuinely new text is embedded. Chunks past the end of the new version are deleted.
+
+    A document already in the collection is chunked with the strategy stored with its
+    chunks (or add_document_to_db's strategy for chunks that record none), so unchanged
+    text produces the same chunks. New documents are chunked with
+    UPSERT_CHUNKING_STRATEGY, whose content-defined boundaries keep the chunks before
+    and after an edit identical, so a one-line edit costs about one chunk's embedding.
+
+    Args:
+        document_content: The new document content (either as text string or bytes)
+        doc_id: The document's ID, as passed to add_document_to_db
+        db_directory: The directory path for the persistent ChromaDB, or a
+            shared-collection name (see document_index_name).
+        metadata: Optional extra metadata (e.g. bucket, tenant) stored with every chunk.
+
+    Returns:
+        Counts of chunks that were unchanged, reused, embedded and deleted.
+    """
+    target_directory, doc_key = _resolve_db(db_directory)
+    id_prefix = doc_key or doc_id
+    base_metadata = {key: value for key, value in (metadata or {}).items() if value is not None}
+    if doc_key:
+        base_metadata["doc_key"] = doc_key
+    _, file_extension = os.path.splitext(doc_id)
+
+    with vector_db_registry.collection(target_directory) as collection:
+        stored, chunking = _stored_document_chunks(collection, id_prefix, doc_key)
+    stored_ids = {chunk_id for chunk_id, _ in stored.values()}
+    ids_by_hash = {}
+    for chunk_id, chunk_hash in stored.values():
+        ids_by_hash.setdefault(chunk_hash, chunk_id)
+    saved_embeddings = {}
+
+    counts = {"unchanged": 0, "reused": 0, "embedded": 0, "deleted": 0}
+    chunk_count = 0
+    if not stored:
+        chunking = UPSERT_CHUNKING_STRATEGY
+    chunking = chunking or _chunking_strategy(file_extension)
+    chunker = get_document_chunker(file_extension, chunking)
+    for chunks in _batched(chunker.chunk(_document_segments(document_content, file_extension)), _ingest_batch_size()):
+        indexes = range(chunk_count, chunk_count + len(chunks))
+        chunk_count += len(chunks)
+        hashes = [text_hash(chunk) for chunk in chunks]
+        changed = [(i, chunk, chunk_hash) for i, chunk, chunk_hash in zip(indexes, chunks, hashes)
+                   if stored.get(i, (None, None))[1] != chunk_hash]
+        counts["unchanged"] += len(chunks) - len(changed)
+        if not changed:
+            continue
+
+        ids = [f"{id_prefix}_{i}" for i, _, _ in changed]
+        with vector_db_registry.handles(target_directory) as (collection, keyword_index):
+            # Text that moved within the document keeps its stored embedding. Embeddings of
+            # chunks about to be overwritten are saved first, as later batches may reuse them.
+            wanted = {ids_by_hash[chunk_hash] for _, _, chunk_hash in changed if chunk_hash in ids_by_hash}
+            wanted.update(chunk_id for chunk_id in ids if chunk_id in stored_ids)
+            to_fetch = [chunk_id for chunk_id in wanted if chunk_id not in saved_embeddings]
+            if to_fetch:
+                page = collection.get(ids=to_fetch, include=["embeddings"])
+                for chunk_id, embedding in zip(page["ids"], page["embeddings"]):
+                    saved_embeddings[chunk_id] = [float(value) for value in embedding]
+
+            embeddings = {chunk_hash: saved_embeddings[ids_by_hash[chunk_hash]] for _, _, chunk_hash in changed
+                          if ids_by_hash.get(chunk_hash) in saved_embeddings}
+            new_chunks = list(dict.fromkeys(chunk for _, chunk, chunk_hash in changed if chunk_hash not in embeddings))
+            embeddings.update(zip((text_hash(chunk) for chunk in new_chunks), get_embeddings(new_chunks)))
+            counts["embedded"] += len(new_chunks)
+            counts["reused"] += len(changed) - len(new_chunks)
+
+            documents = [chunk for _, chunk, _ in changed]
+            collection.upsert(
+                ids=ids,
+                embeddings=[embeddings[chunk_hash] for _, _, chunk_hash in changed],
+                documents=documents,
+                metadatas=[_chunk_metadata(file_extension, i, chunk, base_metadata, chunking)
+                           for i, chunk, _ in changed]
+            )
+            keyword_index.add(ids, documents, doc_key=doc_key)
+        _bump_collection_version(target_directory)
+
+    removed = [chunk_id for i, (chunk_id, _) in stored.items() if i >= chunk_count]
+    if removed:
+        with vector_db_registry.handles(target_directory) as (collection, keyword_index):
+            collection.delete(ids=removed)
+            keyword_index.delete(chunk_ids=removed)
+        _bump_collection_version(target_directory)
+    counts["deleted"] = len(removed)
+
+    print(f"Upserted document {doc_id} at {db_directory}: {chunk_count} chunks, "
+          f"{counts['embedded']} embedded, {counts['reused']} reused, {counts['deleted']} deleted.")
+    return {"chunks": chunk_count, **counts}
+
+def search_db(query: str, n_results: int = 5, db_directory: str = DEFAULT_DB_DIRECTORY, where: Optional[dict] = None,
+              mode: Optional[str] = None):
     """
     Searches the specified ChromaDB collection for relevant document chunks.
 
     Args:
         query: The search query.
         n_results: The number of results to return.
-        db_directory: The directory path for the persistent ChromaDB.
+        db_directory: The directory path for the persistent ChromaDB, or a
+            shared-collection name (see document_index_name).
+        where: Optional ChromaDB metadata filter.
+        mode: "vector", "keyword" (BM25) or "hybrid" (reciprocal rank fusion of
+            both). Defaults to SEARCH_MODE.
 
     Returns:
         A list of relevant document chunks.
     """
+    return search_db_many([query], n_results=n_results, db_directory=db_directory, where=where, mode=mode)[0]
+
+def search_db_many(queries: List[str], n_results: int = 5, db_directory: str = DEFAULT_DB_DIRECTORY,
+                   where: Optional[dict] = None, mode: Optional[str] = None) -> List[List[str]]:
+    """
+    Searches one collection for several queries at once.
+
+    Returns:
+        A list of relevant document chunks for each query, in query order.
+        See search_db_hits_many for the arguments.
+    """
+    hits = search_db_hits_many(queries, n_results=n_results, db_directory=db_directory, where=where, mode=mode)
+    return [[hit["document"] for hit in query_hits] for query_hits in hits]
+
+def search_db_hits_many(queries: List[str], n_results: int = 5, db_directory: str = DEFAULT_DB_DIRECTORY,
+                        where: Optional[dict] = None, mode: Optional[str] = None,
+                        include_embeddings: bool = False) -> List[List[dict]]:
+    """
+    Searches one collection for several queries at once, returning each hit's
+    chunk id, text and metadata.
+
+    All queries are embedded in one batch and sent to ChromaDB in a single
+    multi-query call, so per-question overhead is paid once per question set.
+    Results are cached per collection version; only uncached queries are searched.
+
+    Args:
+        queries: The search queries.
+        n_results: The number of results to return per query.
+        db_directory: The directory path for the persistent ChromaDB, or a
+            shared-collection name (see document_index_name).
+        where: Optional ChromaDB metadata filter.
+        mode: "vector", "keyword" (BM25) or "hybrid". Defaults to SEARCH_MODE.
+        include_embeddings: Also return each hit's stored "embedding", so callers
+            such as context assembly need not embed the chunk text again.
+
+    Returns:
+        For each query, in query order, a list of hits best first: dictionaries
+        with the chunk "id", its "document" text, its "metadata" and, in vector
+        mode, its "distance" to the query (None in keyword and hybrid mode).
+    """
+    mode = (mode or SEARCH_MODE).lower()
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode '{mode}', expected one of {SEARCH_MODES}")
+    if not queries:
+        return []
     try:
+        target_directory, doc_key = _resolve_db(db_directory)
         # Check if the directory exists before trying to connect
-        if not os.path.exists(db_directory):
-            print(f"Vector database directory not found: {db_directory}")
-            return []
-
-        collection, current_db_directory = get_or_create_vector_db_collection(db_directory)
-        query_embedding = get_embedding(query)
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=n_results
-        )
-        # Extract the document content from the results
-        if results and 'documents' in results and results['documents']:
-            return results['documents'][0]
-        return []
+        if not os.path.exists(target_directory):
+            print(f"Vector database directory not found: {target_directory}")
+            return [[] for _ in queries]
+        _touch_db(target_directory)
+
+        # Read the version before searching, so results racing a write are cached under the old version
+        version = collection_version(target_directory)
+        where_key = json.dumps(where, sort_keys=True, default=str) if where else None
+        keys = [(db_directory, version, query, n_results, mode, where_key, include_embeddings) for query in queries]
+        results = [search_result_cache.get(key) for key in keys]
+        missing = list(dict.fromkeys(query for query, result in zip(queries, results) if result is None))
+        if missing:
+            by_query = dict(zip(missing, _search_collection(missing, n_results, target_directory, doc_key, where, mode,
+                                                            include_embeddings)))
+            for i, (key, query) in enumerate(zip(keys, queries)):
+                if results[i] is None:
+                    results[i] = tuple(by_query[query])
+                    search_result_cache.put(key, results[i])
+        return [[dict(hit) for hit in result] for result in results]
     except Exception as e:
         print(f"Error searching ChromaDB at {db_directory}: {e}")
-        return []
+        return [[] for _ in queries]
+
+def _search_collection(queries: List[str], n_results: int, target_directory: str, doc_key: Optional[str],
+                       where: Optional[dict], mode: str, include_embeddings: bool = False) -> List[List[dict]]:
+    """Runs the vector and/or keyword retrieval for search_db_hits_many, without caching."""
+    where = _combine_where({"doc_key": doc_key} if doc_key else None, where)
+    candidates = n_results if mode == "vector" else n_results * HYBRID_CANDIDATE_MULTIPLIER
+    rankings = [[] for _ in queries]
+    documents = {}
+    distances = [{} for _ in queries]
+    embeddings = {}
+    if mode == "vector" and doc_key is None:
+        flat_index = _get_flat_index(target_directory)
+        if flat_index is not None:
+            try:
+                rescore = lambda ids: _stored_embeddings(target_directory, ids)
+                results = [[{"id": chunk_id, "document": text, "metadata": metadata, "distance": distance}
+                            for chunk_id, text, metadata, distance in hits]
+                           for hits in flat_index.search_many(get_query_embeddings(queries), n_results, where,
+                                                              rescore=rescore)]
+                if include_embeddings:
+                    for hits in results:
+                        for hit, vector in zip(hits, flat_index.vectors([hit["id"] for hit in hits])):
+                            hit["embedding"] = vector
+                return results
+            except UnsupportedFilter as e:
+                print(f"Searching {target_directory} through ChromaDB: {e}")
+
+    extra = ["embeddings"] if include_embeddings else []
+    with vector_db_registry.handles(target_directory) as (collection, keyword_index):
+        if mode in ("vector", "hybrid"):
+            results = collection.query(
+                query_embeddings=get_query_embeddings(queries),
+                n_results=candidates,
+                where=where,
+                include=["documents", "metadatas", "distances"] + extra
+            )
+            # Extract the document content from the results
+            if results and results.get('ids'):
+                vectors_per_query = results['embeddings'] if include_embeddings else [()] * len(results['ids'])
+                for query_rankings, query_distances, ids, texts, metadatas, scores, vectors in zip(
+                        rankings, distances, results['ids'], results['documents'], results['metadatas'],
+                        results['distances'], vectors_per_query):
+                    query_rankings.append(ids)
+                    documents.update(zip(ids, zip(texts, metadatas)))
+                    embeddings.update(zip(ids, vectors))
+                    if mode == "vector":
+                        query_distances.update(zip(ids, scores))
+        if mode in ("keyword", "hybrid"):
+            _backfill_keyword_index(collection, keyword_index)
+            keyword_ids = [[chunk_id for chunk_id, _ in keyword_index.search(query, candidates, doc_key=doc_key)]
+                           for query in queries]
+            missing = list(dict.fromkeys(chunk_id for ids in keyword_ids for chunk_id in ids
+                                         if chunk_id not in documents))
+            if missing:
+                # Fetching through the collection also applies the metadata filter
+                page = collection.get(ids=missing, where=where, include=["documents", "metadatas"] + extra)
+                documents.update(zip(page["ids"], zip(page["documents"], page["metadatas"])))
+                if include_embeddings:
+                    embeddings.update(zip(page["ids"], page["embeddings"]))
+            for query_rankings, ids in zip(rankings, keyword_ids):
+                query_rankings.append([chunk_id for chunk_id in ids if chunk_id in documents])
+
+    hits = [[{"id": chunk_id, "document": documents[chunk_id][0], "metadata": documents[chunk_id][1] or {},
+              "distance": query_distances.get(chunk_id)}
+             for chunk_id in _fuse(query_rankings)[:n_results]]
+            for query_rankings, query_distances in zip(rankings, distances)]
+    if include_embeddings:
+        for hit in (hit for query_hits in hits for hit in query_hits):
+            hit["embedding"] = np.asarray(embeddings[hit["id"]], dtype=np.float32)
+    return hits
+
+def _get_fanout_executor() -> ThreadPoolExecutor:
+    """Returns the thread pool fan-out searches run on, starting it on first use."""
+    global _fanout_executor
+    with _fanout_executor_lock:
+        if _fanout_executor is None:
+            _fanout_executor = ThreadPoolExecutor(max_workers=max(1, SEARCH_FANOUT_WORKERS),
+                                                  thread_name_prefix="search-fanout")
+        return _fanout_executor
+
+def search_dbs(query: str, db_names: List[str], n_results: int = 5, where: Optional[dict] = None,
+               mode: Optional[str] = None) -> List[dict]:
+    """
+    Searches several vector DBs for one query and returns the global top hits.
+    See search_dbs_hits_many.
+    """
+    return search_dbs_hits_many([query], db_names, n_results=n_results, where=where, mode=mode)[0]
+
+def search_dbs_hits_many(queries: List[str], db_names: List[str], n_results: int = 5, where: Optional[dict] = None,
+                         mode: Optional[str] = None, include_embeddings: bool = False) -> List[List[dict]]:
+    """
+    Fans several queries out over several vector DBs and merges the results.
+
+    The DBs are searched concurrently (SEARCH_FANOUT_WORKERS threads), each with
+    search_db_hits_many, so per-DB results are cached as usual. The queries are
+    embedded once, before the fan-out. In vector mode the global top n_results
+    are the hits with the smallest distance across all DBs; in keyword and
+    hybrid mode, whose scores are not comparable between DBs, the per-DB
+    rankings are fused with reciprocal rank fusion.
+
+    Args:
+        queries: The search queries.
+        db_names: DB directories or shared-collection names to search; DBs that
+            do not exist contribute no hits.
+        n_results: The number of results to return per query.
+        where: Optional ChromaDB metadata filter, applied in every DB.
+        mode: "vector", "keyword" (BM25) or "hybrid". Defaults to SEARCH_MODE.
+        include_embeddings: Also return each hit's stored "embedding".
+
+    Returns:
+        For each query, in query order, a list of hits best first, as returned by
+        search_db_hits_many with the DB each hit came from under "vector_db_name".
+    """
+    mode = (mode or SEARCH_MODE).lower()
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode '{mode}', expected one of {SEARCH_MODES}")
+    db_names = list(dict.fromkeys(db_names))
+    if not queries or not db_names:
+        return [[] for _ in queries]
+    if mode != "keyword":
+        get_query_embeddings(queries)
+
+    executor = _get_fanout_executor()
+    futures = [executor.submit(search_db_hits_many, queries, n_results=n_results, db_directory=db_name,
+                               where=where, mode=mode, include_embeddings=include_embeddings)
+               for db_name in db_names]
+    per_db = [future.result() for future in futures]
+
+    merged = []
+    for i in range(len(queries)):
+        hits = {(db_name, hit["id"]): {**hit, "vector_db_name": db_name}
+                for db_name, db_hits in zip(db_names, per_db) for hit in db_hits[i]}
+        if mode == "vector":
+            # Stable sort: ties keep DB order, then rank within the DB
+            ranked = sorted(hits, key=lambda key: (hits[key]["distance"] is None, hits[key]["distance"] or 0.0))
+        else:
+            ranked = _fuse([[(db_name, hit["id"]) for hit in db_hits[i]] for db_name, db_hits in zip(db_names, per_db)])
+        merged.append([hits[key] for key in ranked[:n_results]])
+    return merged
+
+def _fuse(rankings: List[List[str]]) -> List[str]:
+    """Fuses several rankings of chunk ids with RRF; a single ranking is returned as is."""
+    if len(rankings) > 1:
+        return [chunk_id for chunk_id, _ in reciprocal_rank_fusion(rankings)]
+    return rankings[0] if rankings else []
+
+def _backfill_keyword_index(collection, keyword_index: BM25Index):
+    """
+    Builds the keyword index of a collection indexed before keyword search existed.
+    """
+    total = collection.count()
+    if len(keyword_index) >= total:
+        return
+    offset = 0
+    while offset < total:
+        page = collection.get(include=["documents", "metadatas"], limit=EMBEDDING_BATCH_SIZE, offset=offset)
+        if not page["ids"]:
+            break
+        # Group by document so shared-collection chunks keep their doc_key
+        by_doc_key = {}
+        for chunk_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+            ids, documents = by_doc_key.setdefault((metadata or {}).get("doc_key"), ([], []))
+            ids.append(chunk_id)
+            documents.append(document)
+        for doc_key, (ids, documents) in by_doc_key.items():
+            keyword_index.add(ids, documents, doc_key=doc_key)
+        offset += len(page["ids"])
+    if offset:
+        print(f"Built keyword index for {offset} existing chunks at {keyword_index.path}.")
+
+def document_db_directory(doc_id: str, document_content: bytes, root: str = ".") -> str:
+    """
+    Returns the DB directory for a document, keyed by a hash of its content so
+    the same bytes always map to the same index.
+    """
+    sanitized_doc_id = re.sub(r'[^a-zA-Z0-9_.-]', '_', doc_id)
+    content_hash = hashlib.sha256(document_content).hexdigest()[:32]
+    return os.path.join(root, f"chroma_db_{sanitized_doc_id}_{content_hash}")
+
+def document_index_name(doc_id: str, document_content: bytes, bucket: str = None, tenant: str = None) -> str:
+    """
+    Returns the DB name for a document under the configured storage mode.
+
+    In "shared" mode this is a shared-collection name of the form
+    "shared:<tenant>/<bucket>/<doc_id>@<content hash>"; otherwise it is the
+    document's own DB directory.
+    """
+    if VECTOR_DB_STORAGE_MODE == "shared":
+        content_hash = hashlib.sha256(document_content).hexdigest()[:32]
+        return f"{SHARED_DB_PREFIX}{tenant or 'default'}/{bucket or 'default'}/{doc_id}@{content_hash}"
+    return document_db_directory(doc_id, document_content)
+
+def _ready_marker_path(db_name: str) -> str:
+    target_directory, doc_key = _resolve_db(db_name)
+    if doc_key is None:
+        return os.path.join(target_directory, INDEX_COMPLETE_MARKER)
+    return os.path.join(target_directory, ".ready", hashlib.sha256(doc_key.encode('utf-8')).hexdigest())
+
+def _mark_document_db_ready(db_name: str):
+    marker_path = _ready_marker_path(db_name)
+    os.makedirs(os.path.dirname(marker_path), exist_ok=True)
+    with open(marker_path, "w") as marker:
+        marker.write(str(time.time()))
+
+def is_document_db_ready(db_directory: str) -> bool:
+    """
+    Returns True if the directory (or shared-collection name) holds a completely built document index.
+    """
+    return os.path.exists(_ready_marker_path(db_directory))
+
+def _document_db_exists(db_name: str) -> bool:
+    return is_shared_db_name(db_name) or os.path.exists(db_name)
+
+def _build_key(db_name: str) -> str:
+    return db_name if is_shared_db_name(db_name) else os.path.abspath(db_name)
+
+def _record_build_progress(db_directory: str, chunks_added: int):
+    key = _build_key(db_directory)
+    with _document_build_locks_lock:
+        if key in _document_build_progress:
+            _document_build_progress[key] += chunks_added
+
+def document_build_status(db_directory: str) -> dict:
+    """
+    Reports whether a document DB is complete and, while it is being built,
+    how many chunks have been written so far.
+    """
+    key = _build_key(db_directory)
+    with _document_build_locks_lock:
+        chunks_indexed = _document_build_progress.get(key)
+    return {
+        "ready": is_document_db_ready(db_directory),
+        "building": chunks_indexed is not None,
+        "chunks_indexed": chunks_indexed or 0,
+    }
+
+def ensure_document_db(db_directory: str, build: Callable[[str], bool], wait: bool = True) -> bool:
+    """
+    Builds a document index once. Concurrent callers for the same directory wait
+    for the first build instead of starting their own, and later callers return
+    immediately once the index is complete.
+
+    Args:
+        db_directory: The directory of the document's index.
+        build: Called with db_directory to populate the index; returns True on success.
+        wait: If False and another caller is already building the index, return
+            immediately so the caller can search the partially built index.
+
+    Returns:
+        True if the index is ready (or, with wait=False, being built) and can be searched.
+    """
+    key = _build_key(db_directory)
+    with _document_build_locks_lock:
+        lock = _document_build_locks.setdefault(key, threading.Lock())
+
+    if not lock.acquire(blocking=wait):
+        print(f"Vector database {db_directory} is still being built; searching the partial index.")
+        return True
+    try:
+        if is_document_db_ready(db_directory):
+            print(f"Reusing existing vector database: {db_directory}")
+            if not is_shared_db_name(db_directory):
+                _touch_db(db_directory)
+            return True
+
+        # Discard leftovers of an earlier build that did not finish
+        if _document_db_exists(db_directory):
+            delete_vector_db(db_directory)
+
+        with _document_build_locks_lock:
+            _document_build_progress[key] = 0
+        built = False
+        try:
+            built = build(db_directory)
+        finally:
+            with _document_build_locks_lock:
+                _document_build_progress.pop(key, None)
+            if built:
+                _mark_document_db_ready(db_directory)
+            elif _document_db_exists(db_directory):
+                delete_vector_db(db_directory)
+        return built
+    finally:
+        lock.release()
+
+def reap_document_db(db_directory: str, last_used: Optional[float] = None) -> bool:
+    """
+    Deletes an idle per-document DB directory unless it is being built, or has been
+    used since `last_used` (the last_used_time the caller based its decision on,
+    None if it had never been used). Open client handles are waited for and closed
+    by delete_vector_db.
+
+    Returns:
+        True if the directory was deleted.
+    """
+    key = _build_key(db_directory)
+    with _document_build_locks_lock:
+        lock = _document_build_locks.setdefault(key, threading.Lock())
+    if not lock.acquire(blocking=False):
+        return False
+    try:
+        current = last_used_time(db_directory)
+        if current is not None and (last_used is None or current > last_used):
+            return False
+        deleted = delete_vector_db(db_directory)
+        if deleted:
+            with _collection_versions_lock:
+                _last_used_times.pop(os.path.abspath(db_directory), None)
+        return deleted
+    finally:
+        lock.release()
+
+def _delete_shared_document(db_name: str) -> bool:
+    """
+    Deletes one document's chunks from the shared collection by metadata.
+    """
+    target_directory, doc_key = _resolve_db(db_name)
+    if not os.path.exists(target_directory):
+        print(f"Shared vector database not found, nothing to delete: {target_directory}")
+        return False
+    with vector_db_registry.handles(target_directory) as (collection, keyword_index):
+        collection.delete(where={"doc_key": doc_key})
+        keyword_index.delete(doc_key=doc_key)
+    _bump_collection_version(target_directory)
+    marker_path = _ready_marker_path(db_name)
+    if os.path.exists(marker_path):
+        os.remove(marker_path)
+    print(f"Deleted chunks for '{doc_key}' from shared vector database {target_directory}.")
+    return True
 
 def delete_vector_db(db_directory: str) -> bool:
     """
     Attempts to delete the persistent ChromaDB directory.
-    Note: May fail if files are in use by another process (e.g., the running server).
+    Waits for in-flight searches and ingests on the directory to finish and
+    closes the cached client before any files are removed.
+    For shared-collection names only that document's chunks are deleted.
     """
+    if is_shared_db_name(db_directory):
+        try:
+            return _delete_shared_document(db_directory)
+        except Exception as e:
+            print(f"Error deleting {db_directory} from shared vector database: {e}")
+            return False
+
     print(f"Attempting to delete vector database directory: {db_directory}")
     try:
         if os.path.exists(db_directory):
-            # Attempt to delete the collection from the client first
-            try:
-                # Use a temporary client instance for deletion
-                client = get_or_create_vector_db_client(db_directory)
-                # Check if collection exists before deleting
-                if "document_chunks" in [c.name for c in client.list_collections()]:
-                    client.delete_collection(name="document_chunks")
-                    print(f"Deleted ChromaDB collection 'document_chunks' from client for directory {db_directory}.")
-                else:
-                    print(f"ChromaDB collection 'document_chunks' not found in client for directory {db_directory}, skipping deletion.")
+            with vector_db_registry.exclusive(db_directory):
+                # Attempt to delete the collection from the client first
+                client = None
+                try:
+                    # Use a temporary client instance for deletion
+                    client = get_or_create_vector_db_client(db_directory)
+                    # Check if collection exists before deleting
+                    if COLLECTION_NAME in [c.name for c in client.list_collections()]:
+                        client.delete_collection(name=COLLECTION_NAME)
+                        print(f"Deleted ChromaDB collection '{COLLECTION_NAME}' from client for directory {db_directory}.")
+                    else:
+                        print(f"ChromaDB collection '{COLLECTION_NAME}' not found in client for directory {db_directory}, skipping deletion.")
 
-            except Exception as e:
-                print(f"Error deleting ChromaDB collection from client for {db_directory}: {e}")
-                # Continue trying to remove the directory even if collection deletion from client fails
-                pass
+                except Exception as e:
+                    print(f"Error deleting ChromaDB collection from client for {db_directory}: {e}")
+                    # Continue trying to remove the directory even if collection deletion from client fails
+                    pass
+                finally:
+                    if client is not None and hasattr(client, "close"):
+                        client.close()
 
-            # Now try to remove the directory
-            shutil.rmtree(db_directory)
+                # Now try to remove the directory
+                shutil.rmtree(db_directory)
+            # Outside exclusive(): _get_flat_index takes its locks before the registry entry lock
+            _bump_collection_version(db_directory)
             print(f"Vector database directory deleted: {db_directory}")
             return True
         else:
@@ -208,6 +1444,208 @@ def delete_vector_db(db_directory: str) -> bool:
         print("Note: This error often occurs if the database files are still in use by the running application.")
         return False
 
+def _migrated_doc_key(db_directory: str, doc_id: Optional[str], bucket: Optional[str],
+                      tenant: Optional[str]) -> str:
+    """
+    Returns the shared-collection document key for a per-document DB directory.
+
+    Directories named by document_db_directory ("chroma_db_<doc_id>_<content hash>")
+    map to "<tenant>/<bucket>/<doc_id>@<content hash>", the key document_index_name
+    gives the same document. The doc_id stored with the chunks is preferred, since
+    the directory name only holds its sanitized form; other directories keep
+    their directory name as the document part of the key.
+    """
+    name = os.path.basename(os.path.normpath(db_directory))
+    match = re.fullmatch(r"chroma_db_(.+)_([0-9a-f]{32})", name)
+    if match:
+        name = f"{doc_id or match.group(1)}@{match.group(2)}"
+    return f"{tenant or 'default'}/{bucket or 'default'}/{name}"
+
+def migrate_directory_to_shared(db_directory: str, bucket: str = None, tenant: str = None,
+                                delete_source: bool = False) -> str:
+    """
+    Copies a per-directory DB into the shared collection, reusing its stored
+    embeddings, and returns the shared-collection name to query it by.
+
+    The name is the one document_index_name gives the same document, so /chat
+    reuses the migrated chunks instead of re-indexing the document (see
+    _migrated_doc_key).
+
+    Args:
+        db_directory: The per-document DB directory to migrate.
+        bucket: Bucket to tag the migrated chunks with; defaults to the bucket stored with them.
+        tenant: Tenant to tag the migrated chunks with; defaults to the tenant stored with them.
+        delete_source: Delete the source directory once the copy is complete.
+    """
+    copied = 0
+    with vector_db_registry.collection(db_directory) as source:
+        total = source.count()
+        first = source.get(include=["metadatas"], limit=1)
+        stored = (first["metadatas"][0] or {}) if first["ids"] else {}
+        bucket = bucket or stored.get("bucket")
+        tenant = tenant or stored.get("tenant")
+        doc_key = _migrated_doc_key(db_directory, stored.get("doc_id"), bucket, tenant)
+        shared_name = SHARED_DB_PREFIX + doc_key
+        extra_metadata = {key: value for key, value in (("bucket", bucket), ("tenant", tenant)) if value}
+        while copied < total:
+            page = source.get(include=["embeddings", "documents", "metadatas"],
+                              limit=EMBEDDING_BATCH_SIZE, offset=copied)
+            if not page["ids"]:
+                break
+            ids = [f"{doc_key}_{chunk_id}" for chunk_id in page["ids"]]
+            with vector_db_registry.handles(SHARED_DB_DIRECTORY) as (shared, keyword_index):
+                shared.upsert(
+                    ids=ids,
+                    embeddings=page["embeddings"],
+                    documents=page["documents"],
+                    metadatas=[{**(metadata or {}), **extra_metadata, "doc_key": doc_key}
+                               for metadata in page["metadatas"]]
+                )
+                keyword_index.add(ids, page["documents"], doc_key=doc_key)
+            _bump_collection_version(SHARED_DB_DIRECTORY)
+            copied += len(page["ids"])
+
+    _mark_document_db_ready(shared_name)
+    print(f"Migrated {copied} chunks from {db_directory} to shared vector database as '{shared_name}'.")
+    if delete_source:
+        delete_vector_db(db_directory)
+    return shared_name
+
+def _pack_strings(strings: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Encodes strings as one UTF-8 byte array plus end offsets, without fixed-width padding."""
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = np.cumsum([len(data) for data in encoded], dtype=np.int64)
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+def _unpack_strings(data: np.ndarray, offsets: np.ndarray) -> List[str]:
+    blob = data.tobytes()
+    starts = [0] + offsets[:-1].tolist()
+    return [blob[start:end].decode("utf-8") for start, end in zip(starts, offsets.tolist())]
+
+def export_vector_db(db_name: str, path: str, compress: bool = False) -> dict:
+    """
+    Writes a portable snapshot of a vector DB to one .npz file: chunk ids, texts,
+    metadata and float32 embeddings as columns, plus a manifest naming the
+    embedding model. import_vector_db loads it into another DB or node without
+    re-extracting or re-embedding anything.
+
+    Strings are stored as UTF-8 byte columns with offsets rather than fixed-width
+    arrays. For shared-collection names only that document's chunks are exported,
+    with the document key taken off their ids and metadata.
+
+    Args:
+        db_name: The DB directory or shared-collection name to export.
+        path: The snapshot file to write (replaced atomically).
+        compress: Zip-compress the columns (smaller files, slower export and import).
+
+    Returns:
+        The snapshot manifest.
+    """
+    target_directory, doc_key = _resolve_db(db_name)
+    if not os.path.exists(target_directory):
+        raise FileNotFoundError(f"Vector database not found: {db_name}")
+    where = {"doc_key": doc_key} if doc_key else None
+    prefix = f"{doc_key}_" if doc_key else ""
+
+    ids, documents, metadatas, embeddings = [], [], [], []
+    with vector_db_registry.collection(target_directory) as collection:
+        offset = 0
+        while True:
+            page = collection.get(where=where, include=["embeddings", "documents", "metadatas"],
+                                  limit=SNAPSHOT_BATCH_SIZE, offset=offset)
+            if not page["ids"]:
+                break
+            ids.extend(chunk_id[len(prefix):] if chunk_id.startswith(prefix) else chunk_id for chunk_id in page["ids"])
+            documents.extend(page["documents"])
+            metadatas.extend({key: value for key, value in (metadata or {}).items() if key != "doc_key"}
+                             for metadata in page["metadatas"])
+            embeddings.append(np.asarray(page["embeddings"], dtype=np.float32))
+            offset += len(page["ids"])
+
+    vectors = np.concatenate(embeddings) if embeddings else np.zeros((0, 0), dtype=np.float32)
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "embedding_model": _embedding_cache_key(),
+        "chunks": len(ids),
+        "dimension": int(vectors.shape[1]) if len(ids) else 0,
+        "source": db_name,
+        "exported_at": time.time(),
+    }
+    columns = {"manifest": np.frombuffer(json.dumps(manifest).encode("utf-8"), dtype=np.uint8),
+               "embeddings": vectors}
+    for name, strings in (("ids", ids), ("documents", documents),
+                          ("metadatas", [json.dumps(metadata, separators=(",", ":")) for metadata in metadatas])):
+        columns[f"{name}_data"], columns[f"{name}_offsets"] = _pack_strings(strings)
+
+    staging = path + ".tmp"
+    with open(staging, "wb") as f:
+        (np.savez_compressed if compress else np.savez)(f, **columns)
+    os.replace(staging, path)
+    print(f"Exported {len(ids)} chunks from {db_name} to snapshot {path}.")
+    return manifest
+
+def read_snapshot_manifest(path: str) -> dict:
+    """
+    Returns the manifest of a snapshot file without loading its columns.
+    """
+    with np.load(path, allow_pickle=False) as snapshot:
+        return json.loads(snapshot["manifest"].tobytes().decode("utf-8"))
+
+def import_vector_db(path: str, db_name: str, replace: bool = False) -> int:
+    """
+    Loads a snapshot written by export_vector_db into a vector DB with bulk
+    collection.add calls of SNAPSHOT_BATCH_SIZE chunks, rebuilds its keyword index
+    and marks it ready, so it is searchable (and reused by /chat) immediately. Small
+    per-document DBs also get their flat index written straight from the snapshot.
+
+    Args:
+        path: The snapshot file.
+        db_name: The DB directory or shared-collection name to load it into.
+        replace: Delete whatever the DB already holds first; otherwise a DB that
+            already has chunks is an error.
+
+    Raises:
+        ValueError: If the snapshot was embedded with a different model or backend,
+            has an unknown format, or the target DB is not empty and replace is False.
+
+    Returns:
+        The number of chunks imported.
+    """
+    with np.load(path, allow_pickle=False) as snapshot:
+        manifest = json.loads(snapshot["manifest"].tobytes().decode("utf-8"))
+        if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format version {manifest.get('format_version')} in {path}")
+        if manifest.get("embedding_model") != _embedding_cache_key():
+            raise ValueError(f"Snapshot {path} was embedded with '{manifest.get('embedding_model')}', "
+                             f"but this node uses '{_embedding_cache_key()}'")
+        ids, documents, metadatas = (_unpack_strings(snapshot[f"{name}_data"], snapshot[f"{name}_offsets"])
+                                     for name in ("ids", "documents", "metadatas"))
+        embeddings = snapshot["embeddings"]
+
+    target_directory, doc_key = _resolve_db(db_name)
+    if os.path.exists(target_directory) if doc_key is None else is_document_db_ready(db_name):
+        if not replace:
+            raise ValueError(f"Vector database {db_name} already exists; pass replace=True to overwrite it")
+        delete_vector_db(db_name)
+    if doc_key:
+        ids = [f"{doc_key}_{chunk_id}" for chunk_id in ids]
+    metadatas = [{**json.loads(metadata), **({"doc_key": doc_key} if doc_key else {})} for metadata in metadatas]
+
+    for start in range(0, len(ids), SNAPSHOT_BATCH_SIZE):
+        end = start + SNAPSHOT_BATCH_SIZE
+        with vector_db_registry.handles(target_directory) as (collection, keyword_index):
+            collection.add(ids=ids[start:end], embeddings=embeddings[start:end].tolist(),
+                           documents=documents[start:end], metadatas=metadatas[start:end])
+            keyword_index.add(ids[start:end], documents[start:end], doc_key=doc_key)
+            space = collection_space(collection)
+        _bump_collection_version(target_directory)
+
+    if doc_key is None and 0 < len(ids) <= FLAT_INDEX_MAX_CHUNKS:
+        FlatIndex.build(target_directory, ids, embeddings, documents, metadatas, space=space)
+    _mark_document_db_ready(db_name)
+    print(f"Imported {len(ids)} chunks from snapshot {path} into {db_name}.")
+    return len(ids)
+
 # Example Usage (you can remove or comment this out later)
 # if __name__ == "__main__":
 #     # Example of adding to the default DB
@@ -0,0 +1,151 @@
+import glob
+import os
+import threading
+import time
+from typing import List, Optional
+
+import vector_db
+
+# Directory scanned for per-document DBs (chroma_db_<doc>_<hash>)
+VECTOR_DB_ROOT = os.environ.get("VECTOR_DB_ROOT", ".")
+# Seconds between reaper sweeps (0 disables the background reaper)
+VECTOR_DB_REAPER_INTERVAL = int(os.environ.get("VECTOR_DB_REAPER_INTERVAL", "300"))
+# Total disk budget for per-document DBs in MB (0 = unlimited)
+VECTOR_DB_DISK_BUDGET_MB = int(os.environ.get("VECTOR_DB_DISK_BUDGET_MB", "0"))
+# Seconds a per-document DB may go unsearched before it is deleted (0 = never)
+VECTOR_DB_IDLE_TTL = int(os.environ.get("VECTOR_DB_IDLE_TTL", "0"))
+
+
+def _directory_size(directory: str) -> int:
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class VectorDBReaper:
+    """
+    Deletes per-document vector DBs in the background to keep disk usage bounded.
+
+    Each sweep deletes DBs that have not been searched for `idle_ttl` seconds, then,
+    while the remaining DBs exceed `disk_budget_mb`, deletes the least recently
+    searched ones. DBs that were never searched by this process are aged by their
+    modification time. The default and shared DBs are never touched, and DBs that
+    are being built or are searched during a sweep are skipped.
+    """
+
+    def __init__(self, root: str = VECTOR_DB_ROOT, disk_budget_mb: int = VECTOR_DB_DISK_BUDGET_MB,
+                 idle_ttl: int = VECTOR_DB_IDLE_TTL, interval: int = VECTOR_DB_REAPER_INTERVAL):
+        self.root = root
+        self.disk_budget_mb = disk_budget_mb
+        self.idle_ttl = idle_ttl
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {
+            "sweeps": 0,
+            "evicted_idle": 0,
+            "evicted_budget": 0,
+            "bytes_freed": 0,
+            "skipped_busy": 0,
+            "last_sweep": None,
+            "disk_usage_bytes": None,
+            "databases": None,
+        }
+
+    def _candidates(self) -> List[dict]:
+        """Per-document DB directories with their size and last use, least recently used first."""
+        protected = {os.path.abspath(vector_db.DEFAULT_DB_DIRECTORY), os.path.abspath(vector_db.SHARED_DB_DIRECTORY)}
+        candidates = []
+        for directory in glob.glob(os.path.join(self.root, "chroma_db_*")):
+            if not os.path.isdir(directory) or os.path.abspath(directory) in protected:
+                continue
+            last_used = vector_db.last_used_time(directory)
+            try:
+                age_reference = last_used if last_used is not None else os.path.getmtime(directory)
+            except OSError:
+                continue
+            candidates.append({
+                "directory": directory,
+                "bytes": _directory_size(directory),
+                "last_used": last_used,
+                "age_reference": age_reference,
+            })
+        return sorted(candidates, key=lambda candidate: candidate["age_reference"])
+
+    def _evict(self, candidate: dict, reason: str) -> bool:
+        if vector_db.reap_document_db(candidate["directory"], last_used=candidate["last_used"]):
+            self._stats[f"evicted_{reason}"] += 1
+            self._stats["bytes_freed"] += candidate["bytes"]
+            print(f"Reaper deleted {reason} vector database {candidate['directory']} ({candidate['bytes']} bytes).")
+            return True
+        self._stats["skipped_busy"] += 1
+        return False
+
+    def sweep(self) -> dict:
+        """
+        Runs one eviction pass and returns the updated stats.
+        """
+        now = time.time()
+        remaining = []
+        for candidate in self._candidates():
+            if self.idle_ttl > 0 and now - candidate["age_reference"] > self.idle_ttl and self._evict(candidate, "idle"):
+                continue
+            remaining.append(candidate)
+
+        usage = sum(candidate["bytes"] for candidate in remaining)
+        budget = self.disk_budget_mb * 1024 * 1024
+        if budget > 0:
+            for candidate in list(remaining):
+                if usage <= budget:
+                    break
+                if self._evict(candidate, "budget"):
+                    usage -= candidate["bytes"]
+                    remaining.remove(candidate)
+
+        self._stats["sweeps"] += 1
+        self._stats["last_sweep"] = now
+        self._stats["disk_usage_bytes"] = usage
+        self._stats["databases"] = len(remaining)
+        return self.stats()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Error during vector database reaper sweep: {e}")
+
+    def start(self) -> bool:
+        """
+        Starts the background sweep thread. Returns False if the reaper is disabled.
+        """
+        if self.interval <= 0 or (self.disk_budget_mb <= 0 and self.idle_ttl <= 0):
+            return False
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="vector-db-reaper", daemon=True)
+            self._thread.start()
+            print(f"Started vector database reaper (budget {self.disk_budget_mb} MB, idle TTL {self.idle_ttl}s, "
+                  f"every {self.interval}s).")
+        return True
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "disk_budget_mb": self.disk_budget_mb,
+            "idle_ttl": self.idle_ttl,
+        }
+
+
+vector_db_reaper = VectorDBReaper()
@@ -0,0 +1,48 @@
+"""
+Exports vector DBs to portable snapshot files and imports them on another node.
+
+Usage:
+    python vector_db_snapshot.py export ./chroma_db_report.txt_1234 report.npz
+    python vector_db_snapshot.py import report.npz ./chroma_db_report.txt_1234 --replace
+    python vector_db_snapshot.py info report.npz
+"""
+import argparse
+import json
+
+from vector_db import export_vector_db, import_vector_db, read_snapshot_manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and import vector DB snapshots")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="Write a DB to a snapshot file")
+    export_parser.add_argument("db_name", help="DB directory or shared-collection name")
+    export_parser.add_argument("path", help="Snapshot file to write")
+    export_parser.add_argument("--compress", action="store_true", help="Zip-compress the snapshot")
+
+    import_parser = commands.add_parser("import", help="Load a snapshot file into a DB")
+    import_parser.add_argument("path", help="Snapshot file to read")
+    import_parser.add_argument("db_name", help="DB directory or shared-collection name")
+    import_parser.add_argument("--replace", action="store_true", help="Overwrite the DB if it already exists")
+
+    info_parser = commands.add_parser("info", help="Print a snapshot's manifest")
+    info_parser.add_argument("path", help="Snapshot file to read")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "export":
+            manifest = export_vector_db(args.db_name, args.path, compress=args.compress)
+            print(f"{args.db_name} -> {args.path} ({manifest['chunks']} chunks)")
+        elif args.command == "import":
+            chunks = import_vector_db(args.path, args.db_name, replace=args.replace)
+            print(f"{args.path} -> {args.db_name} ({chunks} chunks)")
+        else:
+            print(json.dumps(read_snapshot_manifest(args.path), indent=2))
+    except Exception as e:
+        print(f"Error: {e}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,35 +6,30 @@ import ngrok
 import atexit # Import atexit for cleanup
 import time # Import time for potential delays
 import io # Import io for handling bytes data
-import uuid # Import uuid for generating unique IDs
-import re # Import re for sanitizing directory names
 import asyncio
 from uuid import UUID
 from typing import Dict, Any
 from flask.views import View
 from flask.typing import ResponseReturnValue
-from asgiref.wsgi import WsgiToAsgi
 from hypercorn.asyncio import serve as hypercorn_serve
 from hypercorn.config import Config
 import signal
 import sys
+import threading
 import plotly.express as px
 import plotly.graph_objects as go
 
 # import necessary modules
 from api_client import fetch_document_from_api, delete_vector_db_document_via_api # Import from our new API client
-from vector_db import add_document_to_db, search_db, delete_vector_db, DEFAULT_DB_DIRECTORY # Import delete_vector_db and DEFAULT_DB_DIRECTORY
+from vector_db import add_document_to_db, search_db_hits_many, search_dbs_hits_many, delete_vector_db, DEFAULT_DB_DIRECTORY, document_index_name, ensure_document_db, document_build_status, warm_up_embedding_model, embedding_model_status, stop_embedding_batcher, cache_stats, SEARCH_MODES # Import delete_vector_db and DEFAULT_DB_DIRECTORY
+from vector_db_reaper import vector_db_reaper
+from document_extraction import extract_document_segments, extract_document_text, stop_extraction_pool
+from context_assembly import assemble_context, CONTEXT_CANDIDATES
 from llm_interaction import get_chatbot_response
 from ocr_expense_parser import parse_expense_text
 from receipt_fraud_detector import ReceiptFraudDetector, check_receipt_fraud
 from trip_analytics import TripAnalytics
 
-# For document processing (placeholders - install necessary libraries)
-# from PyPDF2 import PdfReader
-# import pandas as pd
-# from PIL import Image
-# import pytesseract # For OCR
-
 # Load environment variables
 load_dotenv()
 
@@ -42,8 +37,6 @@ load_dotenv()
 app = Flask(__name__)
 app.config['PROPAGATE_EXCEPTIONS'] = True
 
-# Configure async support
-asgi_app = WsgiToAsgi(app)
 
 # List to hold vector database directories to be deleted on exit
 dbs_to_delete_on_exit = []
@@ -51,61 +44,38 @@ dbs_to_delete_on_exit = []
 # Global variables
 ngrok_tunnel = None
 
+# Embedding model warm-up on startup: "background" (serve immediately, /ready reports 503
+# until warm), "blocking" (warm up before binding the port) or "off" (load on first use)
+EMBEDDING_WARMUP = os.environ.get("EMBEDDING_WARMUP", "background").lower()
+
 # --- Document Processing and Indexing ----
 #
-# This is a simplified approach. In a real application, you would want a
-# more robust way to handle different document types (PDFs, images, excels)
-# and manage the vector database (e.g., check if a document has already
-# been indexed, handle updates, use a persistent ChromaDB).
-#
-# You will need libraries like:
-# - PyPDF2 or pdfminer.six for PDFs
-# - Pillow for images (you might need OCR)
-# - pandas for Excel files
-#
-# And logic to extract text content from these file types.
+# Text extraction lives in document_extraction: one registry of streaming
+# extractors (PDF pages, spreadsheet/CSV rows, DOCX paragraphs, JSON, text,
+# and OCR for images and scanned PDF pages) chosen by sniffing the content's
+# magic bytes, run in a bounded process pool, with extracted text cached by
+# content hash.
 
 def extract_text_from_document(document_content: bytes, file_extension: str) -> str:
     """
-    Extracts text content from document bytes based on file extension.
-    Implement logic for different file types here.
+    Extracts text content from document bytes; the format is detected from the
+    content, falling back to the file extension. Parsing runs in the document
+    extraction process pool, bounded by EXTRACTION_TIMEOUT and
+    EXTRACTION_MEMORY_LIMIT_MB; returns "" on failure.
     """
-    text_content = ""
     try:
-        if file_extension == '.txt':
-            text_content = document_content.decode('utf-8')
-        elif file_extension == '.pdf':
-            # Example using PyPDF2 (install with: pip install pypdf2)
-            # reader = PdfReader(io.BytesIO(document_content))
-            # text_content = "".join([page.extract_text() for page in reader.pages if page.extract_text()])
-            print("PDF processing not implemented. Install PyPDF2 and uncomment code.")
-            pass # Placeholder for PDF processing
-        elif file_extension in ['.xls', '.xlsx']:
-             # Example using pandas (install with: pip install pandas openpyxl)
-             # df = pd.read_excel(io.BytesIO(document_content))
-             # text_content = df.to_string()
-             print("Excel processing not implemented. Install pandas/openpyxl and uncomment code.")
-             pass # Placeholder for Excel processing
-        elif file_extension in ['.jpg', '.jpeg', '.png', '.gif']:
-             # Example using Pillow and pytesseract (install with: pip install Pillow pytesseract)
-             # Image processing usually requires OCR
-             # img = Image.open(io.BytesIO(document_content))
-             # text_content = pytesseract.image_to_string(img)
-             print("Image processing not implemented (requires OCR). Install Pillow/pytesseract and uncomment code.")
-             pass # Placeholder for Image processing
-        else:
-            print(f"Unsupported file extension: {file_extension}")
-
+        return extract_document_text(document_content, file_extension)
     except Exception as e:
         print(f"Error extracting text from document: {e}")
-        text_content = ""
+        return ""
 
-    return text_content
-
-def process_document_content(document_content: bytes, doc_id: str, db_directory: str) -> bool:
+def process_document_content(document_content: bytes, doc_id: str, db_directory: str, metadata: dict = None) -> bool:
     """
     Processes raw document content (bytes), extracts text, and adds to the specified vector DB.
     Determines file type and extracts text before adding to the specified DB.
+    The text is extracted in the extraction pool as segments (pages, paragraphs or
+    row blocks) that are chunked without being joined into one string.
+    Optional metadata (e.g. bucket, tenant) is stored with every chunk.
     """
     if document_content is None:
         print("No document content to process.")
@@ -115,15 +85,19 @@ def process_document_content(document_content: bytes, doc_id: str, db_directory:
     _, file_extension = os.path.splitext(doc_id)
     file_extension = file_extension.lower()
 
-    text_content = extract_text_from_document(document_content, file_extension)
+    try:
+        segments = extract_document_segments(document_content, file_extension)
+    except Exception as e:
+        print(f"Error extracting text from document: {e}")
+        segments = []
 
-    if not text_content:
+    if not any(segments):
         print(f"Could not extract text from document {doc_id}. Text extraction failed or document is empty.")
         return False
 
     try:
         # Pass the db_directory to add_document_to_db
-        add_document_to_db(text_content, doc_id, db_directory=db_directory)
+        add_document_to_db(segments, doc_id, db_directory=db_directory, metadata=metadata)
         return True
     except Exception as e:
         print(f"Error processing document {doc_id} for DB {db_directory}: {e}")
@@ -131,85 +105,221 @@ def process_document_content(document_content: bytes, doc_id: str, db_directory:
 
 # --- API Endpoints ---
 
-@app.route('/chat', methods=['POST'])
-def chat():
-    """
-    Handles incoming chat requests.
-    Expects JSON with either:
-    1. 'vector_db_name' and 'question' (Queries an existing DB)
-    2. 'document_id', 'bucket_name', and 'question' (Fetches, processes into a NEW DB, and queries)
+async def resolve_chat_db(data: dict, question_summary: str):
     """
-    data = request.get_json()
+    Resolves the vector DB a chat request should search, fetching and indexing the
+    document first when the request names a document instead of a DB.
 
+    Returns:
+        (db_name, error) where error is a (response, status) tuple if the DB could not be resolved.
+        db_name is a list of DB names when the request fans out over 'vector_db_names'.
+    """
+    vector_db_names = data.get('vector_db_names')
     vector_db_name = data.get('vector_db_name')
     document_id = data.get('document_id')
     bucket_name = data.get('bucket_name')
-    question = data.get('question')
-
-    if not question:
-        return jsonify({"error": "'question' is required."}), 400
+    allow_partial_index = bool(data.get('allow_partial_index', False))
+    tenant_id = data.get('tenant_id')
 
-    relevant_chunks = []
-    current_db_directory_used = None # To track which DB was used/created
+    if vector_db_names is not None:
+        # Case 0: a list of DBs is provided, search them all and merge the results
+        if (not isinstance(vector_db_names, list) or not vector_db_names
+                or not all(isinstance(name, str) and name for name in vector_db_names)):
+            return None, (jsonify({"error": "'vector_db_names' must be a non-empty list of strings."}), 400)
+        print(f"Received request for {len(vector_db_names)} DBs {vector_db_names} with {question_summary}")
+        return vector_db_names, None
 
     if vector_db_name:
-        print(f"Received request for existing DB '{vector_db_name}' with question: '{question}'")
         # Case 1: vector_db_name is provided, search this DB
-        relevant_chunks = search_db(question, n_results=5, db_directory=vector_db_name)
-        current_db_directory_used = vector_db_name
-
-    elif document_id and bucket_name:
-        print(f"Received request for new document '{document_id}' in bucket '{bucket_name}' with question: '{question}'")
-        # Case 2: document_id and bucket_name are provided, fetch, process into a NEW DB, and search
-
-        # Generate a unique directory name for this document's vector DB
-        # Sanitize doc_id to be filesystem-safe and append a unique ID
-        sanitized_doc_id = re.sub(r'[^a-zA-Z0-9_.-]', '_', document_id)
-        new_db_directory = f"./chroma_db_{sanitized_doc_id}_{uuid.uuid4().hex}"
-        current_db_directory_used = new_db_directory
+        print(f"Received request for existing DB '{vector_db_name}' with {question_summary}")
+        return vector_db_name, None
 
-        print(f"Processing document into new vector database: {new_db_directory}")
+    if document_id and bucket_name:
+        print(f"Received request for document '{document_id}' in bucket '{bucket_name}' with {question_summary}")
+        # Case 2: document_id and bucket_name are provided, fetch and search the document's DB
 
         # 1. Fetch document from API
-        document_content = fetch_document_from_api(bucket_name, document_id)
+        document_content = await fetch_document_from_api(bucket_name, document_id)
         if document_content is None:
-            return jsonify({"error": f"Could not fetch document '{document_id}' from API bucket '{bucket_name}'."}), 500
+            return None, (jsonify({"error": f"Could not fetch document '{document_id}' from API bucket '{bucket_name}'."}), 500)
+
+        # 2. Reuse the DB for this exact content, or build it once (concurrent requests share the build,
+        #    so only the building request parses the document, in the extraction pool, off the event loop)
+        document_db = document_index_name(document_id, document_content, bucket=bucket_name, tenant=tenant_id)
+        chunk_metadata = {"doc_id": document_id, "bucket": bucket_name, "tenant": tenant_id}
+        ready = await asyncio.to_thread(
+            ensure_document_db,
+            document_db,
+            lambda db_directory: process_document_content(document_content, document_id, db_directory=db_directory,
+                                                          metadata=chunk_metadata),
+            wait=not allow_partial_index
+        )
+        if not ready:
+            return None, (jsonify({"error": f"Could not process document '{document_id}'. Text extraction failed or document is empty."}), 500)
+        return document_db, None
+
+    # Neither case is met
+    return None, (jsonify({"error": "Invalid request body. Provide either 'vector_db_name' or both 'document_id' and 'bucket_name'."}), 400)
+
+def _chat_response_metadata(data: dict, db_name: str) -> dict:
+    """Reports the DB used (and its build status) for requests that name a document."""
+    if data.get('document_id') and data.get('bucket_name') and db_name:
+        return {"vector_db_name_used": db_name, "index_status": document_build_status(db_name)}
+    return {}
+
+def _no_context_message(db_name) -> str:
+    if isinstance(db_name, list):
+        db_name = "', '".join(db_name)
+    return f"Could not find relevant information in the specified document or database ('{db_name}') to answer your question."
+
+def _search_chat_hits(questions: list, db_name, where: dict, search_mode: str) -> list:
+    """Retrieves context candidates per question from one DB, or from several DBs merged by distance."""
+    if isinstance(db_name, list):
+        return search_dbs_hits_many(questions, db_name, n_results=CONTEXT_CANDIDATES, where=where, mode=search_mode,
+                                    include_embeddings=True)
+    return search_db_hits_many(questions, n_results=CONTEXT_CANDIDATES, db_directory=db_name, where=where,
+                               mode=search_mode, include_embeddings=True)
+
+def _answer_question(question: str, hits: list, db_name) -> str:
+    """Assembles the context for one question and asks the LLM; blocking, so views run it in a thread."""
+    context = assemble_context(question, hits, max_chunks=5)
+    if not context:
+        print(f"No relevant context found for question '{question}' in DB {db_name}.")
+        return _no_context_message(db_name)
+    return get_chatbot_response(question, context)
 
-        # 2. Process document and add to the NEW vector DB
-        processed = process_document_content(document_content, document_id, db_directory=new_db_directory)
-        if not processed:
-             # If processing fails, the new directory might still exist but be incomplete or empty.
-             # We should probably mark it for deletion or handle cleanup.
-             # For now, we'll just return an error.
-             # Optionally add new_db_directory to dbs_to_delete_on_exit here if processing fails.
-             return jsonify({"error": f"Could not process document '{document_id}'. Text extraction failed or document is empty."}), 500
+def _hit_sources(hits: list) -> list:
+    """Provenance of fan-out search hits: the DB, chunk and distance of each."""
+    return [{"vector_db_name": hit["vector_db_name"], "id": hit["id"], "distance": hit["distance"],
+             "metadata": hit["metadata"]} for hit in hits]
 
-        # 3. Search the NEW vector DB for relevant context
-        relevant_chunks = search_db(question, n_results=5, db_directory=new_db_directory)
+@app.route('/chat', methods=['POST'])
+async def chat():
+    """
+    Handles incoming chat requests.
+    Expects JSON with either:
+    1. 'vector_db_name' and 'question' (Queries an existing DB)
+    2. 'document_id', 'bucket_name', and 'question' (Fetches the document and queries its DB,
+       building the DB only if this exact content has not been indexed before)
+    Optional 'allow_partial_index': if true and the document's DB is still being built by
+    another request, answer from the chunks indexed so far instead of waiting.
+    Optional 'tenant_id': tags the document's chunks when VECTOR_DB_STORAGE_MODE is "shared".
+    Optional 'search_mode': "vector", "keyword" or "hybrid" (defaults to SEARCH_MODE).
+    Optional 'where': a ChromaDB metadata filter on the chunks searched (e.g. {"file_type": "pdf"}).
+    Instead of 'vector_db_name', 'vector_db_names' searches several DBs concurrently and
+    answers from the global top chunks; 'sources' then reports where each candidate came from.
+    """
+    data = request.get_json()
 
-    else:
-        # Neither case is met
-        return jsonify({"error": "Invalid request body. Provide either 'vector_db_name' or both 'document_id' and 'bucket_name'."}), 400
+    question = data.get('question')
+    search_mode = data.get('search_mode')
+    where = data.get('where')
 
-    context = "\n".join(relevant_chunks)
+    if not question:
+        return jsonify({"error": "'question' is required."}), 400
+    if search_mode is not None and search_mode not in SEARCH_MODES:
+        return jsonify({"error": f"'search_mode' must be one of {list(SEARCH_MODES)}."}), 400
+    if where is not None and not isinstance(where, dict):
+        return jsonify({"error": "'where' must be an object."}), 400
 
-    if not context:
-        print(f"No relevant context found for the given input and question '{question}' in DB {current_db_directory_used}.")
-        # Optionally, you could still send the question to the LLM without context
-        # or return a specific message.
-        # For now, we'll inform the user if no context was found.
-        return jsonify({"response": f"Could not find relevant information in the specified document or database ('{current_db_directory_used}') to answer your question."})
+    db_name, error = await resolve_chat_db(data, f"question: '{question}'")
+    if error:
+        return error
 
-    # 4. Get chatbot response from Groq
-    chatbot_response = get_chatbot_response(question, context)
+    # 3. Search the vector DB, assemble a deduplicated, diverse context within the token budget
+    # and ask Groq. Searching, MMR (which may encode) and the Groq call all block, so they run
+    # off the event loop
+    hits = (await asyncio.to_thread(_search_chat_hits, [question], db_name, where, search_mode))[0]
+    chatbot_response = await asyncio.to_thread(_answer_question, question, hits, db_name)
 
     # Optionally return the DB name used if a new one was created
     response_data = {"response": chatbot_response}
-    if document_id and bucket_name and current_db_directory_used:
-        response_data["vector_db_name_used"] = current_db_directory_used
+    response_data.update(_chat_response_metadata(data, db_name))
+    if isinstance(db_name, list):
+        response_data["sources"] = _hit_sources(hits)
 
     return jsonify(response_data)
 
+@app.route('/chat/batch', methods=['POST'])
+async def chat_batch():
+    """
+    Answers a set of questions against one document or vector DB.
+    Accepts the same fields as /chat, with a 'questions' list instead of 'question'.
+    All questions are retrieved with a single batched vector search.
+    """
+    data = request.get_json()
+
+    questions = data.get('questions')
+    search_mode = data.get('search_mode')
+    where = data.get('where')
+
+    if not questions or not isinstance(questions, list) or not all(isinstance(q, str) and q for q in questions):
+        return jsonify({"error": "'questions' must be a non-empty list of strings."}), 400
+    if search_mode is not None and search_mode not in SEARCH_MODES:
+        return jsonify({"error": f"'search_mode' must be one of {list(SEARCH_MODES)}."}), 400
+    if where is not None and not isinstance(where, dict):
+        return jsonify({"error": "'where' must be an object."}), 400
+
+    db_name, error = await resolve_chat_db(data, f"{len(questions)} questions")
+    if error:
+        return error
+
+    hits_per_question = await asyncio.to_thread(_search_chat_hits, questions, db_name, where, search_mode)
+
+    responses = []
+    for question, hits in zip(questions, hits_per_question):
+        answer = await asyncio.to_thread(_answer_question, question, hits, db_name)
+        response = {"question": question, "response": answer}
+        if isinstance(db_name, list):
+            response["sources"] = _hit_sources(hits)
+        responses.append(response)
+
+    response_data = {"responses": responses}
+    response_data.update(_chat_response_metadata(data, db_name))
+    return jsonify(response_data)
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """
+    Readiness probe. Reports 503 until the embedding model has been warmed up,
+    unless warm-up is disabled for this worker.
+    """
+    status = embedding_model_status()
+    is_ready = EMBEDDING_WARMUP == "off" or status["warmed_up"]
+    return jsonify({"ready": is_ready, "embedding_model": status}), 200 if is_ready else 503
+
+@app.route('/warmup', methods=['POST'])
+def warmup():
+    """
+    Loads the embedding model and runs a dummy encode, returning load timings and peak RSS.
+    """
+    try:
+        return jsonify(warm_up_embedding_model())
+    except Exception as e:
+        print(f"Error warming up embedding model: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats_endpoint():
+    """
+    Reports sizes and hit ratios of the query-embedding, search-result and embedding caches.
+    """
+    return jsonify(cache_stats())
+
+@app.route('/reaper_stats', methods=['GET'])
+def reaper_stats_endpoint():
+    """
+    Reports vector database reaper evictions, freed bytes and current disk usage.
+    """
+    return jsonify(vector_db_reaper.stats())
+
+def start_embedding_warmup():
+    """Warms up the embedding model according to EMBEDDING_WARMUP."""
+    if EMBEDDING_WARMUP == "blocking":
+        warm_up_embedding_model()
+    elif EMBEDDING_WARMUP == "background":
+        threading.Thread(target=warm_up_embedding_model, name="embedding-warmup", daemon=True).start()
+
 @app.route('/delete_db', methods=['POST'])
 def delete_db_endpoint():
     """
@@ -425,7 +535,10 @@ if __name__ == '__main__':
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
 
-        # Configure Hypercorn
+        # Configure Hypercorn. The Flask app is served in WSGI mode: each request runs on a
+        # worker thread, so requests are handled concurrently and async views get their own
+        # event loop there. (asgiref's WsgiToAsgi runs every request on one thread-sensitive
+        # thread and the async views on the server's loop, serializing all requests.)
         hypercorn_config = Config()
         hypercorn_config.bind = [f"0.0.0.0:{os.environ.get('FLASK_PORT', '8080')}"]
 
@@ -447,14 +560,22 @@ if __name__ == '__main__':
             else:
                 print("Warning: NGROK_AUTH_TOKEN not set. Running without ngrok tunnel.")
 
+            # Preload the embedding model before /ready reports ready
+            start_embedding_warmup()
+            # Keep per-document DBs within the disk budget / idle TTL
+            vector_db_reaper.start()
+
             # Start the server using Hypercorn
-            await hypercorn_serve(asgi_app, hypercorn_config)
+            await hypercorn_serve(app, hypercorn_config, mode="wsgi")
 
         except Exception as e:
             print(f"Error starting server: {str(e)}")
             cleanup_ngrok()
             sys.exit(1)
         finally:
+            vector_db_reaper.stop(timeout=5)
+            stop_embedding_batcher(timeout=5)
+            stop_extraction_pool()
             # Clean up databases on exit
             print("Checking for databases to delete on exit...")
             cleanup_dbs_on_exit()